@@ -0,0 +1,77 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from .models import User
+
+# Only what authentication, role checks and the basic profile payload need.
+AUTH_USER_FIELDS = (
+    'id', 'username', 'email', 'role', 'first_name', 'last_name',
+    'is_active', 'is_staff', 'is_superuser', 'profile_picture',
+)
+
+# A save invalidates the entry only in the process that ran it when the cache is
+# process-local, so other processes keep serving a deactivated or demoted user
+# until the entry expires. Such caches keep entries at most this many seconds.
+PROCESS_LOCAL_CACHE_BACKENDS = ('django.core.cache.backends.locmem.LocMemCache',)
+PROCESS_LOCAL_CACHE_TIMEOUT = 5
+
+
+def user_cache_key(user_id):
+    return f"auth:user:{user_id}"
+
+
+def user_cache_alias():
+    return getattr(settings, 'AUTH_USER_CACHE_ALIAS', 'default')
+
+
+def user_cache_timeout():
+    """AUTH_USER_CACHE_TIMEOUT, capped at PROCESS_LOCAL_CACHE_TIMEOUT unless the cache is shared."""
+    timeout = getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 60)
+    if settings.CACHES[user_cache_alias()]['BACKEND'] in PROCESS_LOCAL_CACHE_BACKENDS:
+        timeout = min(timeout, PROCESS_LOCAL_CACHE_TIMEOUT)
+    return timeout
+
+
+def get_cached_user(user_id):
+    """
+    Return a User with AUTH_USER_FIELDS loaded, served from the AUTH_USER_CACHE_ALIAS
+    cache for user_cache_timeout() seconds. Other fields are deferred and load on
+    access. Returns None if the user does not exist.
+    """
+    field_names = [f.attname for f in User._meta.concrete_fields if f.attname in AUTH_USER_FIELDS]
+    key = user_cache_key(user_id)
+    cache = caches[user_cache_alias()]
+    values = cache.get(key)
+    if values is None:
+        values = User.objects.filter(pk=user_id).values_list(*field_names).first()
+        if values is None:
+            return None
+        cache.set(key, tuple(values), user_cache_timeout())
+    return User.from_db('default', field_names, values)
+
+
+def invalidate_cached_user(user_id):
+    caches[user_cache_alias()].delete(user_cache_key(user_id))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that resolves the token's user through the short-TTL user cache."""
+
+    def get_user(self, validated_token):
+        if api_settings.CHECK_REVOKE_TOKEN:
+            # Revocation compares against the password hash, which is not cached.
+            return super().get_user(validated_token)
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        user = get_cached_user(user_id)
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user
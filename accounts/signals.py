@@ -0,0 +1,10 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .authentication import invalidate_cached_user
+from .models import User
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_cache(sender, instance, **kwargs):
+    # Covers password and role changes, which are saved through the model.
+    invalidate_cached_user(instance.pk)
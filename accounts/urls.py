@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework_simplejwt.views import TokenRefreshView
-from .views import RegisterView, UserProfileView, LogoutView, CustomTokenObtainPairView, SpecificUserProfileView
+from .views import RegisterView, UserProfileView, LogoutView, CustomTokenObtainPairView, SpecificUserProfileView, UserBatchView
 
 urlpatterns = [
     path('auth/', include([
@@ -10,5 +10,6 @@ urlpatterns = [
         path('logout/', LogoutView.as_view(), name='auth_logout'),
     ])),
     path('profile/', UserProfileView.as_view(), name='profile'),
+    path('profile/batch/', UserBatchView.as_view(), name='profile-batch'),
     path('profile/<int:user_id>/', SpecificUserProfileView.as_view(), name='specific-profile'),
 ]
@@ -0,0 +1,28 @@
+MAX_BATCH_IDS = 300
+
+
+def parse_id_list(raw, max_ids=MAX_BATCH_IDS):
+    """
+    Parse a comma-separated `?ids=` value into a list of unique ints, keeping the
+    order they were requested in. Raises ValueError with a client-facing message.
+    """
+    if not raw:
+        raise ValueError("ids parameter is required.")
+    ids = []
+    seen = set()
+    for part in raw.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            value = int(part)
+        except ValueError:
+            raise ValueError(f"Invalid id: {part}")
+        if value not in seen:
+            seen.add(value)
+            ids.append(value)
+    if not ids:
+        raise ValueError("ids parameter is required.")
+    if len(ids) > max_ids:
+        raise ValueError(f"At most {max_ids} ids can be requested at once.")
+    return ids
@@ -10,6 +10,7 @@ from .serializers import RegisterSerializer, UserSerializer, ProfileUpdateSerial
 from .models import ActivityLog
 from rest_framework.exceptions import NotFound
 from django.core.exceptions import ObjectDoesNotExist
+from .utils import parse_id_list
 import logging
 
 
@@ -24,6 +25,27 @@ class SpecificUserProfileView(generics.RetrieveAPIView):
         except User.DoesNotExist:
             raise NotFound("User not found")
 
+class UserBatchView(APIView):
+    """
+    Resolve many users in one query.
+    GET /accounts/profile/batch/?ids=1,2,3
+    Results keep the requested order; unknown IDs are listed under "missing".
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        try:
+            ids = parse_id_list(request.query_params.get('ids'))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        users = {user.id: user for user in User.objects.filter(id__in=ids)}
+        found = [users[user_id] for user_id in ids if user_id in users]
+        return Response({
+            "results": UserSerializer(found, many=True, context={'request': request}).data,
+            "missing": [user_id for user_id in ids if user_id not in users],
+        })
+
 User = get_user_model()
 logger = logging.getLogger(__name__)
 
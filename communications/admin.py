@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Message, Notification
+from .models import Message, MessageArchive, Notification, NotificationBadge
 
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
@@ -9,6 +9,15 @@ class MessageAdmin(admin.ModelAdmin):
 
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
-    list_display = ('id', 'user', 'message', 'is_read', 'created_at')
-    list_filter = ('is_read',)
+    list_display = ('id', 'user', 'kind', 'count', 'message', 'is_read', 'created_at')
+    list_filter = ('is_read', 'kind')
+    search_fields = ('user__username',)
+
+@admin.register(NotificationBadge)
+class NotificationBadgeAdmin(admin.ModelAdmin):
+    list_display = ('user', 'unread_count')
     search_fields = ('user__username',)
+
+@admin.register(MessageArchive)
+class MessageArchiveAdmin(admin.ModelAdmin):
+    list_display = ('month', 'message_count', 'conversation_count', 'path', 'archived_at')
@@ -0,0 +1,182 @@
+"""
+Cold storage for old message partitions.
+
+archive_partition() streams one monthly partition into a file under
+MESSAGE_ARCHIVE_ROOT, records it as a MessageArchive and drops the partition.
+Each file holds one zlib-compressed msgpack block per conversation, followed by
+an index of {conversation_id: [offset, length]} and the index's offset as an
+8-byte trailer, so reading one conversation's history decompresses only its
+own block.
+"""
+import os
+import struct
+import zlib
+from datetime import datetime, timezone as dt_timezone
+from functools import lru_cache
+import msgpack
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from .models import Message, MessageArchive
+from .partitions import drop_partition, month_start
+
+ARCHIVE_MAGIC = b'MSGARC1\n'
+TRAILER = struct.Struct('>Q')
+ROW_COLUMNS = ('id', 'seq', 'sender_id', 'receiver_id', 'content', 'created_at', 'is_read')
+STREAM_CHUNK_SIZE = 5000
+
+User = get_user_model()
+
+
+def archive_path(month):
+    return os.path.join(settings.MESSAGE_ARCHIVE_ROOT, f"messages_{month:%Y%m}.msgpack.zz")
+
+
+def _micros(value):
+    return int(value.timestamp() * 1_000_000)
+
+
+def _from_micros(value):
+    return datetime.fromtimestamp(value / 1_000_000, tz=dt_timezone.utc)
+
+
+def archive_partition(name, month):
+    """Write partition `name` (holding `month`) to disk, then drop it. Returns the MessageArchive."""
+    path = archive_path(month)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    index = {}
+    message_count = 0
+
+    with open(tmp_path, 'wb') as f:
+        f.write(ARCHIVE_MAGIC)
+
+        def write_block(conversation_id, rows):
+            block = zlib.compress(msgpack.packb(rows, use_bin_type=True), 9)
+            index[conversation_id] = [f.tell(), len(block)]
+            f.write(block)
+
+        current, rows = None, []
+        with connection.chunked_cursor() as cursor:
+            cursor.execute(
+                f"SELECT conversation_id, {', '.join(ROW_COLUMNS)} FROM {connection.ops.quote_name(name)} "
+                f"ORDER BY conversation_id, created_at, id"
+            )
+            while batch := cursor.fetchmany(STREAM_CHUNK_SIZE):
+                for conversation_id, message_id, seq, sender_id, receiver_id, content, created_at, is_read in batch:
+                    if conversation_id != current and rows:
+                        write_block(current, rows)
+                        rows = []
+                    current = conversation_id
+                    rows.append([message_id, seq, sender_id, receiver_id, content, _micros(created_at), is_read])
+                    message_count += 1
+        if rows:
+            write_block(current, rows)
+
+        index_offset = f.tell()
+        f.write(msgpack.packb(index, use_bin_type=True))
+        f.write(TRAILER.pack(index_offset))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+    with transaction.atomic():
+        archive, _ = MessageArchive.objects.update_or_create(month=month.date(), defaults={
+            'path': path,
+            'message_count': message_count,
+            'conversation_count': len(index),
+        })
+        drop_partition(name)
+    return archive
+
+
+@lru_cache(maxsize=32)
+def _load_index(path, mtime_ns):
+    with open(path, 'rb') as f:
+        f.seek(-TRAILER.size, os.SEEK_END)
+        end = f.tell()
+        (index_offset,) = TRAILER.unpack(f.read(TRAILER.size))
+        f.seek(index_offset)
+        return msgpack.unpackb(f.read(end - index_offset), strict_map_key=False)
+
+
+def read_conversation(path, conversation_id):
+    """Return the archived messages of one conversation in `path` as unsaved Message instances, oldest first."""
+    try:
+        index = _load_index(path, os.stat(path).st_mtime_ns)
+    except FileNotFoundError:
+        return []
+    entry = index.get(conversation_id)
+    if entry is None:
+        return []
+    offset, length = entry
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        rows = msgpack.unpackb(zlib.decompress(f.read(length)), raw=False)
+    return [
+        Message(
+            id=message_id, conversation_id=conversation_id, seq=seq, sender_id=sender_id,
+            receiver_id=receiver_id, content=content, created_at=_from_micros(created_at), is_read=is_read,
+        )
+        for message_id, seq, sender_id, receiver_id, content, created_at, is_read in rows
+    ]
+
+
+def archived_history(conversation_id, before_key=None, limit=50):
+    """
+    Return (messages, has_more) for the `limit` archived messages preceding
+    `before_key` = (created_at, id), oldest first, like MessageManager.history.
+    """
+    collected = []
+    for archive in MessageArchive.objects.all():  # newest month first
+        if before_key is not None and month_start(before_key[0]).date() < archive.month:
+            continue
+        older = [
+            message for message in read_conversation(archive.path, conversation_id)
+            if before_key is None or (message.created_at, message.id) < before_key
+        ]
+        collected = older + collected
+        if len(collected) > limit:
+            break
+    page = collected[-limit:] if limit else []
+    # One query for the (at most two) senders instead of one per serialized message.
+    senders = User.objects.in_bulk({message.sender_id for message in page})
+    for message in page:
+        if message.sender_id in senders:
+            message.sender = senders[message.sender_id]
+    return page, len(collected) > limit
+
+
+def find_archived(conversation_id, message_id):
+    for archive in MessageArchive.objects.all():
+        for message in read_conversation(archive.path, conversation_id):
+            if message.id == message_id:
+                return message
+    return None
+
+
+def history_with_archive(conversation_id, before=None, after=None, limit=50):
+    """
+    MessageManager.history that continues into archived months when scrolling
+    back past the oldest live message, and accepts archived messages as the
+    `before` cursor. `after` cursors must refer to live messages.
+    """
+    try:
+        messages, has_more = Message.objects.history(conversation_id, before=before, after=after, limit=limit)
+    except Message.DoesNotExist:
+        anchor = find_archived(conversation_id, before) if before is not None else None
+        if anchor is None:
+            raise
+        return archived_history(conversation_id, (anchor.created_at, anchor.id), limit)
+
+    if after is not None or has_more:
+        return messages, has_more
+    if messages:
+        before_key = (messages[0].created_at, messages[0].id)
+    elif before is not None:
+        before_key = Message.objects.filter(conversation_id=conversation_id, id=before) \
+            .values_list('created_at', 'id').get()
+    else:
+        before_key = None
+    older, has_more = archived_history(conversation_id, before_key, limit - len(messages))
+    return older + messages, has_more
@@ -0,0 +1,77 @@
+"""
+Frame encodings for the WebSocket consumers, chosen by subprotocol at connect.
+
+    (none) / chat.json      JSON text frames, the default
+    chat.msgpack            msgpack binary frames
+    chat.msgpack.deflate    msgpack, each frame raw-deflate compressed
+
+The server picks the first of the client's offered subprotocols it knows. Daphne
+does not negotiate permessage-deflate, so chat.msgpack.deflate compresses in the
+application; clients on links where bytes are expensive should offer it first.
+Inflated frames are capped at MAX_FRAME bytes so a small compressed frame cannot
+expand into an arbitrarily large one.
+"""
+import json
+import zlib
+import msgpack
+
+MAX_FRAME = 1024 * 1024  # bytes, after decompression
+
+
+class JsonCodec:
+    subprotocol = 'chat.json'
+    binary = False
+
+    def encode(self, payload):
+        return json.dumps(payload)
+
+    def decode(self, text_data=None, bytes_data=None):
+        return json.loads(text_data if text_data is not None else bytes_data)
+
+
+class MsgpackCodec:
+    subprotocol = 'chat.msgpack'
+    binary = True
+
+    def encode(self, payload):
+        return msgpack.packb(payload, use_bin_type=True)
+
+    def decode(self, text_data=None, bytes_data=None):
+        if bytes_data is None:
+            # Text frames are still accepted as JSON, e.g. from debugging tools.
+            return json.loads(text_data)
+        try:
+            return msgpack.unpackb(bytes_data, raw=False)
+        except msgpack.UnpackException as e:
+            raise ValueError(f"Invalid msgpack frame: {e}")
+
+
+class DeflateMsgpackCodec(MsgpackCodec):
+    subprotocol = 'chat.msgpack.deflate'
+
+    def encode(self, payload):
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+        return compressor.compress(super().encode(payload)) + compressor.flush()
+
+    def decode(self, text_data=None, bytes_data=None):
+        if bytes_data is not None:
+            decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            try:
+                bytes_data = decompressor.decompress(bytes_data, MAX_FRAME)
+            except zlib.error as e:
+                raise ValueError(f"Invalid deflate frame: {e}")
+            if len(bytes_data) >= MAX_FRAME or decompressor.unconsumed_tail:
+                raise ValueError(f"Deflate frames may not inflate to {MAX_FRAME} bytes or more.")
+        return super().decode(text_data, bytes_data)
+
+
+CODECS = {codec.subprotocol: codec for codec in (JsonCodec(), MsgpackCodec(), DeflateMsgpackCodec())}
+DEFAULT_CODEC = CODECS['chat.json']
+
+
+def negotiate(offered):
+    """Return (codec, subprotocol to accept or None) for the client's offered subprotocols."""
+    for subprotocol in offered or ():
+        if subprotocol in CODECS:
+            return CODECS[subprotocol], subprotocol
+    return DEFAULT_CODEC, None
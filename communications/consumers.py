@@ -1,28 +1,232 @@
-import json
+import asyncio
 import logging
 from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
 from rest_framework_simplejwt.tokens import AccessToken
+from accounts.authentication import get_cached_user
 from accounts.models import User
-from .models import Message, Conversation
+from .codecs import DEFAULT_CODEC, negotiate
+from .models import Message, Conversation, ConversationParticipant, NotificationBadge
+from .notifications import notification_group_name
+from .presence import get_presence_registry
+from .ratelimit import TokenBucket
+from .receipts import get_read_receipt_buffer
+from .writebehind import get_message_writer
 
 logger = logging.getLogger(__name__)
 
-class ChatConsumer(AsyncWebsocketConsumer):
-    async def connect(self):
-        """Authenticate user and extract receiver_id."""
+# (tokens per second, burst) per connection for ephemeral events. Frames over the
+# limit are dropped without touching the channel layer.
+TYPING_RATE_LIMIT = (1.0, 3)
+HEARTBEAT_RATE_LIMIT = (0.2, 2)
+
+# Most messages a reconnecting socket is sent on resume; larger gaps are reported so
+# the client pages through REST history instead.
+RESUME_MAX_MESSAGES = 500
+
+# Most recently active conversations a multiplexed socket joins on connect, until
+# the client subscribes explicitly.
+AUTO_JOIN_CONVERSATIONS = 200
+
+def user_group_name(user_id):
+    return f"user_{user_id}"
+
+def conversation_group_name(conversation_id):
+    return f"chat_{conversation_id}"
+
+class TokenAuthConsumer(AsyncWebsocketConsumer):
+    """
+    Resolves the connecting user from a ?token=<jwt> query parameter and encodes
+    frames with the codec negotiated from the client's subprotocols (see codecs.py).
+    """
+    codec = DEFAULT_CODEC
+
+    async def accept_negotiated(self):
+        self.codec, subprotocol = negotiate(self.scope.get("subprotocols"))
+        await self.accept(subprotocol=subprotocol)
+
+    async def send_frame(self, payload):
+        if self.codec.binary:
+            await self.send(bytes_data=self.codec.encode(payload))
+        else:
+            await self.send(text_data=self.codec.encode(payload))
+
+    def decode_frame(self, text_data=None, bytes_data=None):
+        """Decode a client frame into a dict. Raises ValueError for anything else."""
+        data = self.codec.decode(text_data, bytes_data)
+        if not isinstance(data, dict):
+            raise ValueError("Frames must be objects.")
+        return data
+
+    async def authenticate(self):
+        """Resolve self.user from the ?token= query parameter. Closes the socket and returns False on failure."""
         query_string = parse_qs(self.scope["query_string"].decode())
         token = query_string.get("token", [None])[0]
         if not token:
             logger.warning("WebSocket connection attempt without token.")
             await self.close()
-            return
+            return False
 
         self.user = await self.get_user_from_token(token)
         if not self.user:
             logger.warning("Invalid or expired token.")
             await self.close()
+            return False
+        return True
+
+    @database_sync_to_async
+    def get_user_from_token(self, token):
+        """Validate and extract user from JWT token."""
+        try:
+            access_token = AccessToken(token)
+            user = get_cached_user(access_token["user_id"])
+        except Exception as e:
+            logger.error("Token validation failed: %s", e)
+            return None
+        return user if user is not None and user.is_active else None
+
+class BaseChatConsumer(TokenAuthConsumer):
+    """Persistence, fan-out, typing and presence shared by the chat sockets."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.announced_conversations = set()
+
+    async def join_presence(self):
+        self.typing_limit = TokenBucket(*TYPING_RATE_LIMIT)
+        self.heartbeat_limit = TokenBucket(*HEARTBEAT_RATE_LIMIT)
+        await self.touch_presence()
+
+    async def touch_presence(self):
+        try:
+            await get_presence_registry().touch(self.user.id, self.channel_name)
+        except Exception as e:
+            logger.warning("Presence update failed: %s", e)
+
+    async def leave_presence(self):
+        try:
+            await get_presence_registry().remove(self.user.id, self.channel_name)
+        except Exception as e:
+            logger.warning("Presence removal failed: %s", e)
+
+    async def online_users(self, user_ids):
+        try:
+            return await get_presence_registry().online(list(user_ids))
+        except Exception as e:
+            logger.warning("Presence lookup failed: %s", e)
+            return []
+
+    async def heartbeat(self):
+        """Refresh presence. Returns False when the connection is over its heartbeat rate."""
+        if not self.heartbeat_limit.allow():
+            return False
+        await self.touch_presence()
+        return True
+
+    async def send_typing(self, conversation_id, partner_id, typing):
+        """Relay a typing indicator to the other participant without persisting anything."""
+        if not self.typing_limit.allow():
+            return
+        await self.channel_layer.group_send(conversation_group_name(conversation_id), {
+            "type": "chat_typing",
+            "conversation_id": conversation_id,
+            "user_id": self.user.id,
+            "typing": typing,
+        })
+
+    async def store_message(self, receiver_id, conversation_id, message):
+        """Save message to DB, or queue it for a batched write in write-behind mode."""
+        if getattr(settings, 'CHAT_WRITE_BEHIND', False):
+            return await get_message_writer().submit(self.user, receiver_id, conversation_id, message)
+        return await self.save_message(receiver_id, conversation_id, message)
+
+    async def broadcast_message(self, saved):
+        """
+        Deliver a stored message to its conversation group, which both kinds of chat
+        socket join. The first message this socket sends into a conversation is also
+        announced to both participants' user groups, so multiplexed sockets that have
+        not joined that conversation yet (a new one, or one past their auto-join
+        limit) join it; later messages cost a single group_send.
+        """
+        event = {
+            "type": "chat_message",
+            "conversation_id": saved.conversation_id,
+            "message_id": saved.id,
+            "seq": saved.seq,
+            "message": saved.content,
+            "sender_id": saved.sender_id,
+        }
+        await self.channel_layer.group_send(conversation_group_name(saved.conversation_id), event)
+        if saved.conversation_id not in self.announced_conversations:
+            self.announced_conversations.add(saved.conversation_id)
+            announcement = {**event, "type": "chat_announce", "receiver_id": saved.receiver_id}
+            for user_id in (saved.sender_id, saved.receiver_id):
+                await self.channel_layer.group_send(user_group_name(user_id), announcement)
+
+    @database_sync_to_async
+    def get_messages_after(self, conversation_id, after_seq):
+        """
+        Return (messages with seq > after_seq in seq order, gap). `gap` is True, and no
+        messages are returned, when more than RESUME_MAX_MESSAGES are missing.
+        """
+        messages = list(
+            Message.objects.filter(conversation_id=conversation_id, seq__gt=after_seq)
+            .order_by('seq')[:RESUME_MAX_MESSAGES + 1]
+        )
+        if len(messages) > RESUME_MAX_MESSAGES:
+            return [], True
+        return messages, False
+
+    def submit_read_receipt(self, conversation_id, partner_id, up_to):
+        """Queue a coalesced "read up to `up_to`" for this user; both participants are told after the write."""
+        get_read_receipt_buffer().submit(self.user.id, conversation_id, up_to, (conversation_group_name(conversation_id),))
+
+    @database_sync_to_async
+    def user_exists(self, user_id):
+        """Check if a user exists."""
+        return User.objects.filter(id=user_id).exists()
+
+    @database_sync_to_async
+    def get_or_create_conversation(self, sender_id, receiver_id):
+        """Retrieve an existing conversation or create a new one based on sorted user IDs."""
+        return Conversation.objects.get_or_create_for_pair(sender_id, receiver_id)
+
+    def persist_message(self, receiver_id, conversation_id, message):
+        """
+        Insert a message by IDs. The authenticated sender instance is attached so the
+        notification signal reads the sender's username without another query.
+        """
+        return Message.objects.create(
+            sender=self.user,
+            receiver_id=receiver_id,
+            conversation_id=conversation_id,
+            content=message,
+        )
+
+    @database_sync_to_async
+    def save_message(self, receiver_id, conversation_id, message):
+        """
+        Save a new message to the database. If the conversation is gone (deleted by
+        another process while its ID was cached), look the pair up again and retry
+        once; the saved message carries the conversation it ended up in.
+        """
+        try:
+            with transaction.atomic():
+                return self.persist_message(receiver_id, conversation_id, message)
+        except (IntegrityError, Conversation.DoesNotExist):
+            Conversation.objects.forget_pair(self.user.id, receiver_id)
+            conversation_id = Conversation.objects.get_or_create_for_pair(self.user.id, receiver_id)
+            return self.persist_message(receiver_id, conversation_id, message)
+
+class ChatConsumer(BaseChatConsumer):
+    """One socket per conversation: ws/chat/<receiver_id>/."""
+
+    async def connect(self):
+        """Authenticate user and extract receiver_id."""
+        if not await self.authenticate():
             return
 
         try:
@@ -38,76 +242,468 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.close()
             return
 
-        # Retrieve or create a conversation between the two users.
-        self.conversation = await self.get_or_create_conversation(self.user.id, self.receiver_id)
-        self.room_group_name = f"chat_{self.conversation.id}"
+        # Retrieve or create a conversation between the two users. The sender, receiver
+        # and conversation are kept for the life of the connection so that each
+        # incoming frame costs a single insert.
+        self.conversation_id = await self.get_or_create_conversation(self.user.id, self.receiver_id)
+        self.room_group_name = conversation_group_name(self.conversation_id)
 
         # Join the chat group.
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
-        await self.accept()
+        await self.accept_negotiated()
+        await self.join_presence()
 
     async def disconnect(self, close_code):
         """Leave the chat group on disconnect."""
         if hasattr(self, "room_group_name"):
             await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+            await self.leave_presence()
 
-    async def receive(self, text_data):
-        """Receive a message, save it, and broadcast it to the group."""
-        data = json.loads(text_data)
+    async def receive(self, text_data=None, bytes_data=None):
+        """
+        Receive a message, save it, and broadcast it to the group. {"read_up_to": id}
+        acknowledges reads; {"type": "typing" | "stop_typing" | "heartbeat"} frames are
+        relayed or answered without being stored. {"type": "resume", "after_seq": n}
+        replays the messages missed since seq n.
+        """
+        try:
+            data = self.decode_frame(text_data, bytes_data)
+        except ValueError:
+            return  # Ignore malformed frames
+        event_type = data.get("type")
+        if event_type == "resume":
+            await self.resume(data.get("after_seq"))
+            return
+        if event_type in ("typing", "stop_typing"):
+            await self.send_typing(self.conversation_id, self.receiver_id, event_type == "typing")
+            return
+        if event_type == "heartbeat":
+            if await self.heartbeat():
+                online = await self.online_users([self.receiver_id])
+                await self.send_frame({"type": "presence", "online": bool(online)})
+            return
+        if data.get("read_up_to") is not None:
+            try:
+                self.submit_read_receipt(self.conversation_id, self.receiver_id, int(data["read_up_to"]))
+            except (TypeError, ValueError):
+                pass
+            return
         message = data.get("message")
-        if not message:
-            return  # Ignore empty messages
-
-        # Save message to DB.
-        await self.save_message(self.user.id, self.receiver_id, message, self.conversation.id)
-
-        # Send the message to the group.
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                "type": "chat_message",
-                "message": message,
-                "sender_id": self.user.id
-            }
-        )
+        if not message or not isinstance(message, str):
+            return  # Ignore empty and non-text messages
+
+        saved = await self.store_message(self.receiver_id, self.conversation_id, message)
+        if saved.conversation_id != self.conversation_id:
+            await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+            self.conversation_id = saved.conversation_id
+            self.room_group_name = conversation_group_name(self.conversation_id)
+            await self.channel_layer.group_add(self.room_group_name, self.channel_name)
+        await self.broadcast_message(saved)
+
+    async def resume(self, after_seq):
+        try:
+            after_seq = int(after_seq)
+        except (TypeError, ValueError):
+            return
+        messages, gap = await self.get_messages_after(self.conversation_id, after_seq)
+        if gap:
+            await self.send_frame({"type": "resume_gap", "after_seq": after_seq})
+            return
+        for message in messages:
+            await self.send_frame({
+                "id": message.id,
+                "seq": message.seq,
+                "sender_id": message.sender_id,
+                "message": message.content,
+            })
+        await self.send_frame({
+            "type": "resumed",
+            "last_seq": messages[-1].seq if messages else after_seq,
+        })
 
     async def chat_message(self, event):
         """Send the received message to WebSocket clients."""
-        await self.send(text_data=json.dumps({
+        await self.send_frame({
+            "id": event.get("message_id"),
+            "seq": event.get("seq"),
             "sender_id": event["sender_id"],
             "message": event["message"]
-        }))
+        })
 
-    @database_sync_to_async
-    def get_user_from_token(self, token):
-        """Validate and extract user from JWT token."""
+    async def chat_message_failed(self, event):
+        """A message sent earlier could not be stored (see writebehind.py); clients should drop it."""
+        await self.send_frame({"type": "message_failed", "id": event["message_id"]})
+
+    async def chat_typing(self, event):
+        if event["user_id"] != self.user.id:
+            await self.send_frame({
+                "type": "typing",
+                "sender_id": event["user_id"],
+                "typing": event["typing"],
+            })
+
+    async def read_receipt(self, event):
+        """Tell the client the other participant has read up to a message."""
+        if event["reader_id"] != self.user.id:
+            await self.send_frame({
+                "type": "read",
+                "reader_id": event["reader_id"],
+                "up_to": event["up_to"],
+            })
+
+class UserChatConsumer(BaseChatConsumer):
+    """
+    One multiplexed socket per user: ws/chat/?token=<jwt>.
+
+    The socket carries messages for many conversations by joining their
+    conversation groups: on connect the AUTO_JOIN_CONVERSATIONS most recently
+    active ones, and any other as soon as a message in it is announced to the
+    user's group (see broadcast_message). A message sent while the socket is still
+    joining can be missed; the seq gap tells the client to resume. Client frames:
+        {"action": "subscribe", "conversation_ids": [1, 2]}    only deliver these conversations
+        {"action": "unsubscribe", "conversation_ids": [2]}
+        {"action": "send", "conversation_id": 1, "message": "hi", "ref": "c-1"}
+        {"action": "send", "receiver_id": 7, "message": "hi"}  starts a conversation if needed
+        {"action": "read", "conversation_id": 1, "up_to": 42}  read receipt, coalesced server-side
+        {"action": "typing", "conversation_id": 1}             also "stop_typing"; not stored
+        {"action": "heartbeat", "user_ids": [7, 9]}            keeps this user online, replies with
+                                                               which of user_ids (default: known
+                                                               partners) are online
+        {"action": "resume", "conversation_id": 1, "after_seq": 40}
+                                                               replays missed messages, then sends
+                                                               "resumed"; "resume_gap" means page
+                                                               through REST history instead
+    Server frames carry a "type" of message, message_failed (a message already sent
+    could not be stored), sent, read, typing, presence, resumed, resume_gap,
+    subscribed, unsubscribed or error. Typing and heartbeat frames are rate
+    limited per connection.
+    Until the first subscribe, messages for all conversations are delivered; from
+    then on the socket stays in the subscribed conversations' groups only.
+    """
+
+    async def connect(self):
+        if not await self.authenticate():
+            return
+        self.partners = {}  # conversation_id -> other participant's user ID
+        self.subscriptions = None
+        self.joined = set()
+        self.user_group_name = user_group_name(self.user.id)
+        await self.channel_layer.group_add(self.user_group_name, self.channel_name)
+        recent = await self.get_recent_partners(AUTO_JOIN_CONVERSATIONS)
+        self.partners.update(recent)
+        await self.join_conversations(recent)
+        await self.accept_negotiated()
+        await self.join_presence()
+
+    async def disconnect(self, close_code):
+        if hasattr(self, "user_group_name"):
+            await self.channel_layer.group_discard(self.user_group_name, self.channel_name)
+            await self.leave_conversations(list(self.joined))
+            await self.leave_presence()
+
+    async def join_conversations(self, conversation_ids):
+        new = [cid for cid in conversation_ids if cid not in self.joined]
+        self.joined.update(new)
+        await asyncio.gather(*(
+            self.channel_layer.group_add(conversation_group_name(cid), self.channel_name) for cid in new
+        ))
+
+    async def leave_conversations(self, conversation_ids):
+        gone = [cid for cid in conversation_ids if cid in self.joined]
+        self.joined.difference_update(gone)
+        await asyncio.gather(*(
+            self.channel_layer.group_discard(conversation_group_name(cid), self.channel_name) for cid in gone
+        ))
+
+    def follows(self, conversation_id):
+        return self.subscriptions is None or conversation_id in self.subscriptions
+
+    async def receive(self, text_data=None, bytes_data=None):
         try:
-            access_token = AccessToken(token)
-            return User.objects.get(id=access_token["user_id"])
-        except Exception as e:
-            logger.error("Token validation failed: %s", e)
-            return None
+            data = self.decode_frame(text_data, bytes_data)
+        except ValueError:
+            await self.send_error("Invalid frame.")
+            return
+        action = data.get("action")
+        if not isinstance(action, str):
+            await self.send_error("Unknown action.", data.get("ref"))
+            return
+        handler = {
+            "subscribe": self.handle_subscribe,
+            "unsubscribe": self.handle_unsubscribe,
+            "send": self.handle_send,
+            "read": self.handle_read,
+            "typing": self.handle_typing,
+            "stop_typing": self.handle_typing,
+            "heartbeat": self.handle_heartbeat,
+            "resume": self.handle_resume,
+        }.get(action)
+        if handler is None:
+            await self.send_error("Unknown action.", data.get("ref"))
+            return
+        await handler(data)
+
+    async def handle_subscribe(self, data):
+        requested = self.parse_conversation_ids(data)
+        await self.load_partners([cid for cid in requested if cid not in self.partners])
+        allowed = [cid for cid in requested if cid in self.partners]
+        if self.subscriptions is None:
+            # Leave the auto-joined conversations that were not asked for.
+            await self.leave_conversations([cid for cid in self.joined if cid not in allowed])
+        self.subscriptions = (self.subscriptions or set()) | set(allowed)
+        await self.join_conversations(allowed)
+        await self.send_frame({"type": "subscribed", "conversation_ids": allowed, "ref": data.get("ref")})
+
+    async def handle_unsubscribe(self, data):
+        removed = self.parse_conversation_ids(data)
+        if self.subscriptions is not None:
+            self.subscriptions.difference_update(removed)
+            await self.leave_conversations(removed)
+        await self.send_frame({"type": "unsubscribed", "conversation_ids": removed, "ref": data.get("ref")})
+
+    async def handle_send(self, data):
+        message = data.get("message")
+        ref = data.get("ref")
+        if not message:
+            await self.send_error("Message content is required.", ref)
+            return
+        if not isinstance(message, str):
+            await self.send_error("Message content must be a string.", ref)
+            return
+
+        try:
+            if data.get("conversation_id") is not None:
+                conversation_id = int(data["conversation_id"])
+                if conversation_id not in self.partners:
+                    await self.load_partners([conversation_id])
+                receiver_id = self.partners.get(conversation_id)
+            else:
+                receiver_id = int(data["receiver_id"])
+                if receiver_id == self.user.id or not await self.user_exists(receiver_id):
+                    receiver_id = None
+                else:
+                    conversation_id = await self.get_or_create_conversation(self.user.id, receiver_id)
+                    self.partners[conversation_id] = receiver_id
+        except (KeyError, ValueError, TypeError):
+            receiver_id = None
+        if receiver_id is None:
+            await self.send_error("Unknown conversation or receiver.", ref)
+            return
+
+        if self.follows(conversation_id):
+            # Join before broadcasting so this socket gets its own copy.
+            await self.join_conversations([conversation_id])
+        saved = await self.store_message(receiver_id, conversation_id, message)
+        if saved.conversation_id != conversation_id:
+            self.partners[saved.conversation_id] = receiver_id
+            conversation_id = saved.conversation_id
+            if self.follows(conversation_id):
+                await self.join_conversations([conversation_id])
+        await self.send_frame({
+            "type": "sent", "conversation_id": conversation_id, "id": saved.id, "seq": saved.seq, "ref": ref,
+        })
+        await self.broadcast_message(saved)
+
+    async def handle_read(self, data):
+        try:
+            conversation_id = int(data["conversation_id"])
+            up_to = int(data["up_to"])
+        except (KeyError, TypeError, ValueError):
+            await self.send_error("conversation_id and up_to are required.", data.get("ref"))
+            return
+        if conversation_id not in self.partners:
+            await self.load_partners([conversation_id])
+        if conversation_id not in self.partners:
+            await self.send_error("Unknown conversation or receiver.", data.get("ref"))
+            return
+        self.submit_read_receipt(conversation_id, self.partners[conversation_id], up_to)
+
+    async def handle_typing(self, data):
+        try:
+            conversation_id = int(data["conversation_id"])
+        except (KeyError, TypeError, ValueError):
+            return
+        if conversation_id not in self.partners:
+            await self.load_partners([conversation_id])
+        partner_id = self.partners.get(conversation_id)
+        if partner_id is not None:
+            await self.send_typing(conversation_id, partner_id, data["action"] == "typing")
+
+    async def handle_heartbeat(self, data):
+        if not await self.heartbeat():
+            await self.send_error("Heartbeat rate exceeded.", data.get("ref"))
+            return
+        try:
+            user_ids = [int(user_id) for user_id in data["user_ids"]]
+        except (KeyError, TypeError, ValueError):
+            user_ids = sorted(set(self.partners.values()))
+        online = await self.online_users(user_ids[:200])
+        await self.send_frame({"type": "presence", "online": online, "ref": data.get("ref")})
+
+    async def handle_resume(self, data):
+        ref = data.get("ref")
+        try:
+            conversation_id = int(data["conversation_id"])
+            after_seq = int(data["after_seq"])
+        except (KeyError, TypeError, ValueError):
+            await self.send_error("conversation_id and after_seq are required.", ref)
+            return
+        if conversation_id not in self.partners:
+            await self.load_partners([conversation_id])
+        if conversation_id not in self.partners:
+            await self.send_error("Unknown conversation or receiver.", ref)
+            return
+        messages, gap = await self.get_messages_after(conversation_id, after_seq)
+        if gap:
+            await self.send_frame({
+                "type": "resume_gap", "conversation_id": conversation_id, "after_seq": after_seq, "ref": ref,
+            })
+            return
+        for message in messages:
+            await self.send_frame({
+                "type": "message",
+                "conversation_id": conversation_id,
+                "id": message.id,
+                "seq": message.seq,
+                "sender_id": message.sender_id,
+                "message": message.content,
+                "replay": True,
+            })
+        await self.send_frame({
+            "type": "resumed",
+            "conversation_id": conversation_id,
+            "last_seq": messages[-1].seq if messages else after_seq,
+            "ref": ref,
+        })
+
+    async def chat_typing(self, event):
+        if event["user_id"] == self.user.id:
+            return
+        if self.subscriptions is not None and event["conversation_id"] not in self.subscriptions:
+            return
+        await self.send_frame({
+            "type": "typing",
+            "conversation_id": event["conversation_id"],
+            "user_id": event["user_id"],
+            "typing": event["typing"],
+        })
+
+    async def read_receipt(self, event):
+        if self.subscriptions is not None and event["conversation_id"] not in self.subscriptions:
+            return
+        await self.send_frame({
+            "type": "read",
+            "conversation_id": event["conversation_id"],
+            "reader_id": event["reader_id"],
+            "up_to": event["up_to"],
+        })
+
+    async def chat_announce(self, event):
+        """A message announced to the user's group; the conversation group has it too once joined."""
+        conversation_id = event["conversation_id"]
+        if conversation_id in self.joined or not self.follows(conversation_id):
+            return
+        self.partners[conversation_id] = (
+            event["receiver_id"] if event["sender_id"] == self.user.id else event["sender_id"]
+        )
+        await self.join_conversations([conversation_id])
+        await self.chat_message(event)
+
+    async def chat_message(self, event):
+        if self.subscriptions is not None and event["conversation_id"] not in self.subscriptions:
+            return
+        await self.send_frame({
+            "type": "message",
+            "conversation_id": event["conversation_id"],
+            "id": event.get("message_id"),
+            "seq": event.get("seq"),
+            "sender_id": event["sender_id"],
+            "message": event["message"],
+        })
+
+    async def chat_message_failed(self, event):
+        if self.subscriptions is not None and event["conversation_id"] not in self.subscriptions:
+            return
+        await self.send_frame({
+            "type": "message_failed",
+            "conversation_id": event["conversation_id"],
+            "id": event["message_id"],
+        })
+
+    async def send_error(self, error, ref=None):
+        await self.send_frame({"type": "error", "error": error, "ref": ref})
+
+    @staticmethod
+    def parse_conversation_ids(data):
+        try:
+            return [int(cid) for cid in data.get("conversation_ids", [])]
+        except (TypeError, ValueError):
+            return []
+
+    async def load_partners(self, conversation_ids):
+        if conversation_ids:
+            self.partners.update(await self.get_conversation_partners(conversation_ids))
 
     @database_sync_to_async
-    def user_exists(self, user_id):
-        """Check if a user exists."""
-        return User.objects.filter(id=user_id).exists()
+    def get_recent_partners(self, limit):
+        """Map the user's `limit` most recently active conversations to the other participant."""
+        rows = ConversationParticipant.objects.filter(user_id=self.user.id).order_by('-last_activity') \
+            .values_list('conversation_id', 'conversation__participant_one_id', 'conversation__participant_two_id')
+        return {
+            conversation_id: two if one == self.user.id else one
+            for conversation_id, one, two in rows[:limit]
+        }
 
     @database_sync_to_async
-    def get_or_create_conversation(self, sender_id, receiver_id):
-        """Retrieve an existing conversation or create a new one based on sorted user IDs."""
-        sender = User.objects.get(id=sender_id)
-        receiver = User.objects.get(id=receiver_id)
-        participant_one, participant_two = sorted([sender, receiver], key=lambda u: u.id)
-        conversation, created = Conversation.objects.get_or_create(
-            participant_one=participant_one, participant_two=participant_two
+    def get_conversation_partners(self, conversation_ids):
+        """Map each of the user's conversations among `conversation_ids` to the other participant."""
+        rows = Conversation.objects.filter(id__in=conversation_ids).values_list(
+            'id', 'participant_one_id', 'participant_two_id'
         )
-        return conversation
+        partners = {}
+        for conversation_id, one, two in rows:
+            if self.user.id == one:
+                partners[conversation_id] = two
+            elif self.user.id == two:
+                partners[conversation_id] = one
+        return partners
+
+class NotificationConsumer(TokenAuthConsumer):
+    """
+    Per-user notification stream: ws/notifications/?token=<jwt>.
+
+    Sends {"type": "badge", "unread_count": n} on connect and whenever the count
+    changes, and {"type": "notification", ...} with the new count for each new or
+    updated notification; a frame whose id is already shown replaces that row.
+    Clients do not send frames.
+    """
+
+    async def connect(self):
+        if not await self.authenticate():
+            return
+        self.group_name = notification_group_name(self.user.id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept_negotiated()
+        await self.send_frame({"type": "badge", "unread_count": await self.get_unread_count()})
+
+    async def disconnect(self, close_code):
+        if hasattr(self, "group_name"):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def notification_message(self, event):
+        await self.send_frame({
+            "type": "notification",
+            "id": event["id"],
+            "kind": event["kind"],
+            "count": event["count"],
+            "message": event["message"],
+            "created_at": event["created_at"],
+            "unread_count": event["unread_count"],
+        })
+
+    async def notification_badge(self, event):
+        await self.send_frame({"type": "badge", "unread_count": event["unread_count"]})
 
     @database_sync_to_async
-    def save_message(self, sender_id, receiver_id, message, conversation_id):
-        """Save a new message to the database."""
-        sender = User.objects.get(id=sender_id)
-        receiver = User.objects.get(id=receiver_id)
-        conversation = Conversation.objects.get(id=conversation_id)
-        Message.objects.create(sender=sender, receiver=receiver, content=message, conversation=conversation)
+    def get_unread_count(self):
+        return NotificationBadge.objects.unread_for(self.user.id)
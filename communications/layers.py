@@ -0,0 +1,398 @@
+"""
+Channel layers that spread groups over several hosts.
+
+ShardedRedisChannelLayer is channels_redis' RedisChannelLayer with its host
+choice replaced by a consistent hash ring: a group lives on the hosts its name
+hashes to, and a socket's channel on the host its process prefix hashes to.
+group_send reads the members from the group's hosts and pushes to each member's
+host, so groups and sockets need not share one. Adding a host moves about 1/N
+of the keys instead of nearly all of them.
+
+Failover: when an operation fails with a connection error, every host still
+believed up is pinged, the ones that do not answer are taken out of the ring for
+`retry_after` seconds, and the operation is retried on the next host along the
+ring. After that a host is tried again; if it still fails it is taken out again.
+Health is tracked per process, so processes can disagree about a host for up to
+`retry_after` seconds, and events sent while they do are lost, as with any
+channel layer outage. A group_send retried after a failure may deliver twice to
+members on healthy hosts.
+
+Group memberships are kept on the first `membership_copies` (default 2) hosts
+up along the group's ring walk, and group_send reads the union of those hosts.
+A membership added while the group's first host is down lands on the next two,
+so it is still read once the first host is back; one host can go down and come
+back without a group losing members. group_discard removes the channel from the
+group's current hosts and from wherever this process added it during an outage;
+copies left on a host that was down at the time expire after `group_expiry`.
+
+ShardedInMemoryChannelLayer is an in-process stand-in with the same routing and
+failover over InMemoryChannelLayer shards. Each shard serves one operation at a
+time with an optional `service_time`, like a single-threaded Redis, and shards
+can be taken down with `set_available()`; `manage.py bench_channel_layer_shards`
+uses it to measure how throughput scales with the shard count.
+
+    CHANNEL_LAYERS = {"default": {
+        "BACKEND": "communications.layers.ShardedRedisChannelLayer",
+        "CONFIG": {"hosts": [("10.0.0.1", 6379), ("10.0.0.2", 6379)], "retry_after": 5.0},
+    }}
+"""
+import asyncio
+import hashlib
+import logging
+import time
+from bisect import bisect
+from collections import defaultdict
+from itertools import islice
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer, InMemoryChannelLayer
+from channels_redis.core import RedisChannelLayer
+from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+
+logger = logging.getLogger(__name__)
+
+
+def _ring_hash(value):
+    return int.from_bytes(hashlib.md5(value.encode('utf8'), usedforsecurity=False).digest()[:8], 'big')
+
+
+class HashRing:
+    """Consistent hash ring over node names; lookups return the node's index in `nodes`."""
+
+    def __init__(self, nodes, replicas=100):
+        points = sorted(
+            (_ring_hash(f"{node}#{replica}"), index)
+            for index, node in enumerate(nodes)
+            for replica in range(replicas)
+        )
+        self.size = len(nodes)
+        self._hashes = [point for point, _ in points]
+        self._nodes = [index for _, index in points]
+
+    def lookup(self, key):
+        if self.size == 1:
+            return 0
+        return self._nodes[bisect(self._hashes, _ring_hash(key)) % len(self._nodes)]
+
+    def preference(self, key):
+        """Yield each node index once, starting at `key`'s node and walking the ring."""
+        start = bisect(self._hashes, _ring_hash(key))
+        seen = set()
+        for offset in range(len(self._nodes)):
+            index = self._nodes[(start + offset) % len(self._nodes)]
+            if index not in seen:
+                seen.add(index)
+                yield index
+                if len(seen) == self.size:
+                    return
+
+
+class ShardRouting:
+    """Ring routing with health-aware failover, shared by the sharded layers."""
+
+    connection_errors = (ConnectionError, TimeoutError)
+
+    def _init_routing(self, nodes, replicas=100, retry_after=5.0, probe_timeout=1.0, membership_copies=2):
+        self.ring = HashRing(nodes, replicas)
+        self.retry_after = retry_after
+        self.probe_timeout = probe_timeout
+        self.membership_copies = max(1, min(membership_copies, len(nodes)))
+        self._down_until = {}  # shard index -> monotonic time it is tried again
+        self._placed = {}  # (group, channel) -> shards, for memberships added while a shard was down
+
+    def route(self, key):
+        """Index of the shard for `key`: its ring node, or the next one up if that is down."""
+        if self._down_until:
+            now = time.monotonic()
+            for index in self.ring.preference(key):
+                if self._down_until.get(index, 0) <= now:
+                    return index
+        # All shards down, or none: use the primary and let the operation fail.
+        return self.ring.lookup(key)
+
+    def shard_is_up(self, index):
+        return self._down_until.get(index, 0) <= time.monotonic()
+
+    def group_shards(self, group):
+        """Shards holding `group`'s memberships: the first `membership_copies` up along its ring walk."""
+        shards = list(islice(filter(self.shard_is_up, self.ring.preference(group)), self.membership_copies))
+        return shards or [self.ring.lookup(group)]
+
+    def _record_membership(self, group, channel, shards):
+        """Remember where a membership added during an outage went, so group_discard reaches it later."""
+        if self._down_until:
+            self._placed[group, channel] = set(shards)
+
+    def group_discard_shards(self, group, channel):
+        """Shards up that may hold `channel`'s membership in `group`."""
+        placed = self._placed.get((group, channel), ())
+        return sorted(set(self.group_shards(group)) | set(filter(self.shard_is_up, placed)))
+
+    async def _probe(self, index):
+        raise NotImplementedError
+
+    async def _check(self, index):
+        try:
+            return await asyncio.wait_for(self._probe(index), self.probe_timeout)
+        except (asyncio.TimeoutError, *self.connection_errors):
+            return False
+
+    async def _fail_over(self):
+        """
+        Probe the shards believed up after a connection error and take out the
+        ones that fail. Returns True if a shard was taken out and one remains,
+        i.e. retrying may now succeed.
+        """
+        now = time.monotonic()
+        self._down_until = {index: until for index, until in self._down_until.items() if until > now}
+        candidates = [index for index in range(self.ring.size) if index not in self._down_until]
+        results = await asyncio.gather(*(self._check(index) for index in candidates))
+        failed = [index for index, ok in zip(candidates, results) if not ok]
+        for index in failed:
+            self._down_until[index] = now + self.retry_after
+            logger.warning("Channel layer shard %s is down; failing over for %ss.", index, self.retry_after)
+        return bool(failed) and len(failed) < len(candidates)
+
+    async def _with_failover(self, operation, *args):
+        while True:
+            try:
+                return await operation(*args)
+            except self.connection_errors:
+                if not await self._fail_over():
+                    raise
+
+
+class _Rerouted(Exception):
+    """A receive is waiting on a host its channel no longer routes to."""
+
+
+# channels_redis' group_send script: push to each channel under its capacity.
+_GROUP_SEND_LUA = """
+    local over_capacity = 0
+    local current_time = ARGV[#ARGV - 1]
+    local expiry = ARGV[#ARGV]
+    for i=1,#KEYS do
+        if redis.call('ZCOUNT', KEYS[i], '-inf', '+inf') < tonumber(ARGV[i + #KEYS]) then
+            redis.call('ZADD', KEYS[i], current_time, ARGV[i])
+            redis.call('EXPIRE', KEYS[i], expiry)
+        else
+            over_capacity = over_capacity + 1
+        end
+    end
+    return over_capacity
+"""
+
+
+def _node_name(host):
+    if 'address' in host:
+        return str(host['address'])
+    if 'host' in host:
+        return f"{host['host']}:{host.get('port', 6379)}"
+    return repr(sorted(host.items()))
+
+
+class ShardedRedisChannelLayer(ShardRouting, RedisChannelLayer):
+    connection_errors = (RedisConnectionError, RedisTimeoutError, OSError)
+
+    def __init__(self, hosts=None, replicas=100, retry_after=5.0, probe_timeout=1.0, membership_copies=2, **kwargs):
+        super().__init__(hosts=hosts, **kwargs)
+        self._init_routing(
+            [_node_name(host) for host in self.hosts], replicas, retry_after, probe_timeout, membership_copies
+        )
+
+    def consistent_hash(self, value):
+        # Route specific channels by their non-local part, which is what the
+        # receiving process listens on, whichever form the caller passes.
+        if "!" in value:
+            value = self.non_local_name(value)
+        return self.route(value)
+
+    async def _probe(self, index):
+        await self.connection(index).ping()
+        return True
+
+    async def send(self, channel, message):
+        await self._with_failover(super().send, channel, message)
+
+    async def _group_add(self, group, channel):
+        assert self.valid_group_name(group), "Group name not valid"
+        assert self.valid_channel_name(channel), "Channel name not valid"
+        key = self._group_key(group)
+        shards = self.group_shards(group)
+        for index in shards:
+            connection = self.connection(index)
+            await connection.zadd(key, {channel: time.time()})
+            await connection.expire(key, self.group_expiry)
+        self._record_membership(group, channel, shards)
+
+    async def group_add(self, group, channel):
+        await self._with_failover(self._group_add, group, channel)
+
+    async def _group_discard(self, group, channel):
+        assert self.valid_group_name(group), "Group name not valid"
+        assert self.valid_channel_name(channel), "Channel name not valid"
+        key = self._group_key(group)
+        for index in self.group_discard_shards(group, channel):
+            await self.connection(index).zrem(key, channel)
+        self._placed.pop((group, channel), None)
+
+    async def group_discard(self, group, channel):
+        await self._with_failover(self._group_discard, group, channel)
+
+    async def _group_send(self, group, message):
+        assert self.valid_group_name(group), "Group name not valid"
+        key = self._group_key(group)
+        channel_names = set()
+        for index in self.group_shards(group):
+            connection = self.connection(index)
+            await connection.zremrangebyscore(key, min=0, max=int(time.time()) - self.group_expiry)
+            channel_names.update(name.decode("utf8") for name in await connection.zrange(key, 0, -1))
+
+        connection_to_channel_keys, channel_keys_to_message, channel_keys_to_capacity = (
+            self._map_channel_keys_to_connection(sorted(channel_names), message)
+        )
+        # Same per-host delivery as channels_redis' group_send.
+        for index, channel_keys in connection_to_channel_keys.items():
+            connection = self.connection(index)
+            pipe = connection.pipeline()
+            for channel_key in channel_keys:
+                pipe.zremrangebyscore(channel_key, min=0, max=int(time.time()) - int(self.expiry))
+            await pipe.execute()
+            args = [channel_keys_to_message[channel_key] for channel_key in channel_keys]
+            args += [channel_keys_to_capacity[channel_key] for channel_key in channel_keys]
+            args += [time.time(), self.expiry]
+            over_capacity = await connection.eval(_GROUP_SEND_LUA, len(channel_keys), *channel_keys, *args)
+            if over_capacity > 0:
+                logger.info("%s of %s channels over capacity in group %s", over_capacity, len(channel_names), group)
+
+    async def group_send(self, group, message):
+        await self._with_failover(self._group_send, group, message)
+
+    async def receive_single(self, channel):
+        while True:
+            try:
+                return await super().receive_single(channel)
+            except _Rerouted:
+                continue
+            except self.connection_errors:
+                if not await self._fail_over():
+                    raise
+
+    async def _brpop_with_clean(self, index, channel, timeout):
+        # Called once per brpop_timeout while a receive waits, so a receiver that
+        # failed over moves back when its host returns.
+        if "!" in channel and index != self.consistent_hash(channel[len(self.prefix):]):
+            raise _Rerouted()
+        return await super()._brpop_with_clean(index, channel, timeout)
+
+
+class ShardedInMemoryChannelLayer(ShardRouting, BaseChannelLayer):
+    extensions = ["groups", "flush"]
+
+    receive_timeout = 1.0
+
+    def __init__(self, shards=2, service_time=0.0, replicas=100, retry_after=5.0, probe_timeout=1.0,
+                 membership_copies=2, expiry=60, group_expiry=86400, capacity=100, channel_capacity=None,
+                 **kwargs):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity, **kwargs)
+        self.shards = [
+            InMemoryChannelLayer(expiry=expiry, group_expiry=group_expiry, capacity=capacity,
+                                 channel_capacity=channel_capacity)
+            for _ in range(shards)
+        ]
+        self.service_time = service_time
+        self._available = [True] * shards
+        self._locks = {}
+        self._init_routing(
+            [f"shard{index}" for index in range(shards)], replicas, retry_after, probe_timeout, membership_copies
+        )
+
+    def set_available(self, index, available):
+        """Take a shard down or bring it back, as if its host failed or recovered."""
+        self._available[index] = available
+
+    async def _serve(self, index):
+        """Account for one operation on shard `index`; raises ConnectionError if it is down."""
+        if not self._available[index]:
+            raise ConnectionError(f"Channel layer shard {index} is down.")
+        if self.service_time:
+            lock = self._locks.get(index)
+            if lock is None:
+                lock = self._locks[index] = asyncio.Lock()
+            async with lock:
+                await asyncio.sleep(self.service_time)
+        return self.shards[index]
+
+    async def _probe(self, index):
+        return self._available[index]
+
+    async def _send(self, channel, message):
+        shard = await self._serve(self.route(channel))
+        await shard.send(channel, message)
+
+    async def send(self, channel, message):
+        await self._with_failover(self._send, channel, message)
+
+    async def receive(self, channel):
+        while True:
+            try:
+                shard = await self._serve(self.route(channel))
+            except self.connection_errors:
+                if not await self._fail_over():
+                    raise
+                continue
+            # Wait in slices so a receiver that failed over moves back when its shard returns.
+            try:
+                return await asyncio.wait_for(shard.receive(channel), self.receive_timeout)
+            except asyncio.TimeoutError:
+                continue
+
+    async def new_channel(self, prefix="specific"):
+        return await self.shards[0].new_channel(prefix)
+
+    async def _group_add(self, group, channel):
+        shards = self.group_shards(group)
+        for index in shards:
+            shard = await self._serve(index)
+            await shard.group_add(group, channel)
+        self._record_membership(group, channel, shards)
+
+    async def group_add(self, group, channel):
+        await self._with_failover(self._group_add, group, channel)
+
+    async def _group_discard(self, group, channel):
+        for index in self.group_discard_shards(group, channel):
+            shard = await self._serve(index)
+            await shard.group_discard(group, channel)
+        self._placed.pop((group, channel), None)
+
+    async def group_discard(self, group, channel):
+        await self._with_failover(self._group_discard, group, channel)
+
+    async def _group_send(self, group, message):
+        assert self.valid_group_name(group), "Invalid group name"
+        channels = set()
+        for index in self.group_shards(group):
+            shard = await self._serve(index)
+            shard._clean_expired()
+            channels.update(shard.groups.get(group, {}))
+        by_shard = defaultdict(list)
+        for channel in sorted(channels):
+            by_shard[self.route(channel)].append(channel)
+        # One operation per shard holding members, like the per-host script in channels_redis.
+        for index, channels in by_shard.items():
+            target = await self._serve(index)
+            for channel in channels:
+                try:
+                    await target.send(channel, message)
+                except ChannelFull:
+                    pass
+
+    async def group_send(self, group, message):
+        await self._with_failover(self._group_send, group, message)
+
+    async def flush(self):
+        for shard in self.shards:
+            await shard.flush()
+
+    async def close(self):
+        pass
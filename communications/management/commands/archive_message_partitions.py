@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from communications.archive import archive_partition
+from communications.partitions import add_months, list_partitions, month_start
+
+
+class Command(BaseCommand):
+    help = "Move monthly message partitions older than --keep-months to compressed files and drop them."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-months', type=int, default=12,
+                            help="Number of recent months, including the current one, to keep in the database.")
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        if options['keep_months'] < 1:
+            raise CommandError("--keep-months must be at least 1.")
+        cutoff = add_months(month_start(timezone.now()), 1 - options['keep_months'])
+        for name, month in list_partitions():
+            if month >= cutoff:
+                continue
+            if options['dry_run']:
+                self.stdout.write(f"would archive {name}")
+                continue
+            archive = archive_partition(name, month)
+            self.stdout.write(
+                f"archived {name}: {archive.message_count} messages in "
+                f"{archive.conversation_count} conversations -> {archive.path}"
+            )
@@ -0,0 +1,94 @@
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from communications.layers import ShardedInMemoryChannelLayer
+from communications.management.commands.bench_chat import current_commit
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark group_send throughput of the sharded channel layer against in-process stand-in shards, "
+        "for each shard count in --shards. Each stand-in serves one operation at a time taking "
+        "--service-time seconds, like a single-threaded Redis."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shards', default='1,2,4,8', help="Comma-separated shard counts to run.")
+        parser.add_argument('--groups', type=int, default=500)
+        parser.add_argument('--members', type=int, default=2, help="Channels per group, e.g. both chat participants.")
+        parser.add_argument('--messages', type=int, default=5000, help="group_send calls per run.")
+        parser.add_argument('--concurrency', type=int, default=200, help="Concurrent senders.")
+        parser.add_argument('--service-time', type=float, default=0.0002,
+                            help="Seconds each stand-in shard spends per operation.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="Write the JSON report here instead of stdout.")
+
+    def handle(self, *args, **options):
+        self.options = options
+        runs = [asyncio.run(self.run(int(count))) for count in options['shards'].split(',')]
+        baseline = runs[0]["group_sends_per_second"]
+        for run in runs:
+            run["speedup"] = round(run["group_sends_per_second"] / baseline, 2) if baseline else None
+
+        report = {
+            "commit": current_commit(),
+            "timestamp": timezone.now().isoformat(),
+            "parameters": {
+                key: options[key]
+                for key in ('groups', 'members', 'messages', 'concurrency', 'service_time', 'seed')
+            },
+            "runs": runs,
+        }
+        payload = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(payload + "\n")
+            self.stderr.write(f"Report written to {options['output']}")
+        else:
+            self.stdout.write(payload)
+
+    async def run(self, shards):
+        options = self.options
+        layer = ShardedInMemoryChannelLayer(
+            shards=shards, service_time=options['service_time'], capacity=options['messages'],
+        )
+        groups = [f"chat_{i}" for i in range(options['groups'])]
+        members = {group: [await layer.new_channel() for _ in range(options['members'])] for group in groups}
+        for group, channels in members.items():
+            for channel in channels:
+                await layer.group_add(group, channel)
+
+        rng = random.Random(options['seed'])
+        targets = [rng.choice(groups) for _ in range(options['messages'])]
+        expected = Counter(targets)
+
+        async def drain(channel, count):
+            for _ in range(count):
+                await layer.receive(channel)
+
+        async def send(batch):
+            for group in batch:
+                await layer.group_send(group, {"type": "chat.message", "text": "bench"})
+
+        concurrency = options['concurrency']
+        started = time.perf_counter()
+        receivers = [
+            asyncio.ensure_future(drain(channel, expected[group]))
+            for group, channels in members.items() for channel in channels if expected[group]
+        ]
+        await asyncio.gather(*(send(targets[i::concurrency]) for i in range(concurrency)))
+        await asyncio.gather(*receivers)
+        elapsed = time.perf_counter() - started
+
+        groups_per_shard = Counter(layer.route(group) for group in groups)
+        return {
+            "shards": shards,
+            "seconds": round(elapsed, 3),
+            "group_sends_per_second": round(len(targets) / elapsed, 1),
+            "deliveries_per_second": round(len(targets) * options['members'] / elapsed, 1),
+            "groups_per_shard": [groups_per_shard[index] for index in range(shards)],
+        }
@@ -0,0 +1,194 @@
+import asyncio
+import json
+import subprocess
+import time
+import tracemalloc
+from statistics import mean, quantiles
+from asgiref.sync import async_to_sync
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+from communications.notifications import get_notification_queue
+from communications.routing import websocket_urlpatterns
+from communications.writebehind import get_message_writer
+
+User = get_user_model()
+
+IN_MEMORY_LAYER = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer", "CONFIG": {"capacity": 10000}}}
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def percentiles(samples):
+    """p50/p95/p99 and mean of `samples` (seconds), in milliseconds."""
+    if len(samples) < 2:
+        return {"count": len(samples)}
+    cuts = quantiles(samples, n=100)
+    return {
+        "count": len(samples),
+        "mean_ms": round(mean(samples) * 1000, 3),
+        "p50_ms": round(cuts[49] * 1000, 3),
+        "p95_ms": round(cuts[94] * 1000, 3),
+        "p99_ms": round(cuts[98] * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3),
+    }
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the multiplexed chat socket with WebsocketCommunicator and the in-memory channel layer: "
+        "connect latency, message round-trip percentiles, DB queries per message and memory per connection. "
+        "Benchmark users, and everything that cascades from them, are deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--conversations', type=int, default=1000)
+        parser.add_argument('--messages', type=int, default=5, help="Messages sent per conversation.")
+        parser.add_argument('--concurrency', type=int, default=200,
+                            help="Connections opened, or conversations exchanging, at the same time.")
+        parser.add_argument('--memory-sample', type=int, default=100,
+                            help="Extra sockets opened under tracemalloc to estimate memory per connection.")
+        parser.add_argument('--write-behind', action='store_true', help="Run with CHAT_WRITE_BEHIND enabled.")
+        parser.add_argument('--timeout', type=float, default=10.0)
+        parser.add_argument('--output', help="Write the JSON report here instead of stdout.")
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.application = URLRouter(websocket_urlpatterns)
+        self.queries = QueryCounter()
+        # Consumers' database calls are thread-sensitive and run on this thread's
+        # connection, so one wrapper sees all of them. The run cannot be wrapped in a
+        # rolled-back transaction: database_sync_to_async closes old connections
+        # around each call.
+        prefix = f"bench{int(time.time())}"
+        with override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYER, CHAT_WRITE_BEHIND=options['write_behind']), \
+                connection.execute_wrapper(self.queries):
+            try:
+                pairs = self.create_users(options['conversations'], prefix)
+                sample_users = self.create_users((options['memory_sample'] + 1) // 2, f"{prefix}_mem")
+                report = async_to_sync(self.run)(pairs, [user for pair in sample_users for user in pair])
+            finally:
+                get_notification_queue().drain()
+                User.objects.filter(username__startswith=f"{prefix}_").delete()
+
+        report = {
+            "commit": current_commit(),
+            "timestamp": timezone.now().isoformat(),
+            "parameters": {
+                key: options[key]
+                for key in ('conversations', 'messages', 'concurrency', 'memory_sample', 'write_behind')
+            },
+            **report,
+        }
+        payload = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(payload + "\n")
+            self.stderr.write(f"Report written to {options['output']}")
+        else:
+            self.stdout.write(payload)
+
+    def create_users(self, pairs, prefix):
+        users = User.objects.bulk_create([
+            User(username=f"{prefix}_{i}", email=f"{prefix}_{i}@example.com", password='!')
+            for i in range(pairs * 2)
+        ])
+        tokens = [(user, str(AccessToken.for_user(user))) for user in users]
+        return [(tokens[i], tokens[i + 1]) for i in range(0, len(tokens), 2)]
+
+    async def connect(self, token):
+        communicator = WebsocketCommunicator(self.application, f"/ws/chat/?token={token}")
+        started = time.perf_counter()
+        connected, _ = await communicator.connect(timeout=self.options['timeout'])
+        elapsed = time.perf_counter() - started
+        if not connected:
+            raise RuntimeError("Chat socket refused the connection.")
+        return communicator, elapsed
+
+    async def in_batches(self, coroutines):
+        results = []
+        batch_size = self.options['concurrency']
+        for start in range(0, len(coroutines), batch_size):
+            results.extend(await asyncio.gather(*coroutines[start:start + batch_size]))
+        return results
+
+    async def exchange(self, sender, receiver, target, text):
+        """
+        Send one message to `target` ({"receiver_id": ...} or {"conversation_id": ...}) and
+        return (seconds until the receiver's socket delivers it, conversation ID).
+        """
+        timeout = self.options['timeout']
+        started = time.perf_counter()
+        await sender.send_json_to({"action": "send", "message": text, **target})
+        while (await receiver.receive_json_from(timeout=timeout))["type"] != "message":
+            pass
+        elapsed = time.perf_counter() - started
+        # The sender gets the "sent" acknowledgement, then its own copy of the message.
+        ack = await sender.receive_json_from(timeout=timeout)
+        await sender.receive_json_from(timeout=timeout)
+        return elapsed, ack["conversation_id"]
+
+    async def run(self, pairs, sample_users):
+        tokens = [token for pair in pairs for _, token in pair]
+        connected = await self.in_batches([self.connect(token) for token in tokens])
+        sockets = [communicator for communicator, _ in connected]
+        connect_times = [elapsed for _, elapsed in connected]
+
+        queries_before = self.queries.count
+        round_trips = []
+        # The first message starts each conversation by receiver ID; later ones address it
+        # by conversation ID, as a client that has its inbox loaded would.
+        targets = [{"receiver_id": receiver.id} for _, (receiver, _) in pairs]
+        started = time.perf_counter()
+        for round_number in range(self.options['messages']):
+            results = await self.in_batches([
+                self.exchange(sockets[2 * i], sockets[2 * i + 1], target, f"bench {round_number}")
+                for i, target in enumerate(targets)
+            ])
+            round_trips.extend(elapsed for elapsed, _ in results)
+            targets = [{"conversation_id": conversation_id} for _, conversation_id in results]
+        if self.options['write_behind']:
+            await get_message_writer().flush()
+        send_seconds = time.perf_counter() - started
+        message_count = len(round_trips)
+        queries = self.queries.count - queries_before
+
+        tracemalloc.start()
+        baseline, _ = tracemalloc.get_traced_memory()
+        sampled = await self.in_batches([self.connect(token) for _, token in sample_users])
+        in_use, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        await self.in_batches([communicator.disconnect() for communicator in sockets])
+        await self.in_batches([communicator.disconnect() for communicator, _ in sampled])
+
+        return {
+            "connections": len(sockets),
+            "connect_latency": percentiles(connect_times),
+            "round_trip_latency": percentiles(round_trips),
+            "messages": message_count,
+            "messages_per_second": round(message_count / send_seconds, 1) if send_seconds else None,
+            "db_queries_per_message": round(queries / message_count, 3) if message_count else None,
+            "memory_per_connection_bytes": round((in_use - baseline) / len(sampled)) if sampled else None,
+        }
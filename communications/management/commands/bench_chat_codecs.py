@@ -0,0 +1,69 @@
+import random
+import string
+import time
+from django.core.management.base import BaseCommand
+from communications.codecs import CODECS
+
+
+def sample_frames(count, seed=0):
+    """Server frames in a typical mix: mostly chat messages of varied length, plus receipts and typing."""
+    rng = random.Random(seed)
+    words = [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9))) for _ in range(500)]
+    frames = []
+    for i in range(count):
+        kind = rng.random()
+        if kind < 0.7:
+            frames.append({
+                "type": "message",
+                "conversation_id": rng.randint(1, 10**6),
+                "id": 10**7 + i,
+                "seq": rng.randint(1, 10**4),
+                "sender_id": rng.randint(1, 10**5),
+                "message": ' '.join(rng.choices(words, k=rng.choice((3, 8, 20, 60)))),
+            })
+        elif kind < 0.85:
+            frames.append({
+                "type": "read",
+                "conversation_id": rng.randint(1, 10**6),
+                "reader_id": rng.randint(1, 10**5),
+                "up_to": 10**7 + i,
+            })
+        else:
+            frames.append({
+                "type": "typing",
+                "conversation_id": rng.randint(1, 10**6),
+                "user_id": rng.randint(1, 10**5),
+                "typing": rng.random() < 0.5,
+            })
+    return frames
+
+
+class Command(BaseCommand):
+    help = "Compare frame size and encode/decode cost of the chat socket codecs over a sample of frames."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--frames', type=int, default=20000)
+
+    def handle(self, *args, **options):
+        frames = sample_frames(options['frames'])
+        self.stdout.write(f"{'subprotocol':<22} {'avg bytes':>10} {'encode us':>10} {'decode us':>10}")
+        for subprotocol, codec in CODECS.items():
+            started = time.perf_counter()
+            encoded = [codec.encode(frame) for frame in frames]
+            encode_seconds = time.perf_counter() - started
+
+            started = time.perf_counter()
+            if codec.binary:
+                for payload in encoded:
+                    codec.decode(bytes_data=payload)
+            else:
+                for payload in encoded:
+                    codec.decode(text_data=payload)
+            decode_seconds = time.perf_counter() - started
+
+            size = sum(len(payload.encode() if isinstance(payload, str) else payload) for payload in encoded)
+            count = len(frames)
+            self.stdout.write(
+                f"{subprotocol:<22} {size / count:>10.1f} "
+                f"{encode_seconds / count * 1e6:>10.2f} {decode_seconds / count * 1e6:>10.2f}"
+            )
@@ -0,0 +1,56 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from communications.consumers import ChatConsumer
+from communications.models import Message, Conversation
+
+User = get_user_model()
+
+
+class Rollback(Exception):
+    pass
+
+
+def legacy_save_message(sender_id, receiver_id, message, conversation_id):
+    """The per-frame persistence path ChatConsumer used before connection-scoped caching."""
+    sender = User.objects.get(id=sender_id)
+    receiver = User.objects.get(id=receiver_id)
+    conversation = Conversation.objects.get(id=conversation_id)
+    Message.objects.create(sender=sender, receiver=receiver, content=message, conversation=conversation)
+
+
+class Command(BaseCommand):
+    help = "Report database queries per chat message for the legacy and current ChatConsumer save paths."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=100)
+
+    def handle(self, *args, **options):
+        count = options['messages']
+        try:
+            with transaction.atomic():
+                self.run(count)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, count):
+        sender = User.objects.create_user('bench_sender', 'bench_sender@example.com', 'bench-password')
+        receiver = User.objects.create_user('bench_receiver', 'bench_receiver@example.com', 'bench-password')
+        participant_one, participant_two = sorted([sender, receiver], key=lambda u: u.id)
+        conversation = Conversation.objects.create(participant_one=participant_one, participant_two=participant_two)
+
+        with CaptureQueriesContext(connection) as legacy:
+            for i in range(count):
+                legacy_save_message(sender.id, receiver.id, f"legacy {i}", conversation.id)
+
+        consumer = ChatConsumer()
+        consumer.user = User.objects.get(id=sender.id)
+        with CaptureQueriesContext(connection) as current:
+            for i in range(count):
+                consumer.persist_message(receiver.id, conversation.id, f"current {i}")
+
+        self.stdout.write(f"messages: {count}")
+        self.stdout.write(f"legacy:   {len(legacy) / count:.2f} queries/message")
+        self.stdout.write(f"current:  {len(current) / count:.2f} queries/message")
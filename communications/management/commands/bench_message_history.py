@@ -0,0 +1,76 @@
+import time
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from communications.models import Message, Conversation
+
+User = get_user_model()
+
+
+class Rollback(Exception):
+    pass
+
+
+def legacy_page(conversation_id, page, page_size):
+    """The OFFSET pagination conversation_messages used before cursor history."""
+    messages = Message.objects.filter(conversation_id=conversation_id).order_by("created_at")
+    messages.count()
+    offset = (page - 1) * page_size
+    return list(messages[offset:offset + page_size])
+
+
+class Command(BaseCommand):
+    help = "Compare per-page latency of OFFSET and cursor message history across a large conversation."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=1_000_000)
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--samples', type=int, default=5, help="Timed runs per depth.")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options['messages'], options['page_size'], options['samples'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, count, page_size, samples):
+        sender = User.objects.create_user('bench_sender', 'bench_sender@example.com', 'bench-password')
+        receiver = User.objects.create_user('bench_receiver', 'bench_receiver@example.com', 'bench-password')
+        conversation_id = Conversation.objects.get_or_create_for_pair(sender.id, receiver.id)
+
+        started = time.perf_counter()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {Message._meta.db_table}
+                    (conversation_id, seq, sender_id, receiver_id, content, created_at, is_read)
+                SELECT %s, n, %s, %s, 'bench message ' || n, now() - (%s - n) * interval '1 second', false
+                FROM generate_series(1, %s) AS n
+                """,
+                [conversation_id, sender.id, receiver.id, count, count],
+            )
+            cursor.execute(f"ANALYZE {Message._meta.db_table}")
+        self.stdout.write(f"seeded {count} messages in {time.perf_counter() - started:.1f}s")
+
+        ids = Message.objects.filter(conversation_id=conversation_id).order_by('created_at', 'id') \
+            .values_list('id', flat=True)
+        total_pages = max(count // page_size, 1)
+        self.stdout.write(f"{'depth':>8} {'offset ms':>10} {'cursor ms':>10}")
+        for fraction in (0.0, 0.25, 0.5, 0.75, 0.99):
+            page = max(total_pages - int(total_pages * fraction), 1)
+            anchor = ids[min(page * page_size, count - 1)] if fraction else None
+            legacy = self.time(samples, legacy_page, conversation_id, page, page_size)
+            cursor = self.time(samples, Message.objects.history, conversation_id, before=anchor, limit=page_size)
+            self.stdout.write(f"{fraction:>8.0%} {legacy:>10.2f} {cursor:>10.2f}")
+
+    @staticmethod
+    def time(samples, func, *args, **kwargs):
+        best = None
+        for _ in range(samples):
+            started = time.perf_counter()
+            func(*args, **kwargs)
+            elapsed = (time.perf_counter() - started) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        return best
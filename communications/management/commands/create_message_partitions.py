@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from communications.partitions import ensure_partitions
+
+
+class Command(BaseCommand):
+    help = "Create monthly message partitions ahead of time. Run at least monthly."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=3)
+
+    def handle(self, *args, **options):
+        created = ensure_partitions(options['months_ahead'])
+        for name in created:
+            self.stdout.write(f"created {name}")
+        self.stdout.write(self.style.SUCCESS(f"{len(created)} partitions created."))
@@ -0,0 +1,24 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from communications.models import Notification
+
+
+class Command(BaseCommand):
+    help = "Delete read notifications older than --days, in batches so no single delete holds locks for long."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        # Walks the partial index on created_at of read rows.
+        expired = Notification.objects.filter(is_read=True, created_at__lt=cutoff).order_by('created_at')
+        deleted = 0
+        while True:
+            ids = list(expired.values_list('id', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            deleted += Notification.objects.filter(id__in=ids).delete()[0]
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} read notifications older than {options['days']} days."))
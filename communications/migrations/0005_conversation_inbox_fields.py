@@ -0,0 +1,79 @@
+# Generated by Django 5.1.7 on 2026-10-19 16:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Case, Count, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce, Concat, Length, Substr
+from django.db.models.lookups import GreaterThan
+
+SNIPPET_LENGTH = 100
+
+
+def backfill_inbox_fields(apps, schema_editor):
+    Conversation = apps.get_model('communications', 'Conversation')
+    Message = apps.get_model('communications', 'Message')
+    latest = Message.objects.filter(conversation=OuterRef('pk')).order_by('-created_at', '-id')
+    # Same as models.message_snippet: the first SNIPPET_LENGTH characters, "..." if cut.
+    snippet = Case(
+        When(
+            GreaterThan(Length('content'), SNIPPET_LENGTH),
+            then=Concat(Substr('content', 1, SNIPPET_LENGTH), Value('...')),
+        ),
+        default='content',
+        output_field=models.TextField(),
+    )
+    Conversation.objects.update(
+        last_message_id=Subquery(latest.values('id')[:1]),
+        last_message_at=Subquery(latest.values('created_at')[:1]),
+        last_message_snippet=Coalesce(
+            Subquery(latest.annotate(snippet=snippet).values('snippet')[:1]), Value('')
+        ),
+    )
+
+    unread = Message.objects.filter(is_read=False, conversation__isnull=False) \
+        .values('conversation', 'receiver').annotate(total=Count('id')).order_by()
+    for row in unread:
+        conversation = Conversation.objects.get(pk=row['conversation'])
+        if row['receiver'] == conversation.participant_one_id:
+            conversation.participant_one_unread = row['total']
+        elif row['receiver'] == conversation.participant_two_id:
+            conversation.participant_two_unread = row['total']
+        conversation.save(update_fields=['participant_one_unread', 'participant_two_unread'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('communications', '0004_conversation_created_at_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='communications.message'),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_snippet',
+            field=models.CharField(blank=True, default='', max_length=103),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='participant_one_unread',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='participant_two_unread',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_inbox_fields, migrations.RunPython.noop),
+    ]
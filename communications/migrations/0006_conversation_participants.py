@@ -0,0 +1,76 @@
+# Generated by Django 5.1.7 on 2026-10-19 16:28
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_participants(apps, schema_editor):
+    Conversation = apps.get_model('communications', 'Conversation')
+    ConversationParticipant = apps.get_model('communications', 'ConversationParticipant')
+    Message = apps.get_model('communications', 'Message')
+
+    # Messages without a conversation would vanish from participant-based listings.
+    orphans = Message.objects.filter(conversation__isnull=True).values_list('id', 'sender_id', 'receiver_id')
+    for message_id, sender_id, receiver_id in orphans.iterator():
+        participant_one_id, participant_two_id = sorted([sender_id, receiver_id])
+        conversation, _ = Conversation.objects.get_or_create(
+            participant_one_id=participant_one_id, participant_two_id=participant_two_id
+        )
+        Message.objects.filter(pk=message_id).update(conversation=conversation)
+
+    batch = []
+    conversations = Conversation.objects.values_list(
+        'id', 'participant_one_id', 'participant_two_id', 'last_message_at', 'created_at'
+    )
+    for conversation_id, one, two, last_message_at, created_at in conversations.iterator():
+        for user_id in {one, two}:
+            batch.append(ConversationParticipant(
+                conversation_id=conversation_id, user_id=user_id, last_activity=last_message_at or created_at
+            ))
+        if len(batch) >= 2000:
+            ConversationParticipant.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    ConversationParticipant.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('communications', '0005_conversation_inbox_fields'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversationParticipant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_activity', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'created_at'], name='message_conversation_idx'),
+        ),
+        migrations.AddField(
+            model_name='conversationparticipant',
+            name='conversation',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='participants', to='communications.conversation'),
+        ),
+        migrations.AddField(
+            model_name='conversationparticipant',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='conversation_memberships', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='conversationparticipant',
+            index=models.Index(fields=['user', '-last_activity'], name='participant_activity_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='conversationparticipant',
+            constraint=models.UniqueConstraint(fields=('conversation', 'user'), name='unique_conversation_participant'),
+        ),
+        migrations.RunPython(backfill_participants, migrations.RunPython.noop),
+    ]
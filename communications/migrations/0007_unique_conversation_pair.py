@@ -0,0 +1,78 @@
+# Generated by Django 5.1.7 on 2026-10-19 16:29
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, Max, Min, Sum
+
+
+def merge_duplicate_pairs(apps, schema_editor):
+    Conversation = apps.get_model('communications', 'Conversation')
+    ConversationParticipant = apps.get_model('communications', 'ConversationParticipant')
+    Message = apps.get_model('communications', 'Message')
+
+    # Rows created before pairs were canonicalised everywhere may be stored in
+    # (larger, smaller) order. Postgres evaluates SET against the old row, so the
+    # columns and their unread counters swap in place.
+    Conversation.objects.filter(participant_one__gt=F('participant_two')).update(
+        participant_one=F('participant_two'),
+        participant_two=F('participant_one'),
+        participant_one_unread=F('participant_two_unread'),
+        participant_two_unread=F('participant_one_unread'),
+    )
+
+    duplicates = (
+        Conversation.objects.values('participant_one', 'participant_two')
+        .annotate(copies=Count('id'), keep_id=Min('id'))
+        .filter(copies__gt=1)
+    )
+    for pair in duplicates.iterator():
+        group = Conversation.objects.filter(
+            participant_one=pair['participant_one'], participant_two=pair['participant_two']
+        )
+        totals = group.aggregate(
+            one_unread=Sum('participant_one_unread'), two_unread=Sum('participant_two_unread')
+        )
+        extra_ids = list(group.exclude(id=pair['keep_id']).values_list('id', flat=True))
+
+        Message.objects.filter(conversation_id__in=extra_ids).update(conversation_id=pair['keep_id'])
+        for user_id, last_activity in (
+            ConversationParticipant.objects.filter(conversation__in=group)
+            .values_list('user_id').annotate(latest=Max('last_activity'))
+        ):
+            ConversationParticipant.objects.filter(
+                conversation_id=pair['keep_id'], user_id=user_id
+            ).update(last_activity=last_activity)
+        Conversation.objects.filter(id__in=extra_ids).delete()
+
+        last = Message.objects.filter(conversation_id=pair['keep_id']).order_by('-created_at', '-id').first()
+        Conversation.objects.filter(id=pair['keep_id']).update(
+            participant_one_unread=totals['one_unread'],
+            participant_two_unread=totals['two_unread'],
+            last_message=last,
+            last_message_snippet=(last.content[:100] + ('...' if len(last.content) > 100 else '')) if last else '',
+            last_message_at=last.created_at if last else None,
+        )
+
+    # Fire the deferred foreign-key checks now so the ALTER TABLE below does not
+    # run against a table with pending trigger events.
+    schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('communications', '0006_conversation_participants'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_pairs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='conversation',
+            constraint=models.UniqueConstraint(fields=('participant_one', 'participant_two'), name='unique_conversation_pair'),
+        ),
+        migrations.AddConstraint(
+            model_name='conversation',
+            constraint=models.CheckConstraint(condition=models.Q(('participant_one__lte', models.F('participant_two'))), name='conversation_pair_ordered'),
+        ),
+    ]
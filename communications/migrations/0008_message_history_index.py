@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-19 16:31
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('communications', '0007_unique_conversation_pair'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'created_at', 'id'], name='message_history_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='message',
+            name='message_conversation_idx',
+        ),
+    ]
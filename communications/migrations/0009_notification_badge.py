@@ -0,0 +1,35 @@
+# Generated by Django 5.1.7 on 2026-10-19 16:33
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_badges(apps, schema_editor):
+    Notification = apps.get_model('communications', 'Notification')
+    NotificationBadge = apps.get_model('communications', 'NotificationBadge')
+    unread = Notification.objects.filter(is_read=False).values('user_id').annotate(n=Count('id'))
+    NotificationBadge.objects.bulk_create(
+        [NotificationBadge(user_id=row['user_id'], unread_count=row['n']) for row in unread.iterator()],
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('communications', '0008_message_history_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationBadge',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='notification_badge', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(backfill_badges, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,110 @@
+# Generated by Django 5.1.7 on 2026-10-19 16:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Rebuild communications_message as a table range-partitioned by month on
+# created_at (UTC). Postgres requires the partition key in the primary key, so it
+# becomes (id, created_at). Existing rows are copied into monthly partitions from
+# the oldest message through three months ahead; a default partition catches
+# anything outside the created ranges. Secondary indexes and foreign keys are
+# recreated from the old table's definitions under the same names.
+PARTITION_MESSAGES = """
+DO $$
+DECLARE
+    partition_month date;
+    last_month date;
+    rec record;
+    statements text[] := '{}';
+    statement text;
+BEGIN
+    ALTER TABLE communications_message RENAME TO communications_message_legacy;
+
+    CREATE TABLE communications_message (
+        LIKE communications_message_legacy INCLUDING DEFAULTS INCLUDING GENERATED INCLUDING IDENTITY
+    ) PARTITION BY RANGE (created_at);
+
+    SELECT date_trunc('month', coalesce(min(created_at), now()) AT TIME ZONE 'UTC')::date
+        INTO partition_month FROM communications_message_legacy;
+    last_month := date_trunc('month', (now() AT TIME ZONE 'UTC') + interval '3 months')::date;
+    WHILE partition_month <= last_month LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF communications_message FOR VALUES FROM (%L) TO (%L)',
+            'communications_message_p' || to_char(partition_month, 'YYYYMM'),
+            partition_month::timestamp AT TIME ZONE 'UTC',
+            (partition_month + interval '1 month')::timestamp AT TIME ZONE 'UTC'
+        );
+        partition_month := (partition_month + interval '1 month')::date;
+    END LOOP;
+    CREATE TABLE communications_message_default PARTITION OF communications_message DEFAULT;
+
+    INSERT INTO communications_message (id, conversation_id, sender_id, receiver_id, content, created_at, is_read)
+        SELECT id, conversation_id, sender_id, receiver_id, content, created_at, is_read
+        FROM communications_message_legacy;
+
+    FOR rec IN
+        SELECT indexdef FROM pg_indexes
+        WHERE schemaname = current_schema() AND tablename = 'communications_message_legacy'
+            AND indexname <> 'communications_message_pkey'
+    LOOP
+        statements := statements || regexp_replace(rec.indexdef, ' ON \\S+ USING ', ' ON communications_message USING ');
+    END LOOP;
+    FOR rec IN
+        SELECT conname, pg_get_constraintdef(oid) AS definition FROM pg_constraint
+        WHERE conrelid = 'communications_message_legacy'::regclass AND contype = 'f'
+    LOOP
+        statements := statements || format(
+            'ALTER TABLE communications_message ADD CONSTRAINT %I %s', rec.conname, rec.definition
+        );
+    END LOOP;
+
+    DROP TABLE communications_message_legacy;
+    ALTER TABLE communications_message ADD CONSTRAINT communications_message_pkey PRIMARY KEY (id, created_at);
+    FOREACH statement IN ARRAY statements LOOP
+        EXECUTE statement;
+    END LOOP;
+
+    -- The new identity sequence was named around the old one; take its name back.
+    EXECUTE format(
+        'ALTER SEQUENCE %s RENAME TO communications_message_id_seq',
+        pg_get_serial_sequence('communications_message', 'id')
+    );
+    PERFORM setval(
+        pg_get_serial_sequence('communications_message', 'id'),
+        coalesce((SELECT max(id) FROM communications_message), 0) + 1,
+        false
+    );
+END
+$$;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('communications', '0010_message_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessageArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(unique=True)),
+                ('path', models.CharField(max_length=500)),
+                ('message_count', models.PositiveIntegerField()),
+                ('conversation_count', models.PositiveIntegerField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-month'],
+            },
+        ),
+        migrations.AlterField(
+            model_name='conversation',
+            name='last_message',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='communications.message'),
+        ),
+        migrations.RunSQL(PARTITION_MESSAGES),
+    ]
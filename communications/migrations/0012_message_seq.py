@@ -0,0 +1,49 @@
+# Generated by Django 5.1.7 on 2026-10-19 17:05
+
+from django.db import migrations, models
+
+
+# Number existing messages 1..n within each conversation in (created_at, id) order
+# and record the high-water mark on the conversation.
+BACKFILL_SEQ = """
+UPDATE communications_message AS m
+SET seq = numbered.seq
+FROM (
+    SELECT id, created_at, row_number() OVER (PARTITION BY conversation_id ORDER BY created_at, id) AS seq
+    FROM communications_message
+) AS numbered
+WHERE m.id = numbered.id AND m.created_at = numbered.created_at;
+
+UPDATE communications_conversation AS c
+SET last_seq = counts.last_seq
+FROM (
+    SELECT conversation_id, max(seq) AS last_seq FROM communications_message GROUP BY conversation_id
+) AS counts
+WHERE c.id = counts.conversation_id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('communications', '0011_partition_messages'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='last_seq',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='seq',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+            preserve_default=False,
+        ),
+        migrations.RunSQL(BACKFILL_SEQ, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'seq'], name='message_seq_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.1.7 on 2026-10-19 16:44
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('communications', '0012_message_seq'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='count',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='group_key',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='kind',
+            field=models.CharField(choices=[('general', 'General'), ('message', 'Message')], default='general', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'is_read', '-created_at'], name='notification_listing_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('is_read', True)), fields=['created_at'], name='notification_purge_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='notification',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_read', False)), fields=('user', 'group_key'), name='unique_unread_notification_group'),
+        ),
+    ]
@@ -1,5 +1,12 @@
-from django.db import models
-from django.db.models.signals import post_save
+import threading
+from collections import Counter, OrderedDict
+from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.db import connection, models, transaction
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from accounts.models import User
 from django.utils.timezone import now
@@ -7,6 +14,143 @@ from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
+SNIPPET_LENGTH = 100
+SEARCH_CONFIG = 'english'
+
+def message_snippet(content, length=SNIPPET_LENGTH):
+    return content[:length] + ("..." if len(content) > length else "")
+
+class ConversationPairCache:
+    """
+    Process-local LRU of (participant_one_id, participant_two_id) -> conversation ID.
+    Entries are only added once the row is known to be committed, but a conversation
+    deleted by another process stays cached here; writers that hit a missing
+    conversation call ConversationManager.forget_pair and look it up again.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, pair):
+        with self._lock:
+            conversation_id = self._entries.get(pair)
+            if conversation_id is not None:
+                self._entries.move_to_end(pair)
+            return conversation_id
+
+    def put(self, pair, conversation_id):
+        with self._lock:
+            self._entries[pair] = conversation_id
+            self._entries.move_to_end(pair)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, pair):
+        with self._lock:
+            self._entries.pop(pair, None)
+
+conversation_pair_cache = ConversationPairCache(getattr(settings, 'CONVERSATION_PAIR_CACHE_SIZE', 10000))
+
+class ConversationManager(models.Manager):
+    def get_or_create_for_pair(self, user_a_id, user_b_id):
+        """
+        Return the ID of the conversation between two users, creating it if needed.
+        Served from the process-local pair cache when possible; otherwise one SELECT,
+        and on a miss an INSERT ... ON CONFLICT DO NOTHING against the unique pair
+        constraint, so concurrent first messages converge on a single row. The ID is
+        cached when the surrounding transaction commits, so a rolled-back creation
+        is never cached.
+        """
+        pair = tuple(sorted((user_a_id, user_b_id)))
+        conversation_id = conversation_pair_cache.get(pair)
+        if conversation_id is not None:
+            return conversation_id
+
+        lookup = self.filter(participant_one_id=pair[0], participant_two_id=pair[1]).values_list('id', flat=True)
+        conversation_id = lookup.first()
+        if conversation_id is None:
+            conversation = self.model(participant_one_id=pair[0], participant_two_id=pair[1])
+            self.bulk_create([conversation], ignore_conflicts=True)
+            conversation.id = conversation_id = lookup.get()
+            # Idempotent, so it is safe whether this call or a concurrent one inserted the row.
+            conversation.add_participants()
+        transaction.on_commit(lambda: conversation_pair_cache.put(pair, conversation_id))
+        return conversation_id
+
+    def forget_pair(self, user_a_id, user_b_id):
+        """Drop a pair's cached conversation ID, e.g. after a write found it gone."""
+        conversation_pair_cache.discard(tuple(sorted((user_a_id, user_b_id))))
+
+    def allocate_seq(self, conversation_id, count=1):
+        """
+        Reserve `count` consecutive sequence numbers in a conversation and return the
+        first. The UPDATE row-locks the conversation until the transaction ends, so
+        numbers are handed out in commit order.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {connection.ops.quote_name(self.model._meta.db_table)} "
+                f"SET last_seq = last_seq + %s WHERE id = %s RETURNING last_seq",
+                [count, conversation_id],
+            )
+            row = cursor.fetchone()
+        if row is None:
+            raise self.model.DoesNotExist(f"Conversation {conversation_id} does not exist.")
+        return row[0] - count + 1
+
+    def record_messages(self, conversation_id, messages):
+        """
+        Fold newly inserted messages of one conversation into its inbox fields with a
+        single UPDATE: move last_message forward if they are newer and bump the
+        receivers' unread counters.
+        """
+        latest = max(messages, key=lambda m: (m.created_at, m.id))
+        unread = Counter(m.receiver_id for m in messages)
+        newer = Q(last_message_at__isnull=True) | Q(last_message_at__lte=latest.created_at)
+
+        def unread_increment(column):
+            return Case(
+                *[When(**{column: user_id}, then=Value(count)) for user_id, count in unread.items()],
+                default=Value(0),
+                output_field=models.IntegerField(),
+            )
+
+        ConversationParticipant.objects.filter(
+            conversation_id=conversation_id, last_activity__lt=latest.created_at
+        ).update(last_activity=latest.created_at)
+        return self.filter(pk=conversation_id).update(
+            last_message_id=Case(
+                When(newer, then=Value(latest.id)), default=F('last_message_id'),
+                output_field=models.BigIntegerField(),
+            ),
+            last_message_snippet=Case(
+                When(newer, then=Value(message_snippet(latest.content))), default=F('last_message_snippet'),
+                output_field=models.CharField(),
+            ),
+            last_message_at=Case(
+                When(newer, then=Value(latest.created_at)), default=F('last_message_at'),
+                output_field=models.DateTimeField(),
+            ),
+            participant_one_unread=F('participant_one_unread') + unread_increment('participant_one_id'),
+            participant_two_unread=F('participant_two_unread') + unread_increment('participant_two_id'),
+        )
+
+    def adjust_unread(self, conversation_id, user_id, delta):
+        """Shift one participant's unread counter by `delta`, never below zero."""
+        for column in ('participant_one', 'participant_two'):
+            counter = f'{column}_unread'
+            self.filter(pk=conversation_id, **{column: user_id}).update(
+                **{counter: Greatest(F(counter) + delta, 0)}
+            )
+
+    def clear_unread(self, user_id, conversation_id=None):
+        """Reset the user's unread counters, for one conversation or all of them."""
+        conversations = self.all() if conversation_id is None else self.filter(pk=conversation_id)
+        conversations.filter(participant_one=user_id).update(participant_one_unread=0)
+        conversations.filter(participant_two=user_id).update(participant_two_unread=0)
+
 class Conversation(models.Model):
     # Temporarily providing a default value of 1 to avoid migration errors.
     # Ensure a user with id=1 exists or update this default accordingly.
@@ -23,10 +167,124 @@ class Conversation(models.Model):
         default=1,
     )
     created_at = models.DateTimeField(default=now)
+    # Denormalized inbox state, kept current by ConversationManager.record_messages.
+    # No database constraint: messages are partitioned, and archived partitions are dropped.
+    last_message = models.ForeignKey(
+        'Message',
+        related_name="+",
+        on_delete=models.SET_NULL,
+        db_constraint=False,
+        null=True,
+        blank=True
+    )
+    last_message_snippet = models.CharField(max_length=SNIPPET_LENGTH + 3, blank=True, default='')
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    participant_one_unread = models.PositiveIntegerField(default=0)
+    participant_two_unread = models.PositiveIntegerField(default=0)
+    # Highest Message.seq handed out in this conversation.
+    last_seq = models.PositiveBigIntegerField(default=0)
+
+    objects = ConversationManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['participant_one', 'participant_two'], name='unique_conversation_pair'),
+            models.CheckConstraint(
+                condition=Q(participant_one__lte=F('participant_two')), name='conversation_pair_ordered'
+            ),
+        ]
 
     def __str__(self):
         return f"Conversation between {self.participant_one} and {self.participant_two}"
 
+    def add_participants(self):
+        """Create the membership rows that per-user conversation and message listings scan."""
+        ConversationParticipant.objects.bulk_create(
+            [
+                ConversationParticipant(conversation=self, user_id=user_id, last_activity=self.created_at)
+                for user_id in {self.participant_one_id, self.participant_two_id}
+            ],
+            ignore_conflicts=True,
+        )
+
+    def unread_count_for(self, user_id):
+        if user_id == self.participant_one_id:
+            return self.participant_one_unread
+        if user_id == self.participant_two_id:
+            return self.participant_two_unread
+        return 0
+
+class ConversationParticipant(models.Model):
+    """
+    One row per (conversation, user). Listing a user's conversations, or the messages
+    they can see, starts from a single range of the (user, last_activity) index
+    instead of OR-ing the two participant columns.
+    """
+    conversation = models.ForeignKey(
+        Conversation,
+        related_name="participants",
+        on_delete=models.CASCADE
+    )
+    user = models.ForeignKey(
+        User,
+        related_name="conversation_memberships",
+        on_delete=models.CASCADE,
+        db_index=False  # covered by participant_activity_idx
+    )
+    last_activity = models.DateTimeField(default=now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['conversation', 'user'], name='unique_conversation_participant'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-last_activity'], name='participant_activity_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} in conversation {self.conversation_id}"
+
+@receiver(post_save, sender=Conversation)
+def create_conversation_participants(sender, instance, created, **kwargs):
+    if created:
+        instance.add_participants()
+
+@receiver(post_delete, sender=Conversation)
+def evict_conversation_pair(sender, instance, **kwargs):
+    conversation_pair_cache.discard((instance.participant_one_id, instance.participant_two_id))
+
+class MessageManager(models.Manager):
+    def get_queryset(self):
+        # The search vector is only needed inside WHERE clauses; don't ship it with every row.
+        return super().get_queryset().defer('search_vector')
+
+    def history(self, conversation_id, before=None, after=None, limit=50):
+        """
+        Return (messages, has_more) for one page of a conversation, oldest first.
+
+        With `before` (or no cursor) the page is the `limit` messages preceding that
+        message ID, newest page by default; with `after` it is the `limit` messages
+        following it. Each page is a single range scan of the (conversation,
+        created_at, id) index, so its cost does not depend on how far back it is.
+        Raises Message.DoesNotExist if the cursor message is not in the conversation.
+        Senders are joined in, since every serialized message shows its sender.
+        """
+        messages = self.filter(conversation_id=conversation_id)
+        anchor_id = after if after is not None else before
+        if anchor_id is not None:
+            anchor_at = messages.values_list('created_at', flat=True).get(id=anchor_id)
+            if after is not None:
+                messages = messages.filter(created_at__gte=anchor_at).exclude(created_at=anchor_at, id__lte=anchor_id)
+            else:
+                messages = messages.filter(created_at__lte=anchor_at).exclude(created_at=anchor_at, id__gte=anchor_id)
+
+        messages = messages.select_related('sender')
+        if after is not None:
+            page = list(messages.order_by('created_at', 'id')[:limit + 1])
+            return page[:limit], len(page) > limit
+        page = list(messages.order_by('-created_at', '-id')[:limit + 1])
+        return page[:limit][::-1], len(page) > limit
+
 class Message(models.Model):
     conversation = models.ForeignKey(
         Conversation,
@@ -48,38 +306,196 @@ class Message(models.Model):
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
+    # Position within the conversation, 1, 2, 3, ... in commit order; lets sockets resume.
+    seq = models.PositiveBigIntegerField(editable=False)
+    # Computed by Postgres on every insert and content update, including bulk_create.
+    search_vector = models.GeneratedField(
+        expression=SearchVector('content', config=SEARCH_CONFIG),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+
+    objects = MessageManager()
+
+    class Meta:
+        # The table is range-partitioned by month on created_at, with primary key
+        # (id, created_at) in the database; see communications/partitions.py.
+        indexes = [
+            models.Index(fields=['conversation', 'created_at', 'id'], name='message_history_idx'),
+            GinIndex(fields=['search_vector'], name='message_search_idx'),
+            models.Index(fields=['conversation', 'seq'], name='message_seq_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         """Automatically associate the message with a conversation if not provided."""
-        if not self.conversation:
-            participant_one, participant_two = sorted([self.sender, self.receiver], key=lambda u: u.id)
-            conversation, created = Conversation.objects.get_or_create(
-                participant_one=participant_one, participant_two=participant_two
-            )
-            self.conversation = conversation
-        super().save(*args, **kwargs)
+        if self.conversation_id is None:
+            self.conversation_id = Conversation.objects.get_or_create_for_pair(self.sender_id, self.receiver_id)
+        adding = self._state.adding
+        with transaction.atomic():
+            if adding and self.seq is None:
+                self.seq = Conversation.objects.allocate_seq(self.conversation_id)
+            super().save(*args, **kwargs)
+            if adding:
+                Conversation.objects.record_messages(self.conversation_id, [self])
 
     def __str__(self):
         return f"Message from {self.sender.username} to {self.receiver.username}"
 
+class MessageArchive(models.Model):
+    """A monthly message partition moved to a compressed file by archive_message_partitions."""
+    month = models.DateField(unique=True)
+    path = models.CharField(max_length=500)
+    message_count = models.PositiveIntegerField()
+    conversation_count = models.PositiveIntegerField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-month']
+
+    def __str__(self):
+        return f"Messages for {self.month:%Y-%m}"
+
+class NotificationManager(models.Manager):
+    def upsert_digests(self, digests):
+        """
+        Fold (user_id, kind, group_key, message, count) digests into the users'
+        unread notifications with one INSERT ... ON CONFLICT against the partial
+        unique index on unread (user, group_key): an existing unread row has its
+        count raised and takes the latest message and time, otherwise a row is
+        created. Keys must be unique within the call. Returns
+        {(user_id, group_key): (Notification, inserted)}.
+        """
+        if not digests:
+            return {}
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        created_at = now()
+        values = ", ".join(["(%s, %s, %s, %s, %s, false, %s)"] * len(digests))
+        params = [
+            value
+            for user_id, kind, group_key, message, count in digests
+            for value in (user_id, kind, group_key, message, count, created_at)
+        ]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} AS n (user_id, kind, group_key, message, count, is_read, created_at) "
+                f"VALUES {values} "
+                f"ON CONFLICT (user_id, group_key) WHERE NOT is_read DO UPDATE SET "
+                f"count = n.count + EXCLUDED.count, message = EXCLUDED.message, created_at = EXCLUDED.created_at "
+                f"RETURNING n.id, n.user_id, n.kind, n.group_key, n.message, n.count, n.created_at, (n.xmax = 0)",
+                params,
+            )
+            rows = cursor.fetchall()
+        return {
+            (user_id, group_key): (
+                self.model(id=pk, user_id=user_id, kind=kind, group_key=group_key, message=message,
+                           count=count, is_read=False, created_at=created_at),
+                inserted,
+            )
+            for pk, user_id, kind, group_key, message, count, created_at, inserted in rows
+        }
+
 class Notification(models.Model):
+    class Kind(models.TextChoices):
+        GENERAL = 'general', 'General'
+        MESSAGE = 'message', 'Message'
+
     user = models.ForeignKey(
         User,
         related_name="notifications",
         on_delete=models.CASCADE
     )
+    kind = models.CharField(max_length=20, choices=Kind.choices, default=Kind.GENERAL)
+    # Unread notifications sharing a group key are collapsed into one row, e.g. one
+    # per conversation for chat messages. Ungrouped notifications leave it null.
+    group_key = models.CharField(max_length=100, null=True, blank=True)
+    count = models.PositiveIntegerField(default=1)
     message = models.CharField(max_length=255)
     is_read = models.BooleanField(default=False)
+    # Time of the latest event folded into this notification.
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = NotificationManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'group_key'], condition=Q(is_read=False), name='unique_unread_notification_group'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'is_read', '-created_at'], name='notification_listing_idx'),
+            models.Index(fields=['created_at'], condition=Q(is_read=True), name='notification_purge_idx'),
+        ]
+
     def __str__(self):
         return f"Notification for {self.user.username}"
 
+class NotificationBadgeManager(models.Manager):
+    def add_unread(self, counts):
+        """
+        Add {user_id: n} to the users' unread counters with one upsert and return
+        {user_id: new unread count}.
+        """
+        if not counts:
+            return {}
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        values = ", ".join(["(%s, %s)"] * len(counts))
+        params = [value for item in counts.items() for value in item]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (user_id, unread_count) VALUES {values} "
+                f"ON CONFLICT (user_id) DO UPDATE SET unread_count = {table}.unread_count + EXCLUDED.unread_count "
+                f"RETURNING user_id, unread_count",
+                params,
+            )
+            return dict(cursor.fetchall())
+
+    def adjust(self, user_id, delta):
+        if delta > 0:
+            return self.add_unread({user_id: delta})[user_id]
+        self.filter(user_id=user_id).update(unread_count=Greatest(F('unread_count') + delta, Value(0)))
+        return self.unread_for(user_id)
+
+    def reset(self, user_id):
+        self.filter(user_id=user_id).update(unread_count=0)
+
+    def unread_for(self, user_id):
+        return self.filter(user_id=user_id).values_list('unread_count', flat=True).first() or 0
+
+    def unread_for_many(self, user_ids):
+        counts = dict(self.filter(user_id__in=user_ids).values_list('user_id', 'unread_count'))
+        return {user_id: counts.get(user_id, 0) for user_id in user_ids}
+
+class NotificationBadge(models.Model):
+    """Per-user unread notification counter, kept in step with Notification inserts and reads."""
+    user = models.OneToOneField(
+        User,
+        primary_key=True,
+        related_name="notification_badge",
+        on_delete=models.CASCADE
+    )
+    unread_count = models.PositiveIntegerField(default=0)
+
+    objects = NotificationBadgeManager()
+
+    def __str__(self):
+        return f"{self.unread_count} unread for user {self.user_id}"
+
+def message_notification_group(message):
+    return f"message:{message.conversation_id}"
+
+def message_notification_text(message, sender_username):
+    """Notification text telling the receiver about `message`."""
+    snippet = message.content[:50] + ("..." if len(message.content) > 50 else "")
+    return f"New message from {sender_username}: {snippet}"
+
 @receiver(post_save, sender=Message)
 def create_notification_on_message(sender, instance, created, **kwargs):
     if created:
-        snippet = instance.content[:50] + ("..." if len(instance.content) > 50 else "")
-        Notification.objects.create(
-            user=instance.receiver,
-            message=f"New message from {instance.sender.username}: {snippet}"
+        from .notifications import notify
+        notify(
+            instance.receiver_id,
+            message_notification_text(instance, instance.sender.username),
+            kind=Notification.Kind.MESSAGE,
+            group_key=message_notification_group(instance),
         )
@@ -0,0 +1,287 @@
+"""
+Asynchronous notification fan-out.
+
+Writes that should notify someone call notify() instead of saving a Notification
+row themselves. Once the surrounding transaction commits, the event is handed to
+the configured queue (NOTIFICATION_QUEUE); queue workers pass batches of events
+to every delivery channel in NOTIFICATION_CHANNELS, in order. If a required
+channel (DatabaseChannel) fails, the channels after it are skipped and the batch
+is queued again, up to NOTIFICATION_MAX_RETRIES attempts.
+
+ThreadedQueue persists from background worker threads with bulk_create, so the
+write that caused the notification does not wait for it. LocalQueue delivers
+synchronously in the calling thread and is meant for tests and management
+commands. Events still queued when the process exits are delivered by an atexit
+drain; a hard kill loses them.
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils.module_loading import import_string
+from .models import Notification, NotificationBadge
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE = 'communications.notifications.ThreadedQueue'
+DEFAULT_CHANNELS = (
+    'communications.notifications.DatabaseChannel',
+    'communications.notifications.WebSocketChannel',
+)
+
+
+def notification_group_name(user_id):
+    return f"notifications_{user_id}"
+
+
+class NotificationEvent:
+    __slots__ = ('user_id', 'message', 'kind', 'group_key', 'notification', 'unread_count', 'attempts')
+
+    def __init__(self, user_id, message, kind=Notification.Kind.GENERAL, group_key=None):
+        self.user_id = user_id
+        self.message = message
+        self.kind = kind
+        self.group_key = group_key
+        # Set by DatabaseChannel.
+        self.notification = None
+        self.unread_count = None
+        self.attempts = 0
+
+
+class DeliveryChannel:
+    """
+    One way of delivering notifications. deliver() receives a batch of events. A
+    `required` channel's failure stops the batch and queues it again, so it must
+    not leave partial effects behind.
+    """
+
+    required = False
+
+    def deliver(self, events):
+        raise NotImplementedError
+
+
+class DatabaseChannel(DeliveryChannel):
+    """
+    Persist a batch of events and bump the recipients' badge counters in the same
+    transaction. Ungrouped events become rows with one bulk insert; events with a
+    group key are collapsed per (recipient, group key) and folded into the
+    recipient's unread notification for that key with one upsert. Only new rows
+    count towards the badge.
+    """
+
+    required = True
+
+    def deliver(self, events):
+        plain = [event for event in events if event.group_key is None]
+        grouped = [event for event in events if event.group_key is not None]
+        digests = {}
+        for event in grouped:
+            key = (event.user_id, event.group_key)
+            kind, _, count = digests.get(key, (event.kind, None, 0))
+            digests[key] = (kind, event.message, count + 1)
+
+        with transaction.atomic():
+            notifications = Notification.objects.bulk_create([
+                Notification(user_id=event.user_id, kind=event.kind, message=event.message) for event in plain
+            ])
+            upserted = Notification.objects.upsert_digests([
+                (user_id, kind, group_key, message, count)
+                for (user_id, group_key), (kind, message, count) in digests.items()
+            ])
+            new_rows = Counter(event.user_id for event in plain)
+            new_rows.update(user_id for (user_id, _), (_, inserted) in upserted.items() if inserted)
+            unread = NotificationBadge.objects.add_unread(new_rows)
+            unchanged = {event.user_id for event in events} - unread.keys()
+            if unchanged:
+                unread.update(NotificationBadge.objects.unread_for_many(unchanged))
+
+        for event, notification in zip(plain, notifications):
+            event.notification = notification
+        for event in grouped:
+            event.notification = upserted[(event.user_id, event.group_key)][0]
+        for event in events:
+            event.unread_count = unread[event.user_id]
+
+
+class WebSocketChannel(DeliveryChannel):
+    """
+    Push events to the recipient's notifications group on the channel layer. A
+    notification that several events in the batch were collapsed into is pushed
+    once, in its final state; clients replace any row with the same id. Events
+    without an unread count (not persisted by DatabaseChannel) are not pushed.
+    """
+
+    def deliver(self, events):
+        channel_layer = get_channel_layer()
+        if channel_layer is None:
+            return
+        latest = {}
+        for event in events:
+            if event.notification is not None and event.unread_count is not None:
+                latest[event.notification.id] = event
+        for event in latest.values():
+            notification = event.notification
+            async_to_sync(channel_layer.group_send)(notification_group_name(event.user_id), {
+                "type": "notification_message",
+                "id": notification.id,
+                "kind": event.kind,
+                "count": notification.count,
+                "message": notification.message,
+                "created_at": notification.created_at.isoformat(),
+                "unread_count": event.unread_count,
+            })
+
+
+def push_badge(user_id, unread_count):
+    """Send the user's current unread count to their notification sockets."""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        async_to_sync(channel_layer.group_send)(notification_group_name(user_id), {
+            "type": "notification_badge",
+            "unread_count": unread_count,
+        })
+    except Exception:
+        logger.exception("Could not push badge count to user %s.", user_id)
+
+
+def push_badge_on_commit(user_id, unread_count):
+    transaction.on_commit(lambda: push_badge(user_id, unread_count))
+
+
+def deliver(channels, events):
+    """
+    Pass a batch through each channel in order. Returns the events to try again:
+    all of them if a required channel failed (the channels after it are skipped),
+    otherwise none.
+    """
+    for channel in channels:
+        try:
+            channel.deliver(events)
+        except Exception:
+            logger.exception("Delivery of %s notifications via %s failed.", len(events), type(channel).__name__)
+            if channel.required:
+                return events
+    return []
+
+
+def retryable(events, max_retries):
+    """Count a failed attempt on each event; return those with attempts left and log the rest as dropped."""
+    retry = []
+    for event in events:
+        event.attempts += 1
+        if event.attempts < max_retries:
+            retry.append(event)
+    if len(retry) < len(events):
+        logger.error("Dropping %s notifications after %s failed attempts.", len(events) - len(retry), max_retries)
+    return retry
+
+
+class LocalQueue:
+    """Deliver immediately in the calling thread."""
+
+    def __init__(self, channels, max_retries=5, **kwargs):
+        self.channels = channels
+        self.max_retries = max_retries
+
+    def put(self, events):
+        while events:
+            events = retryable(deliver(self.channels, events), self.max_retries)
+
+    def drain(self):
+        pass
+
+
+class ThreadedQueue:
+    """In-process queue drained by daemon worker threads in batches of up to `batch_size` events."""
+
+    def __init__(self, channels, workers=2, batch_size=500, max_retries=5, retry_delay=1.0):
+        self.channels = channels
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._queue = queue.SimpleQueue()
+        self._workers = [
+            threading.Thread(target=self._work, name=f"notification-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def put(self, events):
+        for event in events:
+            self._queue.put(event)
+
+    def drain(self):
+        """Deliver everything still queued from the calling thread."""
+        while True:
+            batch = self._take(block=False)
+            if not batch:
+                return
+            self.put(retryable(deliver(self.channels, batch), self.max_retries))
+
+    def _take(self, block):
+        try:
+            batch = [self._queue.get(block=block)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _work(self):
+        while True:
+            batch = self._take(block=True)
+            close_old_connections()
+            failed = retryable(deliver(self.channels, batch), self.max_retries)
+            if failed:
+                # Back off before queueing them again, so a database outage is not retried in a tight loop.
+                time.sleep(self.retry_delay * 2 ** min(max(event.attempts for event in failed) - 1, 5))
+                self.put(failed)
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_notification_queue():
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            channels = [
+                import_string(path)() for path in getattr(settings, 'NOTIFICATION_CHANNELS', DEFAULT_CHANNELS)
+            ]
+            queue_class = import_string(getattr(settings, 'NOTIFICATION_QUEUE', DEFAULT_QUEUE))
+            _queue = queue_class(
+                channels,
+                workers=getattr(settings, 'NOTIFICATION_WORKERS', 2),
+                batch_size=getattr(settings, 'NOTIFICATION_BATCH_SIZE', 500),
+                max_retries=getattr(settings, 'NOTIFICATION_MAX_RETRIES', 5),
+            )
+            atexit.register(_queue.drain)
+        return _queue
+
+
+def notify(user_id, message, kind=Notification.Kind.GENERAL, group_key=None):
+    """
+    Queue a notification for `user_id`, dispatched once the current transaction
+    commits. Notifications with a `group_key` collapse into the user's unread one
+    with the same key.
+    """
+    notify_many([NotificationEvent(user_id, message, kind, group_key)])
+
+
+def notify_many(events):
+    if events:
+        transaction.on_commit(lambda: get_notification_queue().put(events))
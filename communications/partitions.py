@@ -0,0 +1,124 @@
+"""
+Monthly range partitions of the message table.
+
+Migration 0011 turns communications_message into a table partitioned by
+created_at with one partition per calendar month (UTC), named
+communications_message_pYYYYMM, plus a default partition that should stay
+empty. `manage.py create_message_partitions` keeps partitions created ahead of
+time, and moves any rows that reached the default partition into the monthly
+partition created for them; `manage.py archive_message_partitions` moves old ones to disk (see
+communications/archive.py).
+"""
+import re
+from datetime import datetime, timezone as dt_timezone
+from django.db import connection, transaction
+from django.utils import timezone
+from .models import Message
+
+PARTITION_NAME_RE = re.compile(r'_p(\d{4})(\d{2})$')
+
+
+def month_start(value):
+    value = value.astimezone(dt_timezone.utc)
+    return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(month):
+    return f"{Message._meta.db_table}_p{month:%Y%m}"
+
+
+def list_partitions():
+    """Return [(partition name, month start)] for the monthly partitions, oldest first."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = %s::regclass",
+            [Message._meta.db_table],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    partitions = []
+    for name in names:
+        match = PARTITION_NAME_RE.search(name)
+        if match:
+            partitions.append((name, datetime(int(match[1]), int(match[2]), 1, tzinfo=dt_timezone.utc)))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def default_partition_name():
+    return f"{Message._meta.db_table}_default"
+
+
+def default_partition_months():
+    """Return the month starts of the rows sitting in the default partition, oldest first."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT DISTINCT date_trunc('month', created_at AT TIME ZONE 'UTC') AS month "
+            f"FROM {connection.ops.quote_name(default_partition_name())} ORDER BY month"
+        )
+        return [row[0].replace(tzinfo=dt_timezone.utc) for row in cursor.fetchall()]
+
+
+def create_partition(month):
+    """
+    Create the partition for `month` if it does not exist. Returns True if it was created.
+
+    Postgres refuses to create a partition while the default partition holds rows
+    in its range, so those rows are copied aside, deleted from the default
+    partition and inserted again once the partition exists, all in one
+    transaction with writes to the message table blocked.
+    """
+    name = partition_name(month)
+    table = connection.ops.quote_name(Message._meta.db_table)
+    default = connection.ops.quote_name(default_partition_name())
+    bounds = [month, add_months(month, 1)]
+    columns = ", ".join(
+        connection.ops.quote_name(field.column) for field in Message._meta.concrete_fields if not field.generated
+    )
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s)", [name])
+        if cursor.fetchone()[0] is not None:
+            return False
+        cursor.execute(
+            f"SELECT EXISTS (SELECT 1 FROM {default} WHERE created_at >= %s AND created_at < %s)", bounds
+        )
+        stray = cursor.fetchone()[0]
+        if stray:
+            cursor.execute(f"LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE")
+            cursor.execute(
+                f"CREATE TEMPORARY TABLE stray_messages AS SELECT {columns} FROM {default} "
+                "WHERE created_at >= %s AND created_at < %s",
+                bounds,
+            )
+            cursor.execute(f"DELETE FROM {default} WHERE created_at >= %s AND created_at < %s", bounds)
+        cursor.execute(
+            f"CREATE TABLE {connection.ops.quote_name(name)} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)",
+            bounds,
+        )
+        if stray:
+            cursor.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM stray_messages")
+            cursor.execute("DROP TABLE stray_messages")
+    return True
+
+
+def ensure_partitions(months_ahead=3):
+    """
+    Create any missing partitions from the current month through `months_ahead`
+    months out, and for any earlier month with rows in the default partition.
+    """
+    current = month_start(timezone.now())
+    months = [add_months(current, offset) for offset in range(months_ahead + 1)]
+    months = sorted(set(months) | set(default_partition_months()))
+    return [partition_name(month) for month in months if create_partition(month)]
+
+
+def drop_partition(name):
+    table = connection.ops.quote_name(Message._meta.db_table)
+    partition = connection.ops.quote_name(name)
+    with connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {partition}")
+        cursor.execute(f"DROP TABLE {partition}")
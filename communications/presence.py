@@ -0,0 +1,99 @@
+"""
+Online presence for chat users.
+
+Every chat socket registers itself when it connects and refreshes its entry on
+each heartbeat; entries expire PRESENCE_TTL seconds after the last one, so a
+socket that dies without disconnecting drops out on its own. A user is online
+while any of their sockets has a live entry.
+
+RedisPresenceRegistry keeps one sorted set per user (socket channel name scored
+by expiry time) on the channel layer's first Redis host. LocalPresenceRegistry
+keeps the same data in process and is used automatically with the in-memory
+channel layer, e.g. in tests.
+"""
+import time
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+PRESENCE_TTL = getattr(settings, 'PRESENCE_TTL', 60)
+
+IN_MEMORY_LAYERS = {
+    'channels.layers.InMemoryChannelLayer',
+    'communications.layers.ShardedInMemoryChannelLayer',
+}
+
+
+def presence_key(user_id):
+    return f"presence:{user_id}"
+
+
+class LocalPresenceRegistry:
+    def __init__(self, ttl=PRESENCE_TTL):
+        self.ttl = ttl
+        self._entries = {}  # user_id -> {channel_name: expiry}
+
+    async def touch(self, user_id, channel_name):
+        self._entries.setdefault(user_id, {})[channel_name] = time.time() + self.ttl
+
+    async def remove(self, user_id, channel_name):
+        sockets = self._entries.get(user_id, {})
+        sockets.pop(channel_name, None)
+        if not sockets:
+            self._entries.pop(user_id, None)
+
+    async def online(self, user_ids):
+        now = time.time()
+        return [
+            user_id for user_id in user_ids
+            if any(expiry > now for expiry in self._entries.get(user_id, {}).values())
+        ]
+
+
+class RedisPresenceRegistry:
+    def __init__(self, ttl=PRESENCE_TTL, host=None):
+        import redis.asyncio as redis
+
+        self.ttl = ttl
+        host = host or settings.CHANNEL_LAYERS['default'].get('CONFIG', {}).get('hosts', [('127.0.0.1', 6379)])[0]
+        if isinstance(host, str):
+            self.redis = redis.Redis.from_url(host)
+        elif isinstance(host, dict):
+            self.redis = redis.Redis.from_url(host['address']) if 'address' in host else redis.Redis(**host)
+        else:
+            self.redis = redis.Redis(host=host[0], port=host[1])
+
+    async def touch(self, user_id, channel_name):
+        key = presence_key(user_id)
+        now = time.time()
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.zadd(key, {channel_name: now + self.ttl})
+            pipe.zremrangebyscore(key, '-inf', now)
+            pipe.expire(key, self.ttl)
+            await pipe.execute()
+
+    async def remove(self, user_id, channel_name):
+        await self.redis.zrem(presence_key(user_id), channel_name)
+
+    async def online(self, user_ids):
+        if not user_ids:
+            return []
+        now = time.time()
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                pipe.zcount(presence_key(user_id), now, '+inf')
+            counts = await pipe.execute()
+        return [user_id for user_id, count in zip(user_ids, counts) if count]
+
+
+_registry = None
+
+
+def get_presence_registry():
+    global _registry
+    if _registry is None:
+        path = getattr(settings, 'PRESENCE_REGISTRY', None)
+        if path is None:
+            in_memory = settings.CHANNEL_LAYERS['default']['BACKEND'] in IN_MEMORY_LAYERS
+            path = 'communications.presence.' + ('LocalPresenceRegistry' if in_memory else 'RedisPresenceRegistry')
+        _registry = import_string(path)()
+    return _registry
@@ -0,0 +1,23 @@
+import time
+
+
+class TokenBucket:
+    """
+    Per-connection rate limit: `rate` tokens per second, holding at most `burst`.
+    allow() spends a token if one is available.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def allow(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
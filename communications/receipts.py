@@ -0,0 +1,143 @@
+"""
+Coalesced read receipts for the chat sockets.
+
+A client reports "read up to message ID n" for a conversation. Reports are
+buffered per (reader, conversation), keeping only the highest ID, and every
+READ_RECEIPT_FLUSH_INTERVAL seconds each entry becomes one conditional UPDATE of
+that conversation's unread messages to the reader, followed by a read_receipt
+event to both participants. A client that reports after every message therefore
+costs one write per conversation per interval.
+
+Message IDs do not follow arrival order under write-behind (each process hands
+out IDs from its own reserved block), so the UPDATE marks messages up to the
+reported message's seq instead, after flushing this process's write-behind
+buffer so the reported message has one. A receipt stays buffered until it is
+written, and only then is the read_receipt event sent: a flush that fails is
+retried with backoff, and a receipt whose message is not stored yet (it may sit
+in another process's write-behind buffer) is retried for up to
+READ_RECEIPT_MAX_WAIT seconds before it is dropped as naming no message.
+"""
+import asyncio
+import atexit
+import logging
+import time
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from .models import Message, Conversation
+from .writebehind import get_message_writer
+
+logger = logging.getLogger(__name__)
+
+
+def apply_read_receipt(reader_id, conversation_id, up_to):
+    """
+    Mark the reader's unread messages in the conversation up to and including
+    message `up_to`, by seq. Returns the number marked, or None if `up_to` is not
+    a stored message of the conversation (yet).
+    """
+    up_to_seq = (
+        Message.objects.filter(conversation_id=conversation_id, id=up_to).values_list('seq', flat=True).first()
+    )
+    if up_to_seq is None:
+        return None
+    with transaction.atomic():
+        marked = Message.objects.filter(
+            conversation_id=conversation_id, receiver_id=reader_id, is_read=False, seq__lte=up_to_seq
+        ).update(is_read=True)
+        if marked:
+            Conversation.objects.adjust_unread(conversation_id, reader_id, -marked)
+    return marked
+
+
+class ReadReceiptBuffer:
+    def __init__(self, flush_interval=1.0, max_wait=60.0):
+        self.flush_interval = flush_interval
+        self.max_wait = max_wait
+        self._pending = {}  # (reader_id, conversation_id) -> (up_to, groups to notify, monotonic time submitted)
+        self._flusher = None
+        self._attempts = 0
+
+    def submit(self, reader_id, conversation_id, up_to, groups):
+        """Record a receipt; `groups` are the channel-layer groups told once it is written."""
+        self._merge({(reader_id, conversation_id): (up_to, groups, time.monotonic())})
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.ensure_future(self._run())
+
+    def _merge(self, receipts):
+        for key, receipt in receipts.items():
+            current = self._pending.get(key)
+            if current is None or receipt[0] > current[0]:
+                self._pending[key] = receipt
+
+    async def flush(self):
+        """
+        Write everything pending, then tell the groups about the receipts written.
+        Receipts not written go back into the buffer, merged with newer ones.
+        """
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        try:
+            if getattr(settings, 'CHAT_WRITE_BEHIND', False):
+                await get_message_writer().flush()
+            waiting = await database_sync_to_async(self._write)(pending)
+            self._attempts = 0
+        except Exception:
+            self._attempts += 1
+            logger.exception("Flushing %s read receipts failed; will retry.", len(pending))
+            self._merge(pending)
+            return
+        now = time.monotonic()
+        for key in waiting:
+            receipt = pending.pop(key)
+            if now - receipt[2] < self.max_wait:
+                self._merge({key: receipt})
+            else:
+                logger.warning(
+                    "Dropping read receipt of user %s in conversation %s: message %s was never stored.",
+                    *key, receipt[0],
+                )
+        channel_layer = get_channel_layer()
+        for (reader_id, conversation_id), (up_to, groups, _) in pending.items():
+            event = {
+                "type": "read_receipt",
+                "conversation_id": conversation_id,
+                "reader_id": reader_id,
+                "up_to": up_to,
+            }
+            for group in groups:
+                await channel_layer.group_send(group, event)
+
+    def flush_sync(self):
+        pending, self._pending = self._pending, {}
+        if pending:
+            self._write(pending)
+
+    async def _run(self):
+        while self._pending:
+            await asyncio.sleep(self.flush_interval * (2 ** min(self._attempts, 5)))
+            await self.flush()
+
+    @staticmethod
+    def _write(pending):
+        """Apply the receipts. Returns the keys of those whose message is not stored yet."""
+        return [
+            (reader_id, conversation_id)
+            for (reader_id, conversation_id), (up_to, _, _) in pending.items()
+            if apply_read_receipt(reader_id, conversation_id, up_to) is None
+        ]
+
+_buffer = None
+
+
+def get_read_receipt_buffer():
+    global _buffer
+    if _buffer is None:
+        _buffer = ReadReceiptBuffer(
+            flush_interval=getattr(settings, 'READ_RECEIPT_FLUSH_INTERVAL', 1.0),
+            max_wait=getattr(settings, 'READ_RECEIPT_MAX_WAIT', 60.0),
+        )
+        atexit.register(_buffer.flush_sync)
+    return _buffer
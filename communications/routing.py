@@ -1,6 +1,8 @@
 from django.urls import re_path
-from .consumers import ChatConsumer
+from .consumers import ChatConsumer, UserChatConsumer, NotificationConsumer
 
 websocket_urlpatterns = [
     re_path(r"ws/chat/(?P<receiver_id>\d+)/$", ChatConsumer.as_asgi()),  # ✅ Make sure receiver_id is defined here
+    re_path(r"ws/chat/$", UserChatConsumer.as_asgi()),  # One multiplexed socket per user
+    re_path(r"ws/notifications/$", NotificationConsumer.as_asgi()),
 ]
@@ -6,7 +6,7 @@ class MessageSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Message
-        fields = ['id', 'sender', 'receiver', 'conversation', 'content', 'created_at', 'is_read']
+        fields = ['id', 'sender', 'receiver', 'conversation', 'seq', 'content', 'created_at', 'is_read']
 
     def get_sender(self, obj):
         return {
@@ -17,7 +17,15 @@ class MessageSerializer(serializers.ModelSerializer):
 class NotificationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Notification
-        fields = ['id', 'user', 'message', 'is_read', 'created_at']
+        fields = ['id', 'user', 'kind', 'count', 'message', 'is_read', 'created_at']
+        read_only_fields = ['kind', 'count']
+
+    def validate_is_read(self, value):
+        # A digest marked unread again could collide with a newer unread digest of
+        # the same group, which the unique_unread_notification_group index forbids.
+        if self.instance is not None and self.instance.is_read and not value:
+            raise serializers.ValidationError("Read notifications cannot be marked unread.")
+        return value
 
 class ConversationSerializer(serializers.ModelSerializer):
     participant_one = serializers.PrimaryKeyRelatedField(read_only=True)
@@ -26,3 +34,34 @@ class ConversationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Conversation
         fields = ['id', 'participant_one', 'participant_two', 'created_at']
+
+
+class InboxConversationSerializer(serializers.ModelSerializer):
+    """Inbox row for the requesting user, built only from the conversation's denormalized fields."""
+    participant = serializers.SerializerMethodField()
+    last_message = serializers.SerializerMethodField()
+    unread_count = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Conversation
+        fields = ['id', 'participant', 'last_message', 'unread_count', 'created_at']
+
+    def get_participant(self, obj):
+        user_id = self.context['request'].user.id
+        other = obj.participant_two if obj.participant_one_id == user_id else obj.participant_one
+        return {
+            "id": other.id,
+            "username": other.username,
+        }
+
+    def get_last_message(self, obj):
+        if obj.last_message_id is None:
+            return None
+        return {
+            "id": obj.last_message_id,
+            "snippet": obj.last_message_snippet,
+            "created_at": serializers.DateTimeField().to_representation(obj.last_message_at),
+        }
+
+    def get_unread_count(self, obj):
+        return obj.unread_count_for(self.context['request'].user.id)
@@ -1,3 +1,75 @@
-from django.test import TestCase
+import asyncio
+from django.test import SimpleTestCase
+from .layers import HashRing, ShardedInMemoryChannelLayer
 
-# Create your tests here.
+
+class HashRingTests(SimpleTestCase):
+    def test_preference_yields_every_node_once_starting_at_lookup(self):
+        ring = HashRing([f"node{index}" for index in range(5)])
+        for key in (f"chat_{index}" for index in range(50)):
+            order = list(ring.preference(key))
+            self.assertEqual(sorted(order), list(range(5)))
+            self.assertEqual(order[0], ring.lookup(key))
+
+    def test_preference_falls_back_like_a_ring_without_the_first_node(self):
+        nodes = [f"node{index}" for index in range(4)]
+        ring = HashRing(nodes)
+        for key in (f"chat_{index}" for index in range(50)):
+            first, second = list(ring.preference(key))[:2]
+            remaining = [node for index, node in enumerate(nodes) if index != first]
+            self.assertEqual(nodes[second], remaining[HashRing(remaining).lookup(key)])
+
+    def test_single_node(self):
+        ring = HashRing(["only"])
+        self.assertEqual(list(ring.preference("chat_1")), [0])
+
+
+class ShardedInMemoryChannelLayerFailoverTests(SimpleTestCase):
+    group = "chat_1"
+
+    def make_layer(self):
+        return ShardedInMemoryChannelLayer(shards=3, retry_after=60, probe_timeout=0.1)
+
+    async def assert_receives(self, layer, channel, text):
+        message = await asyncio.wait_for(layer.receive(channel), 2)
+        self.assertEqual(message["text"], text)
+
+    async def test_group_send_reaches_members_while_the_group_primary_is_down(self):
+        layer = self.make_layer()
+        channel = await layer.new_channel()
+        await layer.group_add(self.group, channel)
+        layer.set_available(layer.ring.lookup(self.group), False)
+
+        await layer.group_send(self.group, {"type": "chat.message", "text": "during"})
+        await self.assert_receives(layer, channel, "during")
+
+    async def test_memberships_added_during_an_outage_survive_recovery(self):
+        layer = self.make_layer()
+        primary = layer.ring.lookup(self.group)
+        before = await layer.new_channel()
+        await layer.group_add(self.group, before)
+
+        layer.set_available(primary, False)
+        during = await layer.new_channel()
+        await layer.group_add(self.group, during)
+        self.assertNotIn(primary, layer.group_shards(self.group))
+
+        layer.set_available(primary, True)
+        layer._down_until.clear()  # retry_after has passed
+        self.assertEqual(layer.group_shards(self.group)[0], primary)
+        await layer.group_send(self.group, {"type": "chat.message", "text": "after"})
+        await self.assert_receives(layer, before, "after")
+        await self.assert_receives(layer, during, "after")
+
+    async def test_discard_after_recovery_removes_copies_added_during_the_outage(self):
+        layer = self.make_layer()
+        primary = layer.ring.lookup(self.group)
+        layer.set_available(primary, False)
+        channel = await layer.new_channel()
+        await layer.group_add(self.group, channel)
+
+        layer.set_available(primary, True)
+        layer._down_until.clear()
+        await layer.group_discard(self.group, channel)
+        for shard in layer.shards:
+            self.assertNotIn(channel, shard.groups.get(self.group, {}))
@@ -1,38 +1,185 @@
+import binascii
+from base64 import b64decode, b64encode
 from rest_framework import viewsets, permissions, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q
-from .models import Message, Notification, Conversation
-from .serializers import MessageSerializer, NotificationSerializer, ConversationSerializer
-from rest_framework.pagination import PageNumberPagination
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import IntegrityError, transaction
+from django.db import models
+from django.db.models import F, Func, Value
+from .models import (
+    Message, Notification, NotificationBadge, Conversation, ConversationParticipant, SEARCH_CONFIG
+)
+from .archive import history_with_archive
+from .notifications import push_badge_on_commit
+from .serializers import (
+    MessageSerializer, NotificationSerializer, ConversationSerializer, InboxConversationSerializer
+)
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination, CursorPagination
+from rest_framework.utils.urls import replace_query_param
 
 class StandardResultsSetPagination(PageNumberPagination):
     page_size = 50
     page_size_query_param = 'page_size'
     max_page_size = 10000
 
+class InboxPagination(CursorPagination):
+    page_size = 30
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-last_activity', '-id')
+
+class MessageSearchPagination(BasePagination):
+    """
+    Keyset pagination over (rank, id), best matches first. A cursor holds the
+    boundary row's exact rank and ID, and the next page starts strictly past it
+    with a (rank, id) row comparison, so rows tied on rank are neither skipped
+    nor repeated. The queryset must be annotated with `rank`.
+    """
+    page_size = 30
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        key = Func(F('rank'), F('id'), function='ROW', output_field=models.Field())
+        queryset = queryset.alias(search_key=key)
+        if cursor is None:
+            reverse = False
+            page = list(queryset.order_by('-rank', '-id')[:page_size + 1])
+        else:
+            rank, message_id, reverse = cursor
+            # ts_rank returns real; compare in real so the boundary row's own rank is equal to it.
+            rank = Func(Value(rank), template='%(expressions)s::real', output_field=models.FloatField())
+            boundary = Func(rank, Value(message_id), function='ROW', output_field=models.Field())
+            if reverse:
+                page = list(queryset.filter(search_key__gt=boundary).order_by('rank', 'id')[:page_size + 1])
+            else:
+                page = list(queryset.filter(search_key__lt=boundary).order_by('-rank', '-id')[:page_size + 1])
+        more = len(page) > page_size
+        page = page[:page_size]
+        if reverse:
+            page.reverse()
+            self.has_next, self.has_previous = True, more
+        else:
+            self.has_next, self.has_previous = more, cursor is not None
+        self.page = page
+        return page
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(size, self.max_page_size) if size > 0 else self.page_size
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            direction, rank, message_id = b64decode(encoded.encode('ascii'), altchars=b'-_').decode('ascii').split(':')
+            return float(rank), int(message_id), direction == 'p'
+        except (ValueError, UnicodeDecodeError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, message, reverse):
+        # The driver reads real as its shortest decimal form; repr() keeps that exactly.
+        raw = f"{'p' if reverse else 'n'}:{message.rank!r}:{message.id}"
+        encoded = b64encode(raw.encode('ascii'), altchars=b'-_').decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+def message_search_query(text):
+    return SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+
+class MessageContentSearchFilter(filters.SearchFilter):
+    """?search= matched against the indexed search vector instead of ILIKE over content."""
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        return queryset.filter(search_vector=message_search_query(" ".join(terms)))
+
+HISTORY_PAGE_SIZE = 50
+MAX_HISTORY_PAGE_SIZE = 200
+
 class MessageViewSet(viewsets.ModelViewSet):
     serializer_class = MessageSerializer
     permission_classes = [permissions.IsAuthenticated]
     pagination_class = StandardResultsSetPagination
-    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, filters.SearchFilter]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, MessageContentSearchFilter]
     filterset_fields = ['is_read', 'created_at']
     ordering_fields = ['created_at']
-    search_fields = ['content']
 
     def get_queryset(self):
-        user = self.request.user
-        return Message.objects.filter(Q(sender=user) | Q(receiver=user))
+        # Visibility follows conversation membership: one range of the user's
+        # participant rows, then each conversation's (conversation, created_at) range.
+        memberships = ConversationParticipant.objects.filter(user=self.request.user)
+        return Message.objects.filter(conversation_id__in=memberships.values('conversation_id'))
 
     def perform_create(self, serializer):
         sender = self.request.user
         receiver = serializer.validated_data.get("receiver")
-        participant_one, participant_two = sorted([sender, receiver], key=lambda u: u.id)
-        conversation, created = Conversation.objects.get_or_create(
-            participant_one=participant_one, participant_two=participant_two
-        )
-        serializer.save(sender=sender, conversation=conversation)
+        serializer.validated_data.pop("conversation", None)
+        conversation_id = Conversation.objects.get_or_create_for_pair(sender.id, receiver.id)
+        try:
+            with transaction.atomic():
+                serializer.save(sender=sender, conversation_id=conversation_id)
+        except (IntegrityError, Conversation.DoesNotExist):
+            # The cached conversation was deleted elsewhere; look the pair up again.
+            Conversation.objects.forget_pair(sender.id, receiver.id)
+            conversation_id = Conversation.objects.get_or_create_for_pair(sender.id, receiver.id)
+            serializer.save(sender=sender, conversation_id=conversation_id)
+
+    def perform_update(self, serializer):
+        was_read = serializer.instance.is_read
+        message = serializer.save()
+        if message.is_read != was_read and message.conversation_id:
+            Conversation.objects.adjust_unread(
+                message.conversation_id, message.receiver_id, -1 if message.is_read else 1
+            )
+
+    @action(detail=False, methods=['get'], url_path='search')
+    def search(self, request):
+        """
+        Full-text search over the caller's conversations, best matches first.
+        Accepts web-search syntax in ?q= ("quoted phrases", or, -excluded). Cursor-paginated.
+        """
+        text = request.query_params.get('q', '').strip()
+        if not text:
+            return Response({"error": "q is required."}, status=status.HTTP_400_BAD_REQUEST)
+        query = message_search_query(text)
+        messages = self.get_queryset().filter(search_vector=query) \
+            .annotate(rank=SearchRank(F('search_vector'), query)) \
+            .select_related('sender')
+        paginator = MessageSearchPagination()
+        page = paginator.paginate_queryset(messages, request)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
     @action(detail=False, methods=['get'], url_path='received')
     def received_messages(self, request):
@@ -42,7 +189,9 @@ class MessageViewSet(viewsets.ModelViewSet):
         """
         messages = Message.objects.filter(receiver=request.user)
         if request.query_params.get("mark_read", "").lower() == "true":
-            messages.update(is_read=True)
+            with transaction.atomic():
+                messages.update(is_read=True)
+                Conversation.objects.clear_unread(request.user.id)
         page = self.paginate_queryset(messages)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
@@ -61,7 +210,9 @@ class MessageViewSet(viewsets.ModelViewSet):
             return Response({"error": "You can only mark your own messages as read."}, 
                           status=status.HTTP_403_FORBIDDEN)
         
-        updated_count = Message.objects.filter(receiver=request.user, is_read=False).update(is_read=True)
+        with transaction.atomic():
+            updated_count = Message.objects.filter(receiver=request.user, is_read=False).update(is_read=True)
+            Conversation.objects.clear_unread(request.user.id)
         return Response({
             "message": f"Successfully marked {updated_count} messages as read.",
             "marked_count": updated_count
@@ -73,11 +224,52 @@ class NotificationViewSet(viewsets.ModelViewSet):
     pagination_class = StandardResultsSetPagination
 
     def get_queryset(self):
-        return Notification.objects.filter(user=self.request.user)
+        # Served by the (user, is_read, created_at) index.
+        notifications = Notification.objects.filter(user=self.request.user)
+        is_read = self.request.query_params.get('is_read', '').lower()
+        if is_read in ('true', 'false'):
+            notifications = notifications.filter(is_read=is_read == 'true')
+        return notifications.order_by('-created_at')
+
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            notification = serializer.save()
+            if not notification.is_read:
+                self.adjust_badge(notification.user_id, 1)
+
+    def perform_update(self, serializer):
+        was_read = serializer.instance.is_read
+        old_user_id = serializer.instance.user_id
+        with transaction.atomic():
+            notification = serializer.save()
+            if not was_read:
+                self.adjust_badge(old_user_id, -1)
+            if not notification.is_read:
+                self.adjust_badge(notification.user_id, 1)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+            if not instance.is_read:
+                self.adjust_badge(instance.user_id, -1)
+
+    @staticmethod
+    def adjust_badge(user_id, delta):
+        push_badge_on_commit(user_id, NotificationBadge.objects.adjust(user_id, delta))
+
+    @action(detail=False, methods=['get'], url_path='unread-count')
+    def unread_count(self, request):
+        """Unread badge count from the per-user counter; no COUNT over notifications."""
+        return Response({"unread_count": NotificationBadge.objects.unread_for(request.user.id)})
 
     @action(detail=False, methods=['post'], url_path='mark-read')
     def mark_read(self, request):
-        Notification.objects.filter(user=request.user, is_read=False).update(is_read=True)
+        with transaction.atomic():
+            # Reset the counter first: its row lock makes a concurrent delivery either
+            # commit before the update below (and be marked read) or count on top of zero.
+            NotificationBadge.objects.reset(request.user.id)
+            Notification.objects.filter(user=request.user, is_read=False).update(is_read=True)
+            push_badge_on_commit(request.user.id, 0)
         return Response({"message": "Notifications marked as read."}, status=status.HTTP_200_OK)
 
 class ConversationViewSet(viewsets.ModelViewSet):
@@ -86,16 +278,68 @@ class ConversationViewSet(viewsets.ModelViewSet):
     pagination_class = StandardResultsSetPagination
 
     def get_queryset(self):
-        user = self.request.user
-        return Conversation.objects.filter(Q(participant_one=user) | Q(participant_two=user))
+        return Conversation.objects.filter(participants__user=self.request.user) \
+            .order_by('-participants__last_activity', '-id')
+
+    @action(detail=False, methods=['get'], url_path='inbox')
+    def inbox(self, request):
+        """
+        Conversations with at least one message, most recently active first, with the
+        last message snippet and the caller's unread count. Cursor-paginated.
+        """
+        memberships = ConversationParticipant.objects.filter(
+            user=request.user, conversation__last_message_at__isnull=False
+        ).select_related('conversation__participant_one', 'conversation__participant_two')
+        paginator = InboxPagination()
+        page = paginator.paginate_queryset(memberships, request, view=self)
+        serializer = InboxConversationSerializer(
+            [membership.conversation for membership in page], many=True, context={'request': request}
+        )
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['post'], url_path='mark-read')
+    def mark_read(self, request, pk=None):
+        """Mark every message the caller received in this conversation as read."""
+        conversation = self.get_object()
+        with transaction.atomic():
+            updated_count = Message.objects.filter(
+                conversation=conversation, receiver=request.user, is_read=False
+            ).update(is_read=True)
+            Conversation.objects.clear_unread(request.user.id, conversation.id)
+        return Response({"marked_count": updated_count}, status=status.HTTP_200_OK)
 
     @action(detail=True, methods=['get'], url_path='messages')
     def conversation_messages(self, request, pk=None):
+        """
+        Message history, oldest first within a page. Without a cursor the newest
+        messages are returned; pass ?before=<message_id> to scroll back or
+        ?after=<message_id> to catch up. ?limit= sets the page size. With
+        ?archived=true, scrolling back continues into archived months.
+        """
         conversation = self.get_object()
-        messages = Message.objects.filter(conversation=conversation).order_by("created_at")
-        page = self.paginate_queryset(messages)
-        if page is not None:
-            serializer = MessageSerializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-        serializer = MessageSerializer(messages, many=True)
-        return Response(serializer.data)
+        try:
+            before = request.query_params.get('before')
+            after = request.query_params.get('after')
+            before = int(before) if before else None
+            after = int(after) if after else None
+            limit = min(int(request.query_params.get('limit', HISTORY_PAGE_SIZE)), MAX_HISTORY_PAGE_SIZE)
+        except ValueError:
+            return Response({"error": "before, after and limit must be integers."}, status=status.HTTP_400_BAD_REQUEST)
+        if before is not None and after is not None:
+            return Response({"error": "Pass either before or after, not both."}, status=status.HTTP_400_BAD_REQUEST)
+        if limit < 1:
+            return Response({"error": "limit must be positive."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            history = history_with_archive if request.query_params.get('archived', '').lower() == 'true' \
+                else Message.objects.history
+            messages, has_more = history(conversation.id, before=before, after=after, limit=limit)
+        except Message.DoesNotExist:
+            return Response({"error": "Cursor message not found in this conversation."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            "results": MessageSerializer(messages, many=True).data,
+            "has_more": has_more,
+            "before": messages[0].id if messages else before,
+            "after": messages[-1].id if messages else after,
+        })
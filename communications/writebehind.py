@@ -0,0 +1,225 @@
+"""
+Opt-in write-behind persistence for the WebSocket chat path (CHAT_WRITE_BEHIND).
+
+Messages receive their primary key up front from a block of IDs reserved from the
+message sequence, are broadcast immediately, and are written in batches with
+bulk_create when CHAT_WRITE_BEHIND_BATCH_SIZE messages are pending or every
+CHAT_WRITE_BEHIND_FLUSH_INTERVAL seconds.
+
+Durability: a failed flush keeps its batch at the head of the buffer and is
+retried with backoff; after CHAT_WRITE_BEHIND_MAX_RETRIES attempts the batch is
+written row by row so a single bad row cannot block the rest. Rows that still
+fail are logged and, since both participants were already sent them, reported to
+the conversation group with a chat_message_failed event. Pending messages,
+including a batch whose flush is in progress, are written on interpreter
+shutdown. A hard kill of the process can lose at most the messages accepted
+since the last flush.
+"""
+import asyncio
+import atexit
+import logging
+from collections import deque
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from .models import (
+    Message, Conversation, Notification, message_notification_group, message_notification_text
+)
+from .notifications import NotificationEvent, notify_many
+
+logger = logging.getLogger(__name__)
+
+
+class MessageWriter:
+    def __init__(self, batch_size=200, flush_interval=0.5, max_retries=5, id_block_size=100):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.id_block_size = id_block_size
+        self._pending = []  # (Message, sender_username) pairs
+        self._in_flight = []  # the batch a flush is writing
+        self._ids = deque()
+        self._id_refill = None
+        self._flush_lock = None
+        self._flusher = None
+        self._attempts = 0
+
+    async def submit(self, sender, receiver_id, conversation_id, content):
+        """Assign an ID to a new message and queue it for persistence. Returns the unsaved Message."""
+        self._ensure_started()
+        message_id = await self._next_id()
+        message = Message(
+            id=message_id,
+            sender_id=sender.id,
+            receiver_id=receiver_id,
+            conversation_id=conversation_id,
+            content=content,
+        )
+        self._pending.append((message, sender.username))
+        if len(self._pending) >= self.batch_size:
+            asyncio.ensure_future(self.flush())
+        return message
+
+    async def flush(self):
+        """Write everything pending. Failed batches go back to the head of the buffer."""
+        if self._flush_lock is None:
+            return  # nothing was ever submitted
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, []
+            self._in_flight = batch
+            try:
+                await database_sync_to_async(self._write_batch)(batch)
+                self._attempts = 0
+            except Exception:
+                self._attempts += 1
+                if self._attempts >= self.max_retries:
+                    logger.exception("Write-behind flush failed %s times; writing rows individually.", self._attempts)
+                    self._attempts = 0
+                    await self.report_dropped(await database_sync_to_async(self._write_rows)(batch))
+                else:
+                    logger.exception("Write-behind flush of %s messages failed; will retry.", len(batch))
+                    self._pending = batch + self._pending
+            finally:
+                self._in_flight = []
+
+    def flush_sync(self):
+        """
+        Synchronously write anything still pending, and the batch of a flush still in
+        progress unless it has been stored by now. Used at interpreter shutdown.
+        """
+        batch, self._in_flight, self._pending = self._in_flight + self._pending, [], []
+        if not batch:
+            return
+        stored = set(
+            Message.objects.filter(id__in=[message.id for message, _ in batch]).values_list('id', flat=True)
+        )
+        batch = [item for item in batch if item[0].id not in stored]
+        if not batch:
+            return
+        try:
+            self._write_batch(batch)
+        except Exception:
+            logger.exception("Shutdown flush failed; writing rows individually.")
+            dropped = self._write_rows(batch)
+            if dropped:
+                try:
+                    async_to_sync(self.report_dropped)(dropped)
+                except Exception:
+                    logger.exception("Could not report %s dropped messages.", len(dropped))
+
+    @staticmethod
+    async def report_dropped(messages):
+        """Tell the conversations' participants that these already broadcast messages were not stored."""
+        from .consumers import conversation_group_name
+
+        channel_layer = get_channel_layer()
+        if channel_layer is None:
+            return
+        for message in messages:
+            await channel_layer.group_send(conversation_group_name(message.conversation_id), {
+                "type": "chat_message_failed",
+                "conversation_id": message.conversation_id,
+                "message_id": message.id,
+                "sender_id": message.sender_id,
+            })
+
+    def _ensure_started(self):
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval * (2 ** min(self._attempts, 5)))
+            await self.flush()
+
+    async def _next_id(self):
+        if len(self._ids) < self.id_block_size // 4 and (self._id_refill is None or self._id_refill.done()):
+            self._id_refill = asyncio.ensure_future(self._refill_ids())
+        if not self._ids:
+            await self._id_refill
+        return self._ids.popleft()
+
+    async def _refill_ids(self):
+        self._ids.extend(await database_sync_to_async(self._reserve_ids)(self.id_block_size))
+
+    @staticmethod
+    def _reserve_ids(count):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+                [Message._meta.db_table, count],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    @staticmethod
+    def _write_batch(batch):
+        with transaction.atomic():
+            by_conversation = {}
+            for message, _ in batch:
+                by_conversation.setdefault(message.conversation_id, []).append(message)
+            # Sequence numbers are assigned here rather than in submit(), so frames
+            # broadcast before the flush carry no seq. Conversations are locked in ID
+            # order so concurrent flushes cannot deadlock on each other's rows.
+            for conversation_id in sorted(by_conversation):
+                conversation_messages = by_conversation[conversation_id]
+                first = Conversation.objects.allocate_seq(conversation_id, len(conversation_messages))
+                for offset, message in enumerate(conversation_messages):
+                    message.seq = first + offset
+            Message.objects.bulk_create([message for message, _ in batch])
+            for conversation_id, conversation_messages in by_conversation.items():
+                Conversation.objects.record_messages(conversation_id, conversation_messages)
+            notify_many([
+                NotificationEvent(
+                    message.receiver_id,
+                    message_notification_text(message, sender_username),
+                    Notification.Kind.MESSAGE,
+                    message_notification_group(message),
+                )
+                for message, sender_username in batch
+            ])
+
+    @classmethod
+    def _write_rows(cls, batch):
+        """Write a batch one row at a time. Returns the messages that could not be written."""
+        dropped = []
+        for item in batch:
+            try:
+                cls._write_batch([item])
+            except (IntegrityError, Conversation.DoesNotExist):
+                # The conversation was deleted after its ID was cached; file the
+                # message under the pair's current conversation instead.
+                message = item[0]
+                Conversation.objects.forget_pair(message.sender_id, message.receiver_id)
+                message.conversation_id = Conversation.objects.get_or_create_for_pair(
+                    message.sender_id, message.receiver_id
+                )
+                try:
+                    cls._write_batch([item])
+                except Exception:
+                    logger.exception("Dropping message %s after repeated write failures.", message.id)
+                    dropped.append(message)
+            except Exception:
+                logger.exception("Dropping message %s after repeated write failures.", item[0].id)
+                dropped.append(item[0])
+        return dropped
+
+
+_writer = None
+
+
+def get_message_writer():
+    global _writer
+    if _writer is None:
+        _writer = MessageWriter(
+            batch_size=getattr(settings, 'CHAT_WRITE_BEHIND_BATCH_SIZE', 200),
+            flush_interval=getattr(settings, 'CHAT_WRITE_BEHIND_FLUSH_INTERVAL', 0.5),
+            max_retries=getattr(settings, 'CHAT_WRITE_BEHIND_MAX_RETRIES', 5),
+        )
+        atexit.register(_writer.flush_sync)
+    return _writer
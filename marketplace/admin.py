@@ -1,14 +1,14 @@
 from django.contrib import admin
-from .models import Sector, Subcategory, ProviderProfile, PortfolioMedia, Review
+from .models import Sector, Subcategory, ProviderProfile, PortfolioMedia, Review, CatalogTombstone, ProviderRanking
 
 @admin.register(Sector)
 class SectorAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name', 'updated_at')
+    list_display = ('id', 'name', 'provider_count', 'verified_provider_count', 'updated_at')
     search_fields = ('name',)
 
 @admin.register(Subcategory)
 class SubcategoryAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name', 'sector', 'updated_at')
+    list_display = ('id', 'name', 'sector', 'provider_count', 'verified_provider_count', 'updated_at')
     search_fields = ('name',)
     list_filter = ('sector',)
 
@@ -18,6 +18,11 @@ class ProviderProfileAdmin(admin.ModelAdmin):
     search_fields = ('business_name', 'user__username')
     list_filter = ('sector', 'subcategory', 'is_verified', 'is_featured')
 
+@admin.register(ProviderRanking)
+class ProviderRankingAdmin(admin.ModelAdmin):
+    list_display = ('provider', 'score', 'refreshed_at')
+    ordering = ('-score',)
+
 @admin.register(PortfolioMedia)
 class PortfolioMediaAdmin(admin.ModelAdmin):
     list_display = ('id', 'provider', 'media_type', 'uploaded_at')
@@ -27,4 +32,9 @@ class PortfolioMediaAdmin(admin.ModelAdmin):
 class ReviewAdmin(admin.ModelAdmin):
     list_display = ('id', 'provider', 'client', 'rating', 'created_at', 'is_approved')
     list_filter = ('rating', 'is_approved')
-    search_fields = ('provider__business_name', 'client__username')
\ No newline at end of file
+    search_fields = ('provider__business_name', 'client__username')
+
+@admin.register(CatalogTombstone)
+class CatalogTombstoneAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'object_id', 'deleted_at')
+    list_filter = ('kind',)
\ No newline at end of file
@@ -0,0 +1,59 @@
+"""
+Maintenance of the denormalized provider_count / verified_provider_count columns
+on Sector and Subcategory.
+"""
+from collections import defaultdict
+from django.db.models import Count, F, Q
+from django.db.models.functions import Greatest, Now
+from .models import Sector, Subcategory, ProviderProfile
+
+
+def apply_provider_change(old_state, new_state):
+    """
+    Move a provider between (sector, subcategory, verified) states, where either
+    side may be None for a created or deleted profile. Issues at most one UPDATE
+    per affected category row. Counters are clamped at zero, so a count that has
+    drifted low cannot fail the unsigned CHECK constraint; reconcile_provider_counts()
+    repairs the drift.
+    """
+    if old_state == new_state:
+        return
+    deltas = defaultdict(lambda: [0, 0])
+    for state, sign in ((old_state, -1), (new_state, 1)):
+        if state is None:
+            continue
+        sector_id, subcategory_id, is_verified = state
+        for model, pk in ((Sector, sector_id), (Subcategory, subcategory_id)):
+            if pk is None:
+                continue
+            deltas[(model, pk)][0] += sign
+            deltas[(model, pk)][1] += sign if is_verified else 0
+
+    for (model, pk), (total, verified) in deltas.items():
+        if not total and not verified:
+            continue
+        model.objects.filter(pk=pk).update(
+            provider_count=Greatest(F('provider_count') + total, 0),
+            verified_provider_count=Greatest(F('verified_provider_count') + verified, 0),
+            updated_at=Now(),
+        )
+
+
+def reconcile_provider_counts():
+    """Recount providers per sector and subcategory and fix drifted rows. Returns the number fixed."""
+    fixed = 0
+    for model, field in ((Sector, 'sector'), (Subcategory, 'subcategory')):
+        actual = {
+            row[field]: (row['total'], row['verified'])
+            for row in ProviderProfile.objects.filter(**{f'{field}__isnull': False})
+            .order_by().values(field)
+            .annotate(total=Count('id'), verified=Count('id', filter=Q(is_verified=True)))
+        }
+        for obj in model.objects.only('id', 'provider_count', 'verified_provider_count'):
+            total, verified = actual.get(obj.id, (0, 0))
+            if (obj.provider_count, obj.verified_provider_count) != (total, verified):
+                model.objects.filter(pk=obj.pk).update(
+                    provider_count=total, verified_provider_count=verified, updated_at=Now()
+                )
+                fixed += 1
+    return fixed
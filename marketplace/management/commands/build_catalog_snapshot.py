@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from marketplace.snapshot import build_snapshot, snapshot_path
+
+
+class Command(BaseCommand):
+    help = "Build or incrementally refresh the binary catalog snapshot served at /marketplace/snapshot/."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help="Rebuild from scratch instead of applying rows changed since the last build.",
+        )
+
+    def handle(self, *args, **options):
+        document, changed = build_snapshot(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Snapshot generation {document['generation']} at {snapshot_path()}: "
+            f"{len(document['sectors'])} sectors, {len(document['subcategories'])} subcategories, "
+            f"{len(document['providers'])} providers ({changed} changed rows applied)."
+        ))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from marketplace.counts import reconcile_provider_counts
+
+
+class Command(BaseCommand):
+    help = "Recount providers per sector and subcategory and repair the denormalized counters."
+
+    def handle(self, *args, **options):
+        fixed = reconcile_provider_counts()
+        self.stdout.write(self.style.SUCCESS(f"Reconciled provider counts; {fixed} rows corrected."))
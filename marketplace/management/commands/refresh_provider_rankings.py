@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from marketplace.ranking import refresh_rankings
+
+
+class Command(BaseCommand):
+    help = "Recompute provider ranking scores. Schedule periodically (e.g. hourly via cron) so recency decay is applied."
+
+    def add_arguments(self, parser):
+        parser.add_argument('provider_ids', nargs='*', type=int, help="Only refresh these providers.")
+
+    def handle(self, *args, **options):
+        refreshed = refresh_rankings(options['provider_ids'] or None)
+        self.stdout.write(self.style.SUCCESS(f"Refreshed {refreshed} provider rankings."))
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.7 on 2026-10-19 16:21
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('sector', 'Sector'), ('subcategory', 'Subcategory'), ('provider', 'Service Provider')], max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Catalog Tombstone',
+                'verbose_name_plural': 'Catalog Tombstones',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='providerprofile',
+            index=models.Index(fields=['updated_at', 'id'], name='provider_sync_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sector',
+            index=models.Index(fields=['updated_at', 'id'], name='sector_sync_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subcategory',
+            index=models.Index(fields=['updated_at', 'id'], name='subcategory_sync_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='catalogtombstone',
+            index=models.Index(fields=['deleted_at', 'id'], name='tombstone_sync_idx'),
+        ),
+    ]
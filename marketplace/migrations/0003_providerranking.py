@@ -0,0 +1,27 @@
+# Generated by Django 5.1.7 on 2026-10-19 16:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0002_catalogtombstone_providerprofile_provider_sync_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProviderRanking',
+            fields=[
+                ('provider', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ranking', serialize=False, to='marketplace.providerprofile')),
+                ('score', models.FloatField(default=0)),
+                ('refreshed_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Provider Ranking',
+                'verbose_name_plural': 'Provider Rankings',
+                'indexes': [models.Index(fields=['-score', 'provider'], name='provider_rank_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.1.7 on 2026-10-19 16:23
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def populate_provider_counts(apps, schema_editor):
+    ProviderProfile = apps.get_model('marketplace', 'ProviderProfile')
+    for model_name, field in (('Sector', 'sector'), ('Subcategory', 'subcategory')):
+        model = apps.get_model('marketplace', model_name)
+        counts = ProviderProfile.objects.filter(**{f'{field}__isnull': False}) \
+            .order_by().values(field) \
+            .annotate(total=Count('id'), verified=Count('id', filter=Q(is_verified=True)))
+        for row in counts:
+            model.objects.filter(pk=row[field]).update(
+                provider_count=row['total'], verified_provider_count=row['verified']
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0003_providerranking'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sector',
+            name='provider_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='sector',
+            name='verified_provider_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='subcategory',
+            name='provider_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='subcategory',
+            name='verified_provider_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_provider_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.1.7 on 2026-10-19 17:10
+
+from django.db import migrations
+
+
+def create_missing_rankings(apps, schema_editor):
+    ProviderProfile = apps.get_model('marketplace', 'ProviderProfile')
+    ProviderRanking = apps.get_model('marketplace', 'ProviderRanking')
+    # Scores start at 0; run refresh_provider_rankings afterwards to compute them.
+    missing = ProviderProfile.objects.filter(ranking__isnull=True).values_list('id', flat=True)
+    ProviderRanking.objects.bulk_create(
+        [ProviderRanking(provider_id=provider_id) for provider_id in missing.iterator()],
+        batch_size=2000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0004_sector_provider_count_sector_verified_provider_count_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_missing_rankings, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.gis.db.models import PointField
 from django.db.models import Avg
 from accounts.models import User
@@ -7,12 +7,17 @@ class Sector(models.Model):
     name = models.CharField(max_length=100, unique=True, db_index=True)
     description = models.TextField(blank=True, null=True)
     thumbnail = models.ImageField(upload_to='sector_thumbnails/', blank=True, null=True)
+    provider_count = models.PositiveIntegerField(default=0)
+    verified_provider_count = models.PositiveIntegerField(default=0)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         verbose_name = "Sector"
         verbose_name_plural = "Sectors"
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='sector_sync_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -22,6 +27,8 @@ class Subcategory(models.Model):
     name = models.CharField(max_length=100, db_index=True)
     description = models.TextField(blank=True, null=True)
     thumbnail = models.ImageField(upload_to='subcategory_thumbnails/', blank=True, null=True)
+    provider_count = models.PositiveIntegerField(default=0)
+    verified_provider_count = models.PositiveIntegerField(default=0)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
@@ -29,6 +36,9 @@ class Subcategory(models.Model):
         ordering = ['name']
         verbose_name = "Subcategory"
         verbose_name_plural = "Subcategories"
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='subcategory_sync_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.sector.name})"
@@ -69,15 +79,69 @@ class ProviderProfile(models.Model):
     class Meta:
         verbose_name = "Service Provider"
         verbose_name_plural = "Service Providers"
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='provider_sync_idx'),
+        ]
 
     def __str__(self):
         return self.business_name or self.user.get_full_name() or self.user.username
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what the category counters currently include this profile under.
+        instance._count_state = instance.count_state()
+        return instance
+
+    def count_state(self):
+        return (self.sector_id, self.subcategory_id, self.is_verified)
+
+    def _lock_count_state(self):
+        # The state loaded with the instance may be stale: re-read it under a row
+        # lock so concurrent saves of this profile apply their counter deltas one
+        # after the other, each from the state the previous one left. None if the
+        # row is gone.
+        stored = ProviderProfile.objects.select_for_update().filter(pk=self.pk) \
+            .values_list('sector_id', 'subcategory_id', 'is_verified').first()
+        self._count_state = tuple(stored) if stored else None
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            if self.pk and not self._state.adding:
+                self._lock_count_state()
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            self._lock_count_state()
+            return super().delete(*args, **kwargs)
+
     @property
     def average_rating(self):
         avg = self.reviews.aggregate(Avg('rating'))['rating__avg']
         return round(avg, 1) if avg else None
 
+class ProviderRanking(models.Model):
+    """Precomputed listing score, refreshed by `refresh_provider_rankings` and on relevant saves."""
+    provider = models.OneToOneField(
+        ProviderProfile,
+        primary_key=True,
+        related_name='ranking',
+        on_delete=models.CASCADE
+    )
+    score = models.FloatField(default=0)
+    refreshed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Provider Ranking"
+        verbose_name_plural = "Provider Rankings"
+        indexes = [
+            models.Index(fields=['-score', 'provider'], name='provider_rank_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.provider} ({self.score:.3f})"
+
 class PortfolioMedia(models.Model):
     MEDIA_CHOICES = (
         ('image', 'Image'),
@@ -119,3 +183,24 @@ class Review(models.Model):
 
     def __str__(self):
         return f"Review ({self.rating}/5) by {self.client.username} on {self.provider}"
+
+class CatalogTombstone(models.Model):
+    """Records deleted catalog rows so offline clients can drop them during delta sync."""
+    KIND_CHOICES = (
+        ('sector', 'Sector'),
+        ('subcategory', 'Subcategory'),
+        ('provider', 'Service Provider'),
+    )
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Catalog Tombstone"
+        verbose_name_plural = "Catalog Tombstones"
+        indexes = [
+            models.Index(fields=['deleted_at', 'id'], name='tombstone_sync_idx'),
+        ]
+
+    def __str__(self):
+        return f"Deleted {self.kind} #{self.object_id}"
@@ -0,0 +1,85 @@
+"""
+Composite provider ranking used for the default provider listing order.
+
+score = featured + premium + verified + confidence-adjusted rating + recency,
+where the rating is a Bayesian average pulled towards the catalog mean until a
+provider has enough reviews, and recency decays with a half-life in days.
+"""
+from django.core.cache import cache
+from django.db.models import Avg, Count
+from django.utils import timezone
+from .models import ProviderProfile, ProviderRanking, Review
+
+FEATURED_WEIGHT = 3.0
+PREMIUM_WEIGHT = 1.5
+VERIFIED_WEIGHT = 1.0
+RATING_WEIGHT = 2.0
+RECENCY_WEIGHT = 0.5
+RECENCY_HALF_LIFE_DAYS = 30.0
+PRIOR_REVIEWS = 5  # reviews needed before a provider's own average outweighs the catalog mean
+DEFAULT_MEAN_RATING = 3.0
+REFRESH_CHUNK_SIZE = 2000
+MEAN_RATING_CACHE_KEY = 'provider_ranking:mean_rating'
+MEAN_RATING_CACHE_TIMEOUT = 6 * 3600  # seconds; full refreshes recompute it
+
+
+def catalog_mean_rating(refresh=False):
+    """
+    Mean review rating across the catalog. Scanning every review is left to full
+    refreshes; per-provider refreshes on saves reuse the cached value, since one
+    review barely moves it.
+    """
+    mean_rating = None if refresh else cache.get(MEAN_RATING_CACHE_KEY)
+    if mean_rating is None:
+        mean_rating = Review.objects.aggregate(mean=Avg('rating'))['mean'] or DEFAULT_MEAN_RATING
+        cache.set(MEAN_RATING_CACHE_KEY, mean_rating, MEAN_RATING_CACHE_TIMEOUT)
+    return mean_rating
+
+
+def compute_score(is_featured, membership_tier, is_verified, avg_rating, reviews_count,
+                  updated_at, mean_rating, now):
+    reviews_count = reviews_count or 0
+    rating = (PRIOR_REVIEWS * mean_rating + reviews_count * (avg_rating or 0)) / (PRIOR_REVIEWS + reviews_count)
+    age_days = max((now - updated_at).total_seconds() / 86400, 0) if updated_at else RECENCY_HALF_LIFE_DAYS * 10
+    return (
+        FEATURED_WEIGHT * is_featured
+        + PREMIUM_WEIGHT * (membership_tier == 'premium')
+        + VERIFIED_WEIGHT * is_verified
+        + RATING_WEIGHT * rating / 5
+        + RECENCY_WEIGHT * 0.5 ** (age_days / RECENCY_HALF_LIFE_DAYS)
+    )
+
+
+def refresh_rankings(provider_ids=None):
+    """Recompute and upsert ranking rows for the given providers (all providers if None)."""
+    mean_rating = catalog_mean_rating(refresh=provider_ids is None)
+    now = timezone.now()
+    providers = ProviderProfile.objects.all()
+    if provider_ids is not None:
+        providers = providers.filter(id__in=provider_ids)
+    rows = providers.annotate(
+        avg_rating=Avg('reviews__rating'), reviews_count=Count('reviews')
+    ).values_list(
+        'id', 'is_featured', 'membership_tier', 'is_verified', 'avg_rating', 'reviews_count', 'updated_at'
+    ).order_by('id')
+
+    refreshed = 0
+    batch = []
+    for provider_id, *fields in rows.iterator(chunk_size=REFRESH_CHUNK_SIZE):
+        batch.append(ProviderRanking(provider_id=provider_id, score=compute_score(*fields, mean_rating, now)))
+        if len(batch) >= REFRESH_CHUNK_SIZE:
+            refreshed += _upsert(batch)
+            batch = []
+    if batch:
+        refreshed += _upsert(batch)
+    return refreshed
+
+
+def _upsert(batch):
+    ProviderRanking.objects.bulk_create(
+        batch,
+        update_conflicts=True,
+        unique_fields=['provider'],
+        update_fields=['score', 'refreshed_at'],
+    )
+    return len(batch)
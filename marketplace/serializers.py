@@ -6,14 +6,19 @@ from django.db.models import Avg
 class SectorSerializer(serializers.ModelSerializer):
     class Meta:
         model = Sector
-        fields = ['id', 'name', 'description', 'thumbnail', 'updated_at']
+        fields = ['id', 'name', 'description', 'thumbnail', 'provider_count', 'verified_provider_count', 'updated_at']
+        read_only_fields = ['provider_count', 'verified_provider_count']
 
 class SubcategorySerializer(serializers.ModelSerializer):
     sector_name = serializers.CharField(source='sector.name', read_only=True)
 
     class Meta:
         model = Subcategory
-        fields = ['id', 'name', 'sector', 'sector_name', 'description', 'thumbnail', 'updated_at']
+        fields = [
+            'id', 'name', 'sector', 'sector_name', 'description', 'thumbnail',
+            'provider_count', 'verified_provider_count', 'updated_at'
+        ]
+        read_only_fields = ['provider_count', 'verified_provider_count']
 
 class PortfolioMediaSerializer(serializers.ModelSerializer):
     class Meta:
@@ -1,9 +1,61 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
+from django.utils import timezone
 from accounts.models import User
-from .models import ProviderProfile
+from .models import ProviderProfile, ProviderRanking, Sector, Subcategory, Review, CatalogTombstone
+from .ranking import refresh_rankings
+from .counts import apply_provider_change
+
+TOMBSTONE_KINDS = {
+    Sector: 'sector',
+    Subcategory: 'subcategory',
+    ProviderProfile: 'provider',
+}
 
 @receiver(post_save, sender=User)
 def create_provider_profile(sender, instance, created, **kwargs):
     if created and instance.role == User.Role.SERVICE_PROVIDER:
         ProviderProfile.objects.create(user=instance)
+
+@receiver(post_delete, sender=Sector)
+@receiver(post_delete, sender=Subcategory)
+@receiver(post_delete, sender=ProviderProfile)
+def record_catalog_tombstone(sender, instance, **kwargs):
+    CatalogTombstone.objects.create(kind=TOMBSTONE_KINDS[sender], object_id=instance.pk)
+
+
+def schedule_ranking_refresh(provider_id):
+    transaction.on_commit(lambda: refresh_rankings([provider_id]))
+
+@receiver(post_save, sender=ProviderProfile)
+def refresh_ranking_on_profile_save(sender, instance, created, **kwargs):
+    if created:
+        # The provider listing inner-joins rankings, so the row must exist from the
+        # start; the refresh below fills in the score.
+        ProviderRanking.objects.get_or_create(provider=instance)
+    schedule_ranking_refresh(instance.pk)
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def refresh_ranking_on_review_change(sender, instance, **kwargs):
+    schedule_ranking_refresh(instance.provider_id)
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def touch_provider_on_review_change(sender, instance, **kwargs):
+    # Synced and snapshotted provider rows carry avg_rating and reviews_count, so a
+    # review change has to move the provider's updated_at like any profile edit.
+    # A queryset update so no profile signals fire.
+    ProviderProfile.objects.filter(pk=instance.provider_id).update(updated_at=timezone.now())
+
+@receiver(post_save, sender=ProviderProfile)
+def update_category_counts_on_save(sender, instance, created, **kwargs):
+    old_state = None if created else getattr(instance, '_count_state', None)
+    new_state = instance.count_state()
+    apply_provider_change(old_state, new_state)
+    instance._count_state = new_state
+
+@receiver(post_delete, sender=ProviderProfile)
+def update_category_counts_on_delete(sender, instance, **kwargs):
+    apply_provider_change(getattr(instance, '_count_state', instance.count_state()), None)
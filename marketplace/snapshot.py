@@ -0,0 +1,184 @@
+"""
+Compact binary catalog snapshot.
+
+The snapshot is a zlib-compressed msgpack document holding sectors, subcategories
+and providers as column-ordered rows. It is rebuilt incrementally from the rows
+changed since the previous build (using the delta-sync cursors) and served
+straight from a memory-mapped file.
+"""
+import hashlib
+import mmap
+import os
+import threading
+import zlib
+import msgpack
+from django.conf import settings
+from django.db.models import Avg, Count
+from .models import Sector, Subcategory, ProviderProfile, CatalogTombstone
+from .sync import sync_upper_bound, changed_since, advance_cursor
+
+SNAPSHOT_FORMAT_VERSION = 2
+SNAPSHOT_FILENAME = 'catalog.msgpack.zz'
+BUILD_CHUNK_SIZE = 5000
+
+SECTOR_COLUMNS = (
+    'id', 'name', 'description', 'thumbnail', 'provider_count', 'verified_provider_count', 'updated_at',
+)
+SUBCATEGORY_COLUMNS = (
+    'id', 'sector_id', 'name', 'description', 'thumbnail', 'provider_count',
+    'verified_provider_count', 'updated_at',
+)
+PROVIDER_COLUMNS = (
+    'id', 'user_id', 'business_name', 'sector_id', 'subcategory_id', 'address',
+    'county', 'subcounty', 'town', 'lat', 'lng', 'is_verified', 'is_featured',
+    'membership_tier', 'avg_rating', 'reviews_count', 'updated_at',
+)
+TOMBSTONE_TABLES = {'sector': 'sectors', 'subcategory': 'subcategories', 'provider': 'providers'}
+
+_mapped_lock = threading.Lock()
+_mapped = None  # (file identity, mmap, etag)
+
+
+def snapshot_path():
+    return os.path.join(settings.CATALOG_SNAPSHOT_ROOT, SNAPSHOT_FILENAME)
+
+
+def _millis(value):
+    return int(value.timestamp() * 1000) if value else None
+
+
+def _sector_row(sector):
+    return [sector.id, sector.name, sector.description, sector.thumbnail.name or None,
+            sector.provider_count, sector.verified_provider_count, _millis(sector.updated_at)]
+
+
+def _subcategory_row(subcategory):
+    return [subcategory.id, subcategory.sector_id, subcategory.name, subcategory.description,
+            subcategory.thumbnail.name or None, subcategory.provider_count,
+            subcategory.verified_provider_count, _millis(subcategory.updated_at)]
+
+
+def _provider_row(provider):
+    location = provider.location
+    return [
+        provider.id, provider.user_id, provider.business_name, provider.sector_id,
+        provider.subcategory_id, provider.address, provider.county, provider.subcounty,
+        provider.town, location.y if location else None, location.x if location else None,
+        provider.is_verified, provider.is_featured, provider.membership_tier,
+        round(provider.avg_rating, 2) if provider.avg_rating is not None else None,
+        provider.reviews_count, _millis(provider.updated_at),
+    ]
+
+
+def _empty_document():
+    return {
+        'version': SNAPSHOT_FORMAT_VERSION,
+        'generation': 0,
+        'cursors': {},
+        'columns': {
+            'sectors': SECTOR_COLUMNS,
+            'subcategories': SUBCATEGORY_COLUMNS,
+            'providers': PROVIDER_COLUMNS,
+        },
+        'sectors': [],
+        'subcategories': [],
+        'providers': [],
+    }
+
+
+def load_snapshot(path=None):
+    """Return the decoded snapshot document, or None if it is missing or from an older format."""
+    path = path or snapshot_path()
+    try:
+        with open(path, 'rb') as f:
+            document = msgpack.unpackb(zlib.decompress(f.read()), strict_map_key=False)
+    except (FileNotFoundError, zlib.error, ValueError, msgpack.UnpackException):
+        return None
+    if document.get('version') != SNAPSHOT_FORMAT_VERSION:
+        return None
+    return document
+
+
+def build_snapshot(full=False, path=None):
+    """
+    Bring the on-disk snapshot up to date and return (document, changed_row_count).
+    Only rows changed since the previous build are read unless `full` is set or
+    the existing file is unusable.
+    """
+    path = path or snapshot_path()
+    document = None if full else load_snapshot(path)
+    if document is None:
+        document = _empty_document()
+
+    tables = {
+        name: {row[0]: row for row in document[name]}
+        for name in ('sectors', 'subcategories', 'providers')
+    }
+    cursors = document['cursors']
+    upper_bound = sync_upper_bound()
+    streams = (
+        ('sectors', Sector.objects.all(), 'updated_at', _sector_row),
+        ('subcategories', Subcategory.objects.all(), 'updated_at', _subcategory_row),
+        ('providers', ProviderProfile.objects.annotate(
+            avg_rating=Avg('reviews__rating'), reviews_count=Count('reviews')
+        ), 'updated_at', _provider_row),
+        ('deleted', CatalogTombstone.objects.all(), 'deleted_at', None),
+    )
+
+    changed = 0
+    for stream, queryset, field, to_row in streams:
+        more = True
+        while more:
+            rows, more = changed_since(queryset, cursors.get(stream), upper_bound, BUILD_CHUNK_SIZE, field)
+            cursors[stream] = advance_cursor(cursors.get(stream), rows, field)
+            changed += len(rows)
+            if to_row is None:
+                for tombstone in rows:
+                    tables[TOMBSTONE_TABLES[tombstone.kind]].pop(tombstone.object_id, None)
+            else:
+                for obj in rows:
+                    tables[stream][obj.pk] = to_row(obj)
+
+    if changed or not os.path.exists(path):
+        for name, rows in tables.items():
+            document[name] = [rows[pk] for pk in sorted(rows)]
+        document['generation'] += 1
+        document['cursors'] = cursors
+        _write_atomic(path, zlib.compress(msgpack.packb(document, use_bin_type=True), 9))
+    return document, changed
+
+
+def _write_atomic(path, payload):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def open_snapshot():
+    """
+    Return (mmap, etag) for the current snapshot file, or (None, None) if it has
+    not been built yet. The mapping and its content hash are reused until the
+    file is replaced by a new build.
+    """
+    global _mapped
+    path = snapshot_path()
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None, None
+    identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    with _mapped_lock:
+        if _mapped is None or _mapped[0] != identity:
+            with open(path, 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            _mapped = (identity, mapped, hashlib.sha256(mapped).hexdigest())
+        return _mapped[1], _mapped[2]
+
+
+def iter_chunks(mapped, chunk_size=64 * 1024):
+    for offset in range(0, len(mapped), chunk_size):
+        yield mapped[offset:offset + chunk_size]
@@ -0,0 +1,60 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+WATERMARK_SALT = 'marketplace.sync.watermark'
+SYNC_STREAMS = ('sectors', 'subcategories', 'providers', 'deleted')
+
+# Rows saved in the last couple of seconds may belong to transactions that have not
+# committed yet, so they are held back until the next sync instead of being skipped.
+SYNC_SAFETY_LAG = timedelta(seconds=getattr(settings, 'CATALOG_SYNC_SAFETY_LAG_SECONDS', 2))
+
+
+class InvalidWatermark(Exception):
+    pass
+
+
+def encode_watermark(cursors):
+    """Sign the per-stream (timestamp, id) cursors so clients can only echo them back."""
+    return signing.dumps(cursors, salt=WATERMARK_SALT, compress=True)
+
+
+def decode_watermark(token):
+    if not token:
+        return {}
+    try:
+        cursors = signing.loads(token, salt=WATERMARK_SALT)
+    except signing.BadSignature:
+        raise InvalidWatermark("Invalid sync watermark.")
+    if not isinstance(cursors, dict):
+        raise InvalidWatermark("Invalid sync watermark.")
+    return {stream: cursors.get(stream) for stream in SYNC_STREAMS}
+
+
+def sync_upper_bound():
+    return timezone.now() - SYNC_SAFETY_LAG
+
+
+def changed_since(queryset, cursor, upper_bound, limit, field='updated_at'):
+    """
+    Return up to `limit` rows changed after `cursor`, ordered by (field, id) so the
+    scan walks the (field, id) index, plus a flag telling whether more rows remain.
+    """
+    if cursor:
+        timestamp, last_id = parse_datetime(cursor[0]), cursor[1]
+        if timestamp is None:
+            raise InvalidWatermark("Invalid sync watermark.")
+        queryset = queryset.filter(**{f'{field}__gte': timestamp}) \
+            .exclude(**{field: timestamp, 'id__lte': last_id})
+    queryset = queryset.filter(**{f'{field}__lt': upper_bound}).order_by(field, 'id')
+    rows = list(queryset[:limit + 1])
+    return rows[:limit], len(rows) > limit
+
+
+def advance_cursor(cursor, rows, field='updated_at'):
+    if not rows:
+        return cursor
+    last = rows[-1]
+    return [getattr(last, field).isoformat(), last.pk]
@@ -1,3 +1,36 @@
+from django.core.cache import cache
 from django.test import TestCase
+from accounts.models import User
+from .models import ProviderRanking, Review
+from .ranking import DEFAULT_MEAN_RATING, MEAN_RATING_CACHE_KEY, catalog_mean_rating, refresh_rankings
 
-# Create your tests here.
+
+class RefreshRankingsTests(TestCase):
+    def setUp(self):
+        cache.delete(MEAN_RATING_CACHE_KEY)
+        self.client_user = User.objects.create_user('client', 'client@example.com', 'pass')
+        self.rated = self.create_provider('rated')
+        self.unrated = self.create_provider('unrated')
+
+    def create_provider(self, username):
+        user = User.objects.create_user(
+            username, f'{username}@example.com', 'pass', role=User.Role.SERVICE_PROVIDER
+        )
+        return user.providerprofile
+
+    def test_catalog_mean_rating_defaults_without_reviews_and_is_cached(self):
+        self.assertEqual(catalog_mean_rating(), DEFAULT_MEAN_RATING)
+        Review.objects.create(provider=self.rated, client=self.client_user, rating=5)
+        self.assertEqual(catalog_mean_rating(), DEFAULT_MEAN_RATING)
+        self.assertEqual(catalog_mean_rating(refresh=True), 5)
+
+    def test_refresh_rankings_scores_every_provider(self):
+        Review.objects.create(provider=self.rated, client=self.client_user, rating=5)
+        Review.objects.create(provider=self.rated, client=self.client_user, rating=5)
+
+        self.assertEqual(refresh_rankings(), 2)
+        scores = dict(ProviderRanking.objects.values_list('provider_id', 'score'))
+        self.assertGreater(scores[self.rated.id], scores[self.unrated.id])
+
+    def test_refresh_rankings_for_some_providers(self):
+        self.assertEqual(refresh_rankings([self.rated.id]), 1)
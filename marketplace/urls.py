@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ProviderProfileViewSet, SectorViewSet, SubcategoryViewSet, ReviewViewSet
+from .views import ProviderProfileViewSet, SectorViewSet, SubcategoryViewSet, ReviewViewSet, CatalogSyncView, CatalogSnapshotView
 
 router = DefaultRouter()
 router.register(r'providers', ProviderProfileViewSet, basename='provider')
@@ -9,5 +9,7 @@ router.register(r'subcategories', SubcategoryViewSet, basename='subcategory')
 router.register(r'reviews', ReviewViewSet, basename='review')
 
 urlpatterns = [
+    path('sync/', CatalogSyncView.as_view(), name='catalog-sync'),
+    path('snapshot/', CatalogSnapshotView.as_view(), name='catalog-snapshot'),
     path('', include(router.urls)),
 ]
@@ -5,7 +5,8 @@ from django_filters.rest_framework import DjangoFilterBackend, FilterSet, Number
 from rest_framework import viewsets, permissions, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from .models import ProviderProfile, Sector, Subcategory, Review, PortfolioMedia
+from rest_framework.views import APIView
+from .models import ProviderProfile, Sector, Subcategory, Review, PortfolioMedia, CatalogTombstone
 from .serializers import (
     ProviderProfileSerializer, 
     SectorSerializer, 
@@ -13,12 +14,20 @@ from .serializers import (
     ReviewSerializer,
     PortfolioMediaSerializer
 )
+from .snapshot import SNAPSHOT_FORMAT_VERSION, open_snapshot, iter_chunks
+from .sync import (
+    InvalidWatermark, decode_watermark, encode_watermark,
+    sync_upper_bound, changed_since, advance_cursor
+)
 from accounts.permissions import IsOwner, IsServiceProvider
 from accounts.models import User
+from accounts.utils import parse_id_list
 import logging
 from rest_framework.pagination import PageNumberPagination
 from django.db import transaction, models
-from django.db.models import Avg, Q
+from django.db.models import Avg, Q, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.http import HttpResponse, StreamingHttpResponse
 
 class ProviderPagination(PageNumberPagination):
     page_size = 30
@@ -27,6 +36,17 @@ class ProviderPagination(PageNumberPagination):
 
 logger = logging.getLogger(__name__)
 
+def annotated_providers():
+    # Rating stats as correlated subqueries rather than a join with GROUP BY, so
+    # ordered listings can be read straight off an index.
+    reviews = Review.objects.filter(provider=OuterRef('pk')).order_by().values('provider')
+    return ProviderProfile.objects.select_related('user', 'sector', 'subcategory') \
+        .prefetch_related('portfolio_media') \
+        .annotate(
+            avg_rating=Subquery(reviews.annotate(value=Avg('rating')).values('value')),
+            reviews_count=Coalesce(Subquery(reviews.annotate(value=models.Count('id')).values('value')), 0)
+        )
+
 class ReviewFilter(FilterSet):
     min_rating = NumberFilter(field_name='rating', lookup_expr='gte')
     max_rating = NumberFilter(field_name='rating', lookup_expr='lte')
@@ -60,27 +80,21 @@ class ProviderProfileFilter(FilterSet):
     def filter_min_avg_rating(self, queryset, name, value):
         try:
             value = float(value)
-            return queryset.annotate(
-                avg_rating=Avg('reviews__rating')
-            ).filter(avg_rating__gte=value)
+            return queryset.filter(avg_rating__gte=value)
         except (ValueError, TypeError):
             return queryset
     
     def filter_max_avg_rating(self, queryset, name, value):
         try:
             value = float(value)
-            return queryset.annotate(
-                avg_rating=Avg('reviews__rating')
-            ).filter(avg_rating__lte=value)
+            return queryset.filter(avg_rating__lte=value)
         except (ValueError, TypeError):
             return queryset
     
     def filter_min_reviews_count(self, queryset, name, value):
         try:
             value = int(value)
-            return queryset.annotate(
-                reviews_count=models.Count('reviews')
-            ).filter(reviews_count__gte=value)
+            return queryset.filter(reviews_count__gte=value)
         except (ValueError, TypeError):
             return queryset
 
@@ -91,19 +105,13 @@ class ProviderProfileViewSet(viewsets.ModelViewSet):
     filterset_class = ProviderProfileFilter
     search_fields = ['business_name', 'description', 'tags']
     ordering_fields = ['updated_at', 'is_verified', 'business_name', 'avg_rating', 'reviews_count']
+    # Default order walks provider_rank_idx (-score, provider); see marketplace/ranking.py.
+    ordering = ['-ranking__score', 'ranking__provider']
 
     def get_queryset(self):
-        queryset = ProviderProfile.objects.select_related('user', 'sector', 'subcategory') \
-            .prefetch_related('portfolio_media') \
-            .annotate(
-                avg_rating=Avg('reviews__rating'),
-                reviews_count=models.Count('reviews')
-            )
-        
-        if 'min_avg_rating' in self.request.query_params:
-            queryset = queryset.filter(reviews__isnull=False).distinct()
-            
-        return queryset
+        # Every profile has a ranking row (created with the profile), so the join
+        # can be inner and the planner can drive the listing from the ranking index.
+        return annotated_providers().filter(ranking__isnull=False)
 
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
@@ -122,6 +130,28 @@ class ProviderProfileViewSet(viewsets.ModelViewSet):
         except ProviderProfile.DoesNotExist:
             return Response({"error": "Provider profile not found."}, status=status.HTTP_404_NOT_FOUND)
 
+    @action(detail=False, methods=['get'], url_path='batch')
+    def batch(self, request):
+        """
+        Resolve many providers at once: ?ids=1,2,3 (provider IDs) or ?user_ids=4,5 (user IDs).
+        Results keep the requested order; unknown IDs are listed under "missing".
+        """
+        key = 'user_ids' if 'user_ids' in request.query_params else 'ids'
+        try:
+            ids = parse_id_list(request.query_params.get(key))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if key == 'user_ids':
+            providers = {p.user_id: p for p in annotated_providers().filter(user_id__in=ids)}
+        else:
+            providers = {p.id: p for p in annotated_providers().filter(id__in=ids)}
+        found = [providers[pk] for pk in ids if pk in providers]
+        return Response({
+            "results": self.get_serializer(found, many=True).data,
+            "missing": [pk for pk in ids if pk not in providers],
+        })
+
     @action(detail=False, methods=['get'], url_path='featured')
     def featured_providers(self, request):
         lat = request.query_params.get('lat')
@@ -255,9 +285,83 @@ class SectorViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(Sector.objects.filter(name__in=sector_names), many=True)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+class CatalogSyncView(APIView):
+    """
+    Delta sync for offline clients.
+    GET /marketplace/sync/?since=<watermark>&limit=<n>
+    Returns sectors, subcategories and providers changed since the watermark plus
+    tombstones for deleted rows. Keep calling with the returned watermark while
+    has_more is true.
+    """
+    permission_classes = [permissions.AllowAny]
+    default_limit = 500
+    max_limit = 2000
+
+    def get(self, request):
+        try:
+            cursors = decode_watermark(request.query_params.get('since'))
+            limit = min(int(request.query_params.get('limit', self.default_limit)), self.max_limit)
+            if limit < 1:
+                raise ValueError
+        except InvalidWatermark as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except ValueError:
+            return Response({"error": "limit must be a positive integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+        upper_bound = sync_upper_bound()
+        streams = {
+            'sectors': (Sector.objects.all(), 'updated_at'),
+            'subcategories': (Subcategory.objects.select_related('sector'), 'updated_at'),
+            'providers': (annotated_providers(), 'updated_at'),
+            'deleted': (CatalogTombstone.objects.all(), 'deleted_at'),
+        }
+        rows, has_more = {}, False
+        try:
+            for stream, (queryset, field) in streams.items():
+                rows[stream], more = changed_since(queryset, cursors.get(stream), upper_bound, limit, field)
+                cursors[stream] = advance_cursor(cursors.get(stream), rows[stream], field)
+                has_more = has_more or more
+        except InvalidWatermark as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        context = {'request': request}
+        return Response({
+            "watermark": encode_watermark(cursors),
+            "has_more": has_more,
+            "sectors": SectorSerializer(rows['sectors'], many=True, context=context).data,
+            "subcategories": SubcategorySerializer(rows['subcategories'], many=True, context=context).data,
+            "providers": ProviderProfileSerializer(rows['providers'], many=True, context=context).data,
+            "deleted": [{"kind": t.kind, "id": t.object_id} for t in rows['deleted']],
+        })
+
+class CatalogSnapshotView(APIView):
+    """
+    Serves the prebuilt msgpack catalog snapshot (see build_catalog_snapshot).
+    The body is zlib-compressed and advertised as Content-Encoding: deflate.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        mapped, etag = open_snapshot()
+        if mapped is None:
+            return Response({"error": "Catalog snapshot has not been generated yet."},
+                            status=status.HTTP_404_NOT_FOUND)
+
+        etag = f'"{etag}"'
+        if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = StreamingHttpResponse(iter_chunks(mapped), content_type='application/x-msgpack')
+            response['Content-Length'] = str(len(mapped))
+            response['Content-Encoding'] = 'deflate'
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+        response['X-Catalog-Snapshot-Version'] = str(SNAPSHOT_FORMAT_VERSION)
+        return response
+
 class SubcategoryViewSet(viewsets.ModelViewSet):
     serializer_class = SubcategorySerializer
-    queryset = Subcategory.objects.all()
+    queryset = Subcategory.objects.select_related('sector')
     
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
@@ -42,6 +42,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.contrib.gis',
+    'django.contrib.postgres',
 
     'rest_framework',
     'rest_framework_simplejwt',
@@ -142,7 +143,7 @@ DATABASES = {
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
@@ -153,15 +154,49 @@ REST_FRAMEWORK = {
 
 ASGI_APPLICATION = "service_platform.asgi.application"
 
+# Groups are spread over the hosts by consistent hashing on the group name, with
+# failover to the next host on the ring; add hosts to scale out. See
+# communications/layers.py.
 CHANNEL_LAYERS = {
     "default": {
-        "BACKEND": "channels_redis.core.RedisChannelLayer",
+        "BACKEND": "communications.layers.ShardedRedisChannelLayer",
         "CONFIG": {
             "hosts": [("127.0.0.1", 6379)],  # Make sure Redis is running
+            "retry_after": 5.0,  # seconds a failed host stays out of the ring
         },
     },
 }
 
+# Write-behind chat persistence: broadcast first, then bulk insert in batches.
+# See communications/writebehind.py for the durability guarantees.
+CHAT_WRITE_BEHIND = False
+CHAT_WRITE_BEHIND_BATCH_SIZE = 200
+CHAT_WRITE_BEHIND_FLUSH_INTERVAL = 0.5  # seconds
+CHAT_WRITE_BEHIND_MAX_RETRIES = 5
+
+# Chat read receipts are coalesced per reader and conversation and written once per interval.
+READ_RECEIPT_FLUSH_INTERVAL = 1.0  # seconds
+READ_RECEIPT_MAX_WAIT = 60.0  # seconds a receipt waits for its message to be stored
+
+# Seconds a chat socket counts as online after its last heartbeat. Presence lives in the
+# channel layer's Redis; set PRESENCE_REGISTRY to override (see communications/presence.py).
+PRESENCE_TTL = 60
+
+# Message partitions moved off the database by `manage.py archive_message_partitions`.
+MESSAGE_ARCHIVE_ROOT = os.path.join(BASE_DIR, 'var', 'message_archive')
+
+# Notification fan-out: events are queued after commit and delivered in batches by
+# worker threads. Use communications.notifications.LocalQueue for synchronous
+# delivery in tests. See communications/notifications.py.
+NOTIFICATION_QUEUE = 'communications.notifications.ThreadedQueue'
+NOTIFICATION_CHANNELS = [
+    'communications.notifications.DatabaseChannel',
+    'communications.notifications.WebSocketChannel',
+]
+NOTIFICATION_WORKERS = 2
+NOTIFICATION_BATCH_SIZE = 500
+NOTIFICATION_MAX_RETRIES = 5  # delivery attempts before a batch whose database write keeps failing is dropped
+
 
 
 # Password validation
@@ -184,6 +219,13 @@ AUTH_PASSWORD_VALIDATORS = [
 
 AUTH_USER_MODEL = 'accounts.User'
 
+# Seconds a token's user stays cached for JWT auth on REST and WebSocket connects, in the
+# AUTH_USER_CACHE_ALIAS cache. Saves invalidate the entry there, which reaches every process
+# only if that cache is shared (e.g. Redis); with the process-local default, entries are kept
+# at most 5 seconds (see accounts/authentication.py).
+AUTH_USER_CACHE_ALIAS = 'default'
+AUTH_USER_CACHE_TIMEOUT = 60
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.1/topics/i18n/
 
@@ -206,6 +248,9 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')  # Folder to store uploaded files
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
+# Prebuilt binary catalog snapshot (see `manage.py build_catalog_snapshot`)
+CATALOG_SNAPSHOT_ROOT = os.path.join(BASE_DIR, 'var', 'snapshots')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Booking, Report, Favorite
+from .models import Booking, Report, Favorite, WorkingHours, BlackoutDate
 
 @admin.register(Booking)
 class BookingAdmin(admin.ModelAdmin):
@@ -7,6 +7,18 @@ class BookingAdmin(admin.ModelAdmin):
     list_filter = ('status', 'service_date')
     search_fields = ('client__username', 'provider__business_name')
 
+@admin.register(WorkingHours)
+class WorkingHoursAdmin(admin.ModelAdmin):
+    list_display = ('id', 'provider', 'weekday', 'start_time', 'end_time', 'slot_minutes')
+    list_filter = ('weekday',)
+    search_fields = ('provider__business_name',)
+
+@admin.register(BlackoutDate)
+class BlackoutDateAdmin(admin.ModelAdmin):
+    list_display = ('id', 'provider', 'date', 'reason')
+    list_filter = ('date',)
+    search_fields = ('provider__business_name',)
+
 @admin.register(Report)
 class ReportAdmin(admin.ModelAdmin):
     list_display = ('id', 'reporter', 'provider', 'is_resolved', 'created_at')
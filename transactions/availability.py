@@ -0,0 +1,95 @@
+"""
+Free booking slots of a provider.
+
+A provider's slots come from their WorkingHours: each stretch of a weekday is
+cut into `slot_minutes` slots from its start, except on BlackoutDates. A slot is
+free if it has not started yet and no active booking overlaps it. Slots are cut
+in UTC from the stretch's local start and end, so a day on which the clocks
+change gets no repeated or nonexistent slots; they are returned in UTC too,
+since Python compares datetimes sharing a tzinfo by wall clock.
+
+free_slots() answers a date range with three queries (working hours, blackout
+dates, overlapping bookings) and one sweep: slots are generated in time order
+and compared against the bookings, also in time order, advancing a single
+pointer. That works because the booking_no_overlap constraint keeps a
+provider's active bookings disjoint, so ordering them by start also orders them
+by end.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.utils import timezone
+from .models import BlackoutDate, Booking, WorkingHours
+
+MAX_AVAILABILITY_DAYS = 31
+
+
+def _localize(day, wall_time, tz):
+    """`wall_time` on `day` in `tz`, in UTC. A time skipped by a clock change moves past the gap."""
+    return datetime.combine(day, wall_time, tzinfo=tz).astimezone(dt_timezone.utc)
+
+
+def _day_slots(day, hours, tz):
+    slots = []
+    for stretch in hours:
+        step = timedelta(minutes=stretch.slot_minutes)
+        start = _localize(day, stretch.start_time, tz)
+        close = _localize(day, stretch.end_time, tz)
+        while start + step <= close:
+            slots.append((start, start + step))
+            start += step
+    # Stretches are ordered by start, but may overlap if misconfigured.
+    slots.sort()
+    return slots
+
+
+def free_slots(provider, start_date, end_date):
+    """Return [(start, end)] in UTC of the provider's free slots from `start_date` through `end_date`, in order."""
+    tz = timezone.get_current_timezone()
+    hours_by_weekday = {}
+    for stretch in WorkingHours.objects.filter(provider=provider).order_by('start_time'):
+        hours_by_weekday.setdefault(stretch.weekday, []).append(stretch)
+    blackout = set(
+        BlackoutDate.objects.filter(provider=provider, date__range=(start_date, end_date))
+        .values_list('date', flat=True)
+    )
+    window = (
+        datetime.combine(start_date, datetime.min.time(), tzinfo=tz),
+        datetime.combine(end_date + timedelta(days=1), datetime.min.time(), tzinfo=tz),
+    )
+    booked = list(
+        Booking.objects.filter(provider=provider, time_range__overlap=window)
+        .exclude(status='cancelled').order_by('time_range').values_list('time_range', flat=True)
+    )
+
+    now = timezone.now()
+    free = []
+    position = 0
+    day = start_date
+    while day <= end_date:
+        if day not in blackout:
+            for start, end in _day_slots(day, hours_by_weekday.get(day.weekday(), ()), tz):
+                while position < len(booked) and booked[position].upper <= start:
+                    position += 1
+                if start < now:
+                    continue
+                if position < len(booked) and booked[position].lower < end:
+                    continue
+                free.append((start, end))
+        day += timedelta(days=1)
+    return free
+
+
+def slot_at(provider, start):
+    """
+    Return (start, end) in UTC of the provider's slot beginning exactly at `start`, or
+    None if no working-hours stretch has a slot starting then or the day is
+    blacked out. Does not check bookings.
+    """
+    tz = timezone.get_current_timezone()
+    local = timezone.localtime(start, tz)
+    if BlackoutDate.objects.filter(provider=provider, date=local.date()).exists():
+        return None
+    stretches = WorkingHours.objects.filter(provider=provider, weekday=local.weekday())
+    for slot_start, slot_end in _day_slots(local.date(), stretches, tz):
+        if slot_start == local:
+            return slot_start, slot_end
+    return None
@@ -0,0 +1,115 @@
+# Generated by Django 5.1.7 on 2026-10-19 16:53
+
+import django.contrib.postgres.constraints
+import django.contrib.postgres.fields.ranges
+import django.contrib.postgres.operations
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def cancel_overlapping_bookings(apps, schema_editor):
+    """
+    Cancel each active booking that overlaps an earlier-created active booking of
+    the same provider, so the booking_no_overlap constraint can be added. The
+    first booking made for a slot keeps it.
+    """
+    Booking = apps.get_model('transactions', 'Booking')
+    bookings = (
+        Booking.objects.exclude(status='cancelled')
+        .order_by('provider_id', 'created_at', 'id')
+        .values_list('id', 'provider_id', 'time_range')
+    )
+    conflicting = []
+    kept = []
+    provider_id = None
+    for booking_id, booking_provider_id, time_range in bookings.iterator():
+        if booking_provider_id != provider_id:
+            provider_id, kept = booking_provider_id, []
+        if any(time_range.lower < other.upper and other.lower < time_range.upper for other in kept):
+            conflicting.append(booking_id)
+        else:
+            kept.append(time_range)
+    for start in range(0, len(conflicting), 1000):
+        Booking.objects.filter(id__in=conflicting[start:start + 1000]).update(status='cancelled')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0004_sector_provider_count_sector_verified_provider_count_and_more'),
+        ('transactions', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BlackoutDate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('reason', models.CharField(blank=True, default='', max_length=255)),
+            ],
+            options={
+                'ordering': ['date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='WorkingHours',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekday', models.PositiveSmallIntegerField(choices=[(0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'), (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday')])),
+                ('start_time', models.TimeField()),
+                ('end_time', models.TimeField()),
+                ('slot_minutes', models.PositiveSmallIntegerField(default=60)),
+            ],
+            options={
+                'ordering': ['weekday', 'start_time'],
+            },
+        ),
+        # The exclusion constraint compares provider_id with = inside a GiST index.
+        django.contrib.postgres.operations.BtreeGistExtension(),
+        migrations.AddField(
+            model_name='booking',
+            name='time_range',
+            field=django.contrib.postgres.fields.ranges.DateTimeRangeField(null=True),
+        ),
+        # Existing bookings had no length; give them an hour from service_date.
+        migrations.RunSQL(
+            "UPDATE transactions_booking SET time_range = tstzrange(service_date, service_date + interval '1 hour')",
+            migrations.RunSQL.noop,
+        ),
+        # Double bookings made before the constraint below would stop it being created.
+        migrations.RunPython(cancel_overlapping_bookings, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='booking',
+            name='time_range',
+            field=django.contrib.postgres.fields.ranges.DateTimeRangeField(),
+        ),
+        migrations.AddConstraint(
+            model_name='booking',
+            constraint=django.contrib.postgres.constraints.ExclusionConstraint(condition=models.Q(('status', 'cancelled'), _negated=True), expressions=[('provider', '='), ('time_range', '&&')], name='booking_no_overlap'),
+        ),
+        migrations.AddField(
+            model_name='blackoutdate',
+            name='provider',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='blackout_dates', to='marketplace.providerprofile'),
+        ),
+        migrations.AddField(
+            model_name='workinghours',
+            name='provider',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='working_hours', to='marketplace.providerprofile'),
+        ),
+        migrations.AddConstraint(
+            model_name='blackoutdate',
+            constraint=models.UniqueConstraint(fields=('provider', 'date'), name='unique_provider_blackout_date'),
+        ),
+        migrations.AddConstraint(
+            model_name='workinghours',
+            constraint=models.CheckConstraint(condition=models.Q(('start_time__lt', models.F('end_time'))), name='working_hours_start_before_end'),
+        ),
+        migrations.AddConstraint(
+            model_name='workinghours',
+            constraint=models.CheckConstraint(condition=models.Q(('slot_minutes__gt', 0)), name='working_hours_slot_positive'),
+        ),
+    ]
@@ -1,11 +1,64 @@
+from django.contrib.postgres.constraints import ExclusionConstraint
+from django.contrib.postgres.fields import DateTimeRangeField, RangeOperators
 from django.db import models
+from django.db.models import F, Q
 from accounts.models import User
 from marketplace.models import ProviderProfile
 
+class WorkingHours(models.Model):
+    """
+    A stretch of a weekday in which the provider takes bookings, cut into slots
+    of `slot_minutes` from `start_time`. Times are in the site's time zone; a day
+    may have several stretches, e.g. around a lunch break.
+    """
+    class Weekday(models.IntegerChoices):
+        MONDAY = 0, 'Monday'
+        TUESDAY = 1, 'Tuesday'
+        WEDNESDAY = 2, 'Wednesday'
+        THURSDAY = 3, 'Thursday'
+        FRIDAY = 4, 'Friday'
+        SATURDAY = 5, 'Saturday'
+        SUNDAY = 6, 'Sunday'
+
+    provider = models.ForeignKey(ProviderProfile, on_delete=models.CASCADE, related_name='working_hours')
+    weekday = models.PositiveSmallIntegerField(choices=Weekday.choices)
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    slot_minutes = models.PositiveSmallIntegerField(default=60)
+
+    class Meta:
+        ordering = ['weekday', 'start_time']
+        constraints = [
+            models.CheckConstraint(condition=Q(start_time__lt=F('end_time')), name='working_hours_start_before_end'),
+            models.CheckConstraint(condition=Q(slot_minutes__gt=0), name='working_hours_slot_positive'),
+        ]
+
+    def __str__(self):
+        return f"{self.provider} {self.get_weekday_display()} {self.start_time:%H:%M}-{self.end_time:%H:%M}"
+
+class BlackoutDate(models.Model):
+    """A day on which the provider takes no bookings, whatever their working hours."""
+    provider = models.ForeignKey(ProviderProfile, on_delete=models.CASCADE, related_name='blackout_dates')
+    date = models.DateField()
+    reason = models.CharField(max_length=255, blank=True, default='')
+
+    class Meta:
+        ordering = ['date']
+        constraints = [
+            models.UniqueConstraint(fields=['provider', 'date'], name='unique_provider_blackout_date'),
+        ]
+
+    def __str__(self):
+        return f"{self.provider} unavailable on {self.date}"
+
 class Booking(models.Model):
     client = models.ForeignKey(User, on_delete=models.CASCADE, limit_choices_to={'role': User.Role.CLIENT})
     provider = models.ForeignKey(ProviderProfile, on_delete=models.CASCADE)
+    # Start of the booked slot; kept equal to the lower bound of time_range.
     service_date = models.DateTimeField()
+    # [start, end) of the booked slot. Active bookings of a provider never
+    # overlap: see the booking_no_overlap constraint.
+    time_range = DateTimeRangeField()
     status = models.CharField(
         max_length=20,
         choices=[('pending', 'Pending'), ('confirmed', 'Confirmed'), ('cancelled', 'Cancelled')],
@@ -13,6 +66,23 @@ class Booking(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            # Enforced by Postgres, so two concurrent requests for the same slot
+            # cannot both succeed. The GiST index behind it also serves the
+            # availability query's overlap lookup.
+            ExclusionConstraint(
+                name='booking_no_overlap',
+                expressions=[('provider', RangeOperators.EQUAL), ('time_range', RangeOperators.OVERLAPS)],
+                condition=~Q(status='cancelled'),
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.time_range is not None:
+            self.service_date = self.time_range.lower
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"Booking by {self.client.username} with {self.provider}"
 
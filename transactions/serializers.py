@@ -1,5 +1,8 @@
+from django.db.backends.postgresql.psycopg_any import DateTimeTZRange
+from django.utils import timezone
 from rest_framework import serializers
-from .models import Booking, Report, Favorite
+from .availability import slot_at
+from .models import Booking, Report, Favorite, WorkingHours, BlackoutDate
 from marketplace.models import ProviderProfile  # Added import
 
 class ProviderProfileSerializer(serializers.ModelSerializer):  # New serializer
@@ -15,11 +18,50 @@ class BookingSerializer(serializers.ModelSerializer):
         write_only=True
     )
     provider = ProviderProfileSerializer(read_only=True)  # For responses
+    service_end = serializers.SerializerMethodField()
 
     class Meta:
         model = Booking
-        fields = ['id', 'client', 'provider', 'provider_id', 'service_date', 'status', 'created_at']
-        read_only_fields = ['status', 'client', 'created_at', 'provider']       
+        fields = ['id', 'client', 'provider', 'provider_id', 'service_date', 'service_end', 'status', 'created_at']
+        read_only_fields = ['status', 'client', 'created_at', 'provider']
+
+    def get_service_end(self, obj):
+        return obj.time_range.upper if obj.time_range else None
+
+    def validate(self, attrs):
+        # service_date must start one of the provider's slots; the booking takes the
+        # whole slot. Overlap with other bookings is left to the database constraint.
+        provider = attrs.get('provider', self.instance.provider if self.instance else None)
+        start = attrs.get('service_date', self.instance.service_date if self.instance else None)
+        if 'provider' in attrs or 'service_date' in attrs:
+            if start <= timezone.now():
+                raise serializers.ValidationError({'service_date': 'Bookings must start in the future.'})
+            slot = slot_at(provider, start)
+            if slot is None:
+                raise serializers.ValidationError(
+                    {'service_date': "This time is not one of the provider's available slots."}
+                )
+            attrs['time_range'] = DateTimeTZRange(*slot)
+        return attrs
+
+class WorkingHoursSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = WorkingHours
+        fields = ['id', 'weekday', 'start_time', 'end_time', 'slot_minutes']
+        extra_kwargs = {'slot_minutes': {'min_value': 1}}
+
+    def validate(self, attrs):
+        start = attrs.get('start_time', self.instance.start_time if self.instance else None)
+        end = attrs.get('end_time', self.instance.end_time if self.instance else None)
+        if start >= end:
+            raise serializers.ValidationError({'end_time': 'Must be after start_time.'})
+        return attrs
+
+class BlackoutDateSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = BlackoutDate
+        fields = ['id', 'date', 'reason']
+
 class ReportSerializer(serializers.ModelSerializer):
     reporter = serializers.HiddenField(default=serializers.CurrentUserDefault())
     
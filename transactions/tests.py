@@ -1,3 +1,78 @@
-from django.test import TestCase
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo
+from django.db.backends.postgresql.psycopg_any import DateTimeTZRange
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+from accounts.models import User
+from .availability import _day_slots, free_slots
+from .models import Booking, WorkingHours
 
-# Create your tests here.
+NEW_YORK = ZoneInfo('America/New_York')
+
+
+class DaySlotsTests(SimpleTestCase):
+    def stretch(self, start, end, minutes=60):
+        return WorkingHours(weekday=6, start_time=start, end_time=end, slot_minutes=minutes)
+
+    def assert_real_slots(self, slots, step):
+        for start, end in slots:
+            self.assertEqual(end - start, step)
+        starts = [start.timestamp() for start, _ in slots]
+        self.assertEqual(starts, sorted(set(starts)))
+
+    def test_spring_forward_day_has_no_slots_in_the_gap(self):
+        # 2026-03-08: New York clocks jump from 02:00 to 03:00.
+        slots = _day_slots(date(2026, 3, 8), [self.stretch(time(1), time(4))], NEW_YORK)
+        self.assertEqual(len(slots), 2)
+        self.assert_real_slots(slots, timedelta(hours=1))
+        self.assertEqual(slots[-1][0], datetime(2026, 3, 8, 3, tzinfo=NEW_YORK))
+
+    def test_fall_back_day_counts_the_repeated_hour_once_per_occurrence(self):
+        # 2026-11-01: New York clocks go back from 02:00 to 01:00.
+        slots = _day_slots(date(2026, 11, 1), [self.stretch(time(0), time(3))], NEW_YORK)
+        self.assertEqual(len(slots), 4)
+        self.assert_real_slots(slots, timedelta(hours=1))
+
+
+class BookingSlotTests(TestCase):
+    def setUp(self):
+        provider_user = User.objects.create_user(
+            'provider', 'provider@example.com', 'pass', role=User.Role.SERVICE_PROVIDER
+        )
+        self.provider = provider_user.providerprofile
+        self.client_user = User.objects.create_user('client', 'client@example.com', 'pass')
+        self.other_client = User.objects.create_user('other', 'other@example.com', 'pass')
+        self.day = timezone.localdate() + timedelta(days=7)
+        WorkingHours.objects.create(
+            provider=self.provider, weekday=self.day.weekday(), start_time=time(9), end_time=time(12)
+        )
+
+    def at(self, hour):
+        return datetime.combine(self.day, time(hour), tzinfo=timezone.get_current_timezone())
+
+    def test_free_slots_skip_booked_and_cancelled_bookings_free_theirs(self):
+        Booking.objects.create(
+            client=self.client_user, provider=self.provider, time_range=DateTimeTZRange(self.at(10), self.at(11))
+        )
+        Booking.objects.create(
+            client=self.other_client, provider=self.provider, status='cancelled',
+            time_range=DateTimeTZRange(self.at(11), self.at(12)),
+        )
+        self.assertEqual(
+            free_slots(self.provider, self.day, self.day),
+            [(self.at(9), self.at(10)), (self.at(11), self.at(12))],
+        )
+
+    def test_booking_a_taken_slot_is_a_conflict(self):
+        api = APIClient()
+        payload = {'provider_id': self.provider.id, 'service_date': self.at(10).isoformat()}
+
+        api.force_authenticate(self.client_user)
+        self.assertEqual(api.post('/transactions/bookings/', payload).status_code, status.HTTP_201_CREATED)
+
+        api.force_authenticate(self.other_client)
+        response = api.post('/transactions/bookings/', payload)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Booking.objects.filter(provider=self.provider).count(), 1)
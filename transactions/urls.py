@@ -1,11 +1,13 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import BookingViewSet, ReportViewSet, FavoriteViewSet
+from .views import BookingViewSet, ReportViewSet, FavoriteViewSet, WorkingHoursViewSet, BlackoutDateViewSet
 
 router = DefaultRouter()
 router.register(r'bookings', BookingViewSet, basename='booking')
 router.register(r'reports', ReportViewSet, basename='report')
 router.register(r'favorites', FavoriteViewSet, basename='favorite')
+router.register(r'working-hours', WorkingHoursViewSet, basename='working-hours')
+router.register(r'blackout-dates', BlackoutDateViewSet, basename='blackout-date')
 
 urlpatterns = [
     path('', include(router.urls)),
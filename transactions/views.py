@@ -1,9 +1,25 @@
+from datetime import date, timedelta
+from django.db import IntegrityError, transaction
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from rest_framework import viewsets, permissions, status
+from rest_framework.exceptions import PermissionDenied
 from rest_framework.response import Response
 from rest_framework.decorators import action  # Add this import
-from .models import Booking, Report, Favorite
-from .serializers import BookingSerializer, ReportSerializer, FavoriteSerializer
+from .availability import MAX_AVAILABILITY_DAYS, free_slots
+from .models import Booking, Report, Favorite, WorkingHours, BlackoutDate
+from .serializers import (
+    BookingSerializer, ReportSerializer, FavoriteSerializer, WorkingHoursSerializer, BlackoutDateSerializer
+)
 from accounts.models import User  # Added import
+from marketplace.models import ProviderProfile
+
+SLOT_TAKEN_ERROR = 'This slot is already booked'
+
+def is_slot_taken(error):
+    """True if the IntegrityError `error` is booking_no_overlap rejecting an overlapping booking."""
+    diag = getattr(error.__cause__, 'diag', None)
+    return getattr(diag, 'constraint_name', None) == 'booking_no_overlap'
 
 class BookingViewSet(viewsets.ModelViewSet):
     serializer_class = BookingSerializer
@@ -28,6 +44,52 @@ class BookingViewSet(viewsets.ModelViewSet):
         
         return queryset.order_by('-created_at')
 
+    # The booking_no_overlap constraint rejects a slot that is already taken, also
+    # when two requests race for it.
+    def create(self, request, *args, **kwargs):
+        try:
+            with transaction.atomic():
+                return super().create(request, *args, **kwargs)
+        except IntegrityError as e:
+            if not is_slot_taken(e):
+                raise
+            return Response({'error': SLOT_TAKEN_ERROR}, status=status.HTTP_409_CONFLICT)
+
+    def update(self, request, *args, **kwargs):
+        try:
+            with transaction.atomic():
+                return super().update(request, *args, **kwargs)
+        except IntegrityError as e:
+            if not is_slot_taken(e):
+                raise
+            return Response({'error': SLOT_TAKEN_ERROR}, status=status.HTTP_409_CONFLICT)
+
+    @action(detail=False, methods=['get'])
+    def availability(self, request):
+        """Free slots of ?provider= from ?start= through ?end= (YYYY-MM-DD; end defaults to start + 6 days)."""
+        try:
+            provider_id = int(request.query_params.get('provider', ''))
+        except ValueError:
+            return Response({'error': 'provider must be a provider id'}, status=status.HTTP_400_BAD_REQUEST)
+        provider = get_object_or_404(ProviderProfile, pk=provider_id)
+        try:
+            start = date.fromisoformat(request.query_params.get('start', ''))
+            end = date.fromisoformat(request.query_params['end']) if 'end' in request.query_params \
+                else start + timedelta(days=6)
+        except ValueError:
+            return Response({'error': 'start and end must be dates (YYYY-MM-DD)'}, status=status.HTTP_400_BAD_REQUEST)
+        if end < start or (end - start).days >= MAX_AVAILABILITY_DAYS:
+            return Response(
+                {'error': f'end must be on or after start, at most {MAX_AVAILABILITY_DAYS} days span allowed'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        start = max(start, timezone.localdate())
+        slots = free_slots(provider, start, end) if start <= end else []
+        return Response({
+            'provider': provider.id,
+            'slots': [{'start': slot_start, 'end': slot_end} for slot_start, slot_end in slots],
+        })
+
     # New actions for confirm/cancel
     @action(detail=True, methods=['post'])
     def confirm(self, request, pk=None):
@@ -62,6 +124,37 @@ class BookingViewSet(viewsets.ModelViewSet):
         booking.save()
         return Response(self.get_serializer(booking).data)
 
+class ProviderScheduleViewSet(viewsets.ModelViewSet):
+    """Base for the signed-in provider's own schedule entries."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_provider(self):
+        user = self.request.user
+        if user.role != User.Role.SERVICE_PROVIDER or not hasattr(user, 'providerprofile'):
+            raise PermissionDenied('Only service providers have a schedule')
+        return user.providerprofile
+
+    def get_queryset(self):
+        return self.queryset.filter(provider=self.get_provider())
+
+    def perform_create(self, serializer):
+        serializer.save(provider=self.get_provider())
+
+class WorkingHoursViewSet(ProviderScheduleViewSet):
+    queryset = WorkingHours.objects.all()
+    serializer_class = WorkingHoursSerializer
+
+class BlackoutDateViewSet(ProviderScheduleViewSet):
+    queryset = BlackoutDate.objects.all()
+    serializer_class = BlackoutDateSerializer
+
+    def create(self, request, *args, **kwargs):
+        try:
+            with transaction.atomic():
+                return super().create(request, *args, **kwargs)
+        except IntegrityError:
+            return Response({'error': 'This date is already blacked out'}, status=status.HTTP_400_BAD_REQUEST)
+
 class ReportViewSet(viewsets.ModelViewSet):
     serializer_class = ReportSerializer
     permission_classes = [permissions.IsAuthenticated]